@@ -1,16 +1,11 @@
+from typing import AsyncIterator, Optional, Sequence
+
 from pydantic_ai import Agent
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-import chromadb
-import numpy as np
-import torch
-
-# ---------- CONFIG ----------
-MODEL_NAME = "intfloat/multilingual-e5-large"
-CHROMA_PATH = "chroma_db"
-COLLECTION_NAME = "psybot_multilingual"
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
+from metrics import record_llm_usage, span
+from retrieval import get_runtime
+from sessions import Turn
 
 # ---------- SYSTEM PROMPT ----------
 SYSTEM_PROMPT = """
@@ -39,14 +34,6 @@ a qualified professional immediately, without continuing analysis.
 """
 
 
-# ---------- LOAD MODELS ----------
-print(f"Loading retriever model ({MODEL_NAME}) on {device} ...")
-embedder = SentenceTransformer(MODEL_NAME, device=device)
-
-print("Connecting to Chroma...")
-client = chromadb.PersistentClient(path=CHROMA_PATH)
-collection = client.get_collection(name=COLLECTION_NAME)
-
 # ---------- DEFINE AGENT ----------
 agent = Agent(
     "google-gla:gemini-2.5-pro",
@@ -56,44 +43,65 @@ agent = Agent(
 # ---------- INPUT / OUTPUT MODELS ----------
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
 
 
 # ---------- RETRIEVER ----------
-def retrieve_context(query: str, k: int = 5) -> str:
+async def retrieve_context(query: str, k: int = 5) -> str:
     """Get top-k relevant chunks from Chroma."""
-    qvec = embedder.encode(
-        [f"query: {query}"],
-        normalize_embeddings=True,
-        convert_to_numpy=True
-    ).astype(np.float32)
-
-    results = collection.query(
-        query_embeddings=qvec,
-        n_results=k,
-        include=["documents", "metadatas"]
-    )
-    docs = results["documents"][0]
-    context = "\n\n".join(docs)
+    with span("retrieve", k=k) as s:
+        hits = await get_runtime().aretrieve(query, k)
+        s["hits"] = len(hits)
+    context = "\n\n".join(h["document"] for h in hits)
     return context
 
 
 # ---------- CHAT FUNCTION ----------
-async def chat_with_context(user_message: str) -> ChatResponse:
-    """Retrieve context → feed into Gemini."""
-    context = retrieve_context(user_message)
+def format_history(history: Sequence[Turn]) -> str:
+    """Render earlier turns as a plain transcript for the prompt."""
+    speaker = {"user": "User", "assistant": "Analyst"}
+    return "\n".join(f"{speaker.get(t.role, t.role)}: {t.text}" for t in history)
+
 
-    augmented_prompt = f"""
+async def build_prompt(user_message: str, history: Sequence[Turn] = ()) -> str:
+    """Retrieve context and assemble the prompt sent to Gemini."""
+    context = await retrieve_context(user_message)
+
+    transcript = ""
+    if history:
+        transcript = f"""
+Conversation so far:
+{format_history(history)}
+"""
+
+    return f"""
 Context from psychoanalytic corpus:
 {context}
-
+{transcript}
 User message:
 {user_message}
 
 Respond reflectively and empathetically.
     """
 
-    reply = await agent.run(augmented_prompt)
-    return ChatResponse(response=reply.output_text)
+
+async def chat_with_context(user_message: str, history: Sequence[Turn] = ()) -> ChatResponse:
+    """Retrieve context → feed into Gemini."""
+    augmented_prompt = await build_prompt(user_message, history)
+    with span("llm", prompt_chars=len(augmented_prompt)) as s:
+        reply = await agent.run(augmented_prompt)
+        s.update(record_llm_usage(reply))
+    return ChatResponse(response=reply.output)
+
+
+async def stream_chat_with_context(user_message: str, history: Sequence[Turn] = ()) -> AsyncIterator[str]:
+    """Same as chat_with_context, but yields the reply as text deltas."""
+    augmented_prompt = await build_prompt(user_message, history)
+    with span("llm_stream", prompt_chars=len(augmented_prompt)) as s:
+        async with agent.run_stream(augmented_prompt) as result:
+            async for delta in result.stream_text(delta=True):
+                yield delta
+            s.update(record_llm_usage(result))
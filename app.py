@@ -1,10 +1,105 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
-from agent import agent, ChatRequest, ChatResponse  # Import agent and models
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import metrics
+from agent import chat_with_context, stream_chat_with_context, ChatRequest, ChatResponse  # Chat entry points and models
+from metrics import log_event, mask_sender, span
+from replies import ASYNC_REPLIES, InboundMessage, ReplyWorkerPool, make_sender
+from retrieval import get_runtime
+from sessions import make_session_store
 from twilio.twiml.messaging_response import MessagingResponse
 
-app = FastAPI()
+# Load + warm the retriever in the background as soon as the server starts,
+# so uvicorn binds immediately and /ready flips once the model is hot.
+WARMUP_ON_STARTUP = os.getenv("PSYBOT_WARMUP_ON_STARTUP", "1") != "0"
+WARMUP_RETRY_SECONDS = 30.0   # a failed warmup (e.g. index not built yet) is retried
+
+# One JSON log line per request and per chat-path stage (PSYBOT_LOG_FORMAT=text for humans)
+metrics.configure_logging()
+
+
+async def _warmup():
+    while True:
+        try:
+            await asyncio.to_thread(get_runtime().warmup)
+            return
+        except Exception as e:
+            log_event("warmup_failed", level=logging.ERROR, error=f"{type(e).__name__}: {e}",
+                      retry_in=WARMUP_RETRY_SECONDS)
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+
+# Conversation history per WhatsApp sender (memory or sqlite backend).
+# Store calls run in a thread: SQLite may wait on another worker's write lock.
+sessions = make_session_store()
+
+
+def _save_exchange(sender: str, message: str, reply: str):
+    sessions.append(sender, "user", message)
+    sessions.append(sender, "assistant", reply)
+
+
+async def generate_reply(sender: str, message: str) -> str:
+    """Run the agent on one message with this sender's history."""
+    with span("history") as s:
+        history = await asyncio.to_thread(sessions.history, sender)
+        s["turns"] = len(history)
+    reply = await chat_with_context(message, history)
+
+    with span("session_write"):
+        await asyncio.to_thread(_save_exchange, sender, message, reply.response)
+    return reply.response
+
+
+async def _handle_inbound(msg: InboundMessage) -> str:
+    return await generate_reply(msg.sender, msg.body)
+
+
+# Opt-in (PSYBOT_ASYNC_REPLIES=1): ack the webhook at once and deliver the
+# reply from a background worker through the outbound sender.
+reply_pool = ReplyWorkerPool(_handle_inbound, make_sender()) if ASYNC_REPLIES else None
+
+
+# State other objects already count is read when /metrics is scraped
+def _cache_lookups():
+    stats = get_runtime().cache.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+def _encoder_stat(name):
+    encoder = get_runtime().encoder
+    return getattr(encoder, name) if encoder is not None else 0
+
+metrics.CACHE_LOOKUPS.set_function(_cache_lookups)
+metrics.ENCODER_BATCHES.set_function(lambda: _encoder_stat("batches"))
+metrics.ENCODER_QUERIES.set_function(lambda: _encoder_stat("queries"))
+if reply_pool is not None:
+    metrics.QUEUE_DEPTH.set_function(lambda: reply_pool.queue.qsize())
+    metrics.REPLY_MESSAGES.set_function(lambda: {
+        (k,): v for k, v in reply_pool.stats().items() if k not in ("workers", "queue_depth")
+    })
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(_warmup()) if WARMUP_ON_STARTUP else None
+    if reply_pool is not None:
+        reply_pool.start()
+    yield
+    if reply_pool is not None:
+        await reply_pool.stop()
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for frontend communication
 app.add_middleware(
@@ -15,38 +110,128 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Request id, count, latency and error metrics + one log line per request."""
+    rid = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    with metrics.bind_request_id(rid):
+        t0 = time.perf_counter()
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        except Exception as e:
+            status, error = 500, type(e).__name__
+            raise
+        else:
+            error = f"http_{status}" if status >= 500 else None
+        finally:
+            seconds = time.perf_counter() - t0
+            # Route template, not the raw path, so label values stay bounded
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            metrics.REQUESTS.inc(route=route, status=status)
+            metrics.REQUEST_SECONDS.observe(seconds, route=route)
+            if error:
+                metrics.REQUEST_ERRORS.inc(route=route, error=error)
+            log_event("request", level=logging.DEBUG if route == "/metrics" else logging.INFO,
+                      method=request.method, route=route, status=status, ms=round(seconds * 1000, 2))
+    response.headers["X-Request-ID"] = rid
+    return response
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: Request):
     try:
-        form = await request.form()
-        print("Received Twilio Data:", form)  # Debugging line
-        
+        with span("form"):
+            form = await request.form()
+
         sender = form.get("From")
         message = form.get("Body")
+        log_event("twilio_inbound", sender=mask_sender(sender), sid=form.get("MessageSid"),
+                  chars=len(message or ""), fields=sorted(form.keys()))
 
         if not sender or not message:
             raise HTTPException(status_code=400, detail="Invalid request: Missing sender or message")
         
-        # Generate AI response using the agent
-        run_result = await agent.run(message)
-        if hasattr(run_result, "data"):
-            ai_response = run_result.data  # Extract response
-        else:
-            raise ValueError("AI response does not contain 'data' field")
+        if reply_pool is not None:
+            msg = InboundMessage(sender=sender, body=message,
+                                 to=form.get("To"), sid=form.get("MessageSid"))
+            if not reply_pool.submit(msg):
+                raise HTTPException(status_code=503, detail="Reply queue is full, retry later")
+            # Empty TwiML: Twilio gets its 200 now, the reply follows via REST
+            return PlainTextResponse(str(MessagingResponse()), media_type="application/xml")
+
+        # Generate AI response using the agent, with this sender's history
+        ai_response = await generate_reply(sender, message)
         
         # Generate Twilio TwiML Response
-        twiml_response = MessagingResponse()
-        twiml_response.message(ai_response)
-        
-        return PlainTextResponse(str(twiml_response), media_type="application/xml")
+        with span("twiml"):
+            twiml_response = MessagingResponse()
+            twiml_response.message(ai_response)
+            body = str(twiml_response)
+
+        return PlainTextResponse(body, media_type="application/xml")
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print("Error Processing Request:", str(e))  # Debugging line
+        log_event("chat_failed", level=logging.ERROR, exc_info=True, error=f"{type(e).__name__}: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+def _sse(data: dict, event: str = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """JSON in, Server-Sent Events out: one `data:` frame per text delta."""
+    message = req.message.strip()
+    if not message:
+        raise HTTPException(status_code=400, detail="Invalid request: Missing message")
+
+    session_key = f"web:{req.session_id}" if req.session_id else None
+    history = await asyncio.to_thread(sessions.history, session_key) if session_key else []
+
+    async def events():
+        parts = []
+        try:
+            async for delta in stream_chat_with_context(message, history):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except Exception as e:
+            log_event("stream_failed", level=logging.ERROR, exc_info=True, error=f"{type(e).__name__}: {e}")
+            yield _sse({"detail": str(e)}, event="error")
+            return
+
+        reply = "".join(parts)
+        if session_key:
+            await asyncio.to_thread(_save_exchange, session_key, message, reply)
+        yield _sse({"response": reply}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/")
 def home():
     return {"message": "WhatsApp Bot is Running!"}
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 200 once the retriever is warmed up, or loaded by the
+    first request when PSYBOT_WARMUP_ON_STARTUP=0.
+    """
+    status = get_runtime().status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape target: request/stage latency, errors, queue depth, cache, tokens."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 # Run locally with:
 # uvicorn whatsapp_bot:app --host 0.0.0.0 --port 8000 --reload
@@ -0,0 +1,130 @@
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+import vector_store
+from vector_store import ChromaBackend, NumpyBackend, export_numpy
+
+# Compares the Chroma (HNSW) and NumPy (exact, memory-mapped) backends on
+# the real index or on a synthetic one. Queries are perturbed corpus
+# vectors, so no embedding model is needed.
+
+PERSIST_DIR = "chroma_db"
+COLLECTION = "psybot_multilingual"
+
+
+# -------------------- HELPERS --------------------
+
+def percentiles(ms: List[float]) -> Dict[str, float]:
+    a = np.asarray(ms, dtype=np.float64)
+    return {
+        "p50_ms": float(np.percentile(a, 50)),
+        "p95_ms": float(np.percentile(a, 95)),
+        "p99_ms": float(np.percentile(a, 99)),
+        "mean_ms": float(a.mean()),
+    }
+
+def random_unit_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    v = rng.standard_normal((n, dim), dtype=np.float32)
+    v /= np.linalg.norm(v, axis=1, keepdims=True)
+    return v
+
+def make_queries(emb: np.ndarray, n: int, noise: float = 0.3, seed: int = 1) -> np.ndarray:
+    """Corpus rows plus Gaussian noise, re-normalised: 'near' but not identical queries."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(emb), size=n, replace=len(emb) < n)
+    q = np.asarray(emb[np.sort(rows)], dtype=np.float32)
+    q = q + noise * rng.standard_normal(q.shape, dtype=np.float32) / np.sqrt(q.shape[1])
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return q
+
+def build_synthetic_store(root: Path, n: int, dim: int, seed: int = 0, batch: int = 5000):
+    """Random unit vectors in a throwaway Chroma collection + its NumPy export."""
+    import chromadb
+    client = chromadb.PersistentClient(path=str(root / "chroma_db"))
+    coll = client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+    emb = random_unit_vectors(n, dim, seed)
+    for i in range(0, n, batch):
+        j = min(n, i + batch)
+        coll.add(
+            ids=[f"syn:{r}" for r in range(i, j)],
+            embeddings=emb[i:j],
+            documents=[f"synthetic passage {r}" for r in range(i, j)],
+            metadatas=[{"book_id": "syn", "lang": "en"} for _ in range(i, j)],
+        )
+    export_numpy(coll, root / "vector_index")
+    return coll, root / "vector_index"
+
+def time_backend(backend, queries: np.ndarray, k: int) -> Dict:
+    ms, results = [], []
+    backend.query(queries[:1], k)   # warm caches / page in
+    t0 = time.perf_counter()
+    for q in queries:
+        t = time.perf_counter()
+        hits = backend.query(q[None, :], k)
+        ms.append((time.perf_counter() - t) * 1000)
+        results.append([h["id"] for h in hits])
+    wall = time.perf_counter() - t0
+    return {"latency": percentiles(ms), "qps": len(queries) / wall, "ids": results}
+
+def recall_at_k(results: List[List[str]], truth: List[List[str]], k: int) -> float:
+    return float(np.mean([len(set(r[:k]) & set(t[:k])) / k for r, t in zip(results, truth)]))
+
+
+# -------------------- MAIN --------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Chroma HNSW vs NumPy exact search.")
+    ap.add_argument("--synthetic", type=int, default=0,
+                    help="benchmark N random vectors in a temp store instead of chroma_db/")
+    ap.add_argument("--dim", type=int, default=1024)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--json", type=Path, help="write results here")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            print(f"Building synthetic store: {args.synthetic:,} × {args.dim} ...")
+            coll, vec_dir = build_synthetic_store(Path(tmp), args.synthetic, args.dim)
+        else:
+            import chromadb
+            coll = chromadb.PersistentClient(path=PERSIST_DIR).get_collection(name=COLLECTION)
+            vec_dir = vector_store.VECTOR_DIR
+
+        exact = NumpyBackend.open(vec_dir)
+        if exact is None:
+            raise SystemExit(f"No NumPy export in {vec_dir}; run embed.py first")
+        queries = make_queries(exact.emb, args.queries)
+
+        report = {"n": exact.count(), "dim": int(exact.emb.shape[1]), "k": args.k,
+                  "queries": len(queries), "backends": {}}
+        truth = None
+        for backend in (exact, ChromaBackend(coll)):
+            r = time_backend(backend, queries, args.k)
+            if truth is None:
+                truth = r["ids"]   # exact scan is the ground truth
+            report["backends"][backend.name] = {
+                **r["latency"],
+                "qps": r["qps"],
+                f"recall@{args.k}": recall_at_k(r["ids"], truth, args.k),
+            }
+
+    print(f"\n{report['n']:,} vectors × {report['dim']}, k={args.k}, {len(queries)} queries")
+    print(f"{'backend':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'QPS':>9} {'recall':>7}")
+    for name, r in report["backends"].items():
+        print(f"{name:<8} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f} "
+              f"{r['qps']:9.1f} {r[f'recall@{args.k}']:7.3f}")
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nSaved → {args.json}")
+
+if __name__ == "__main__":
+    main()
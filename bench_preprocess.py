@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+import preprocessor
+
+# Books/sec of preprocessor.postprocess_books on a synthetic corpus:
+# in-process (1 worker) vs the process pool. Each pool run includes
+# starting the workers and building their language detectors.
+
+VOCAB = {
+    "en": "the of and to in that it was he for on are with as his they be at one have this from".split(),
+    "de": "der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch".split(),
+    "fr": "le de la et les des en un du une que est pour qui dans par plus pas au sur ne se".split(),
+    "es": "de la que el en y los del se las por un para con no una su al lo como más pero".split(),
+}
+
+
+# -------------------- SYNTHETIC CORPUS --------------------
+
+def make_paragraph(rng: random.Random, words, n_sentences: int = 5) -> str:
+    sentences = []
+    for _ in range(n_sentences):
+        s = " ".join(rng.choice(words) for _ in range(rng.randint(8, 20)))
+        sentences.append(s.capitalize() + ".")
+    return " ".join(sentences)
+
+def make_corpus(root: Path, books: int, paragraphs: int, seed: int = 0) -> Path:
+    """Books with repeated paragraphs and a trailing INDEX, like Gutenberg texts."""
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    langs = list(VOCAB)
+    for b in range(books):
+        words = VOCAB[langs[b % len(langs)]]
+        paras = [make_paragraph(rng, words) for _ in range(paragraphs)]
+        for _ in range(paragraphs // 20):     # ~5% duplicates
+            paras.insert(rng.randrange(len(paras)), rng.choice(paras))
+        paras.append("INDEX")
+        paras.extend(f"Entry {i}, {rng.randint(1, 400)}" for i in range(200))
+        (root / f"{b}.txt").write_text("\n\n".join(paras) + "\n", encoding="utf-8")
+    return root
+
+
+# -------------------- MAIN --------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Preprocessor throughput on a synthetic corpus.")
+    ap.add_argument("--books", type=int, default=32)
+    ap.add_argument("--paragraphs", type=int, default=2000, help="paragraphs per book")
+    ap.add_argument("--workers", type=int, nargs="*", default=None,
+                    help="worker counts to try (default: 1 and PREPROCESS_WORKERS)")
+    ap.add_argument("--json", type=Path, help="write results here")
+    args = ap.parse_args()
+    counts = args.workers or sorted({1, preprocessor.PREPROCESS_WORKERS})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = make_corpus(Path(tmp) / "clean", args.books, args.paragraphs)
+        corpus_mib = sum(p.stat().st_size for p in src.iterdir()) / (1 << 20)
+        print(f"Synthetic corpus: {args.books} books, {corpus_mib:.1f} MiB")
+
+        rows = []
+        for workers in counts:
+            out = Path(tmp) / f"processed_{workers}"
+            t0 = time.perf_counter()
+            done = preprocessor.postprocess_books(str(src), str(out), workers=workers, quiet=True)
+            wall = time.perf_counter() - t0
+            if done != args.books:
+                raise SystemExit(f"Only {done}/{args.books} books processed with {workers} workers")
+            rows.append({"workers": workers, "seconds": wall,
+                         "books_per_s": args.books / wall, "mib_per_s": corpus_mib / wall})
+
+    base = rows[0]["books_per_s"]
+    print(f"\n{'workers':>7} {'seconds':>8} {'books/s':>8} {'MiB/s':>7} {'speedup':>7}")
+    for r in rows:
+        r["speedup"] = r["books_per_s"] / base
+        print(f"{r['workers']:7d} {r['seconds']:8.2f} {r['books_per_s']:8.2f} "
+              f"{r['mib_per_s']:7.2f} {r['speedup']:6.2f}x")
+
+    if args.json:
+        args.json.write_text(json.dumps({"books": args.books, "corpus_mib": corpus_mib,
+                                         "cpus": os.cpu_count(), "results": rows}, indent=2),
+                             encoding="utf-8")
+        print(f"\nSaved → {args.json}")
+
+if __name__ == "__main__":
+    main()
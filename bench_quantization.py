@@ -0,0 +1,75 @@
+import json
+import argparse
+import tempfile
+from pathlib import Path
+
+import vector_store
+from bench_backends import build_synthetic_store, make_queries, recall_at_k, time_backend
+from vector_store import NumpyBackend, QuantizedBackend, write_quantized
+
+# Memory footprint, latency and recall@k of the int8 / binary first pass
+# against the float32 exact scan, to pick PSYBOT_VECTOR_QUANT for production.
+
+
+def mib(n: int) -> float:
+    return n / (1 << 20)
+
+def main():
+    ap = argparse.ArgumentParser(description="float32 vs int8 vs binary vector search.")
+    ap.add_argument("--synthetic", type=int, default=0,
+                    help="benchmark N random vectors in a temp store instead of vector_index/")
+    ap.add_argument("--dim", type=int, default=1024)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--rescore", type=int, nargs="*", default=None,
+                    help="rescore factors to try (default: the configured one per mode)")
+    ap.add_argument("--json", type=Path, help="write results here")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            print(f"Building synthetic store: {args.synthetic:,} × {args.dim} ...")
+            _, vec_dir = build_synthetic_store(Path(tmp), args.synthetic, args.dim)
+        else:
+            vec_dir = vector_store.VECTOR_DIR
+            if not (vec_dir / "meta.json").exists():
+                raise SystemExit(f"No NumPy export in {vec_dir}; run embed.py first")
+            if not (vec_dir / "emb_int8.npy").exists():
+                write_quantized(vec_dir)
+
+        exact = NumpyBackend(vec_dir)
+        queries = make_queries(exact.emb, args.queries)
+        n, dim = exact.emb.shape
+
+        rows = []
+        base = time_backend(exact, queries, args.k)
+        truth = base["ids"]
+        rows.append({"mode": "float32", "rescore": None,
+                     "resident_mib": mib(exact.emb.nbytes),
+                     **base["latency"], "qps": base["qps"], f"recall@{args.k}": 1.0})
+
+        for mode in ("int8", "binary"):
+            for factor in args.rescore or [vector_store.RESCORE_FACTOR[mode]]:
+                backend = QuantizedBackend(vec_dir, mode, rescore=factor)
+                r = time_backend(backend, queries, args.k)
+                rows.append({"mode": mode, "rescore": factor,
+                             "resident_mib": mib(backend.resident_bytes()),
+                             **r["latency"], "qps": r["qps"],
+                             f"recall@{args.k}": recall_at_k(r["ids"], truth, args.k)})
+
+    print(f"\n{n:,} vectors × {dim}, k={args.k}, {len(queries)} queries")
+    print("(float32 rows are only touched for rescoring in quantized modes; resident = first-pass copy)")
+    print(f"{'mode':<8} {'rescore':>7} {'resident MiB':>12} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'QPS':>8} {'recall':>7}")
+    for r in rows:
+        print(f"{r['mode']:<8} {str(r['rescore'] or '-'):>7} {r['resident_mib']:12.1f} "
+              f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f} {r['qps']:8.1f} "
+              f"{r[f'recall@{args.k}']:7.3f}")
+
+    if args.json:
+        args.json.write_text(json.dumps({"n": n, "dim": dim, "k": args.k, "results": rows}, indent=2),
+                             encoding="utf-8")
+        print(f"\nSaved → {args.json}")
+
+if __name__ == "__main__":
+    main()
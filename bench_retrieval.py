@@ -0,0 +1,316 @@
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import retrieval
+from bench_backends import percentiles, recall_at_k
+from corpus import CHUNKS_DIR, iter_chunk_files, iter_chunks
+from lexical import tokenize
+from retrieval import RetrievalRuntime
+from retrieval_cache import RetrievalCache
+from vector_store import NumpyBackend, export_numpy
+
+# End-to-end query path on a throwaway Chroma store: RetrievalRuntime
+# .retrieve (what search.search calls), .aretrieve, and agent.retrieve_context,
+# each at several concurrency levels. Ground truth is an exact dot-product
+# scan over the same vectors. CPU only: the default "hash" embedder is a
+# tiny deterministic stand-in for e5; --model loads a real (small) one.
+# The corpus is synthetic (seeded) or a seeded sample of data/chunks.
+
+COLLECTION = "bench"
+STANDIN_DIM = 384
+LANGS = ["en", "de", "fr", "es"]
+QUERY_WORDS = 12              # queries are word spans lifted from a corpus passage
+CONCURRENCY = [1, 4, 16]
+WORKLOADS = ["search", "aretrieve", "agent"]
+BACKENDS = ["chroma", "numpy"]
+ADD_BATCH = 2000
+
+
+# -------------------- STAND-IN EMBEDDER --------------------
+
+class HashEmbedder:
+    """
+    Signed feature hashing of words into unit vectors, with
+    SentenceTransformer's `encode` signature. No model, no torch; texts
+    sharing words land close together, which is all the benchmark needs.
+    `delay_ms` adds a fixed cost per encode call to mimic a forward pass.
+    """
+
+    device = "cpu"
+
+    def __init__(self, dim: int = STANDIN_DIM, delay_ms: float = 0.0):
+        self.dim = dim
+        self.delay = delay_ms / 1000.0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for r, text in enumerate(texts):
+            for prefix in ("query: ", "passage: "):
+                if text.startswith(prefix):
+                    text = text[len(prefix):]
+            for tok in tokenize(text):
+                h = zlib.crc32(tok.encode("utf-8"))
+                out[r, h % self.dim] += 1.0 if h >> 31 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms == 0, 1.0, norms)
+        return out
+
+def load_embedder(model: str, delay_ms: float):
+    if model == "hash":
+        return HashEmbedder(delay_ms=delay_ms)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model, device="cpu")
+
+
+# -------------------- CORPUS --------------------
+
+def _pseudo_words(rng: random.Random, n: int) -> List[str]:
+    syll = ["ka", "lo", "mi", "ne", "ru", "ta", "shi", "von", "der", "al", "en", "is", "ur", "po", "qua", "ze"]
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(syll) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def synthetic_corpus(n: int, seed: int = 0, vocab: int = 5000) -> List[Tuple[str, str, Dict]]:
+    """(id, text, metadata) passages of Zipf-distributed pseudo-words."""
+    rng = random.Random(seed)
+    words = _pseudo_words(rng, vocab)
+    weights = [1.0 / (r + 1) for r in range(vocab)]
+    docs = []
+    for i in range(n):
+        text = " ".join(rng.choices(words, weights, k=rng.randint(60, 160)))
+        docs.append((f"syn:{i}", text, {"book_id": f"syn{i // 200}", "lang": LANGS[i % len(LANGS)]}))
+    return docs
+
+def sampled_corpus(n: int, seed: int = 0, chunks_dir: Path = CHUNKS_DIR) -> List[Tuple[str, str, Dict]]:
+    """Uniform sample (reservoir, seeded) of n real chunks."""
+    rng = random.Random(seed)
+    sample = []
+    seen = 0
+    for fp in iter_chunk_files(chunks_dir):
+        for vec_id, text, meta in iter_chunks(fp):
+            item = (vec_id, text, {"book_id": str(meta.get("book_id") or fp.stem),
+                                   "lang": str(meta.get("lang") or "unknown")})
+            seen += 1
+            if len(sample) < n:
+                sample.append(item)
+            else:
+                j = rng.randrange(seen)
+                if j < n:
+                    sample[j] = item
+    if not sample:
+        raise SystemExit(f"No chunks in {chunks_dir}; run chunker.py or use --synthetic")
+    return sorted(sample)
+
+def make_queries(docs, n: int, seed: int = 1) -> List[str]:
+    """Word spans lifted from random passages: each query has a passage that answers it."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        words = rng.choice(docs)[1].split()
+        start = rng.randrange(max(1, len(words) - QUERY_WORDS))
+        queries.append(" ".join(words[start:start + QUERY_WORDS]))
+    return queries
+
+def build_store(root: Path, docs, embedder):
+    """Embed the passages into a temp Chroma collection and export it for the NumPy backend."""
+    import chromadb
+    client = chromadb.PersistentClient(path=str(root / "chroma_db"))
+    coll = client.get_or_create_collection(name=COLLECTION, metadata={"hnsw:space": "cosine"})
+    for i in range(0, len(docs), ADD_BATCH):
+        batch = docs[i:i + ADD_BATCH]
+        emb = embedder.encode([f"passage: {t}" for _, t, _ in batch], batch_size=64,
+                              normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
+        coll.add(
+            ids=[d[0] for d in batch],
+            embeddings=np.asarray(emb, dtype=np.float32),
+            documents=[d[1] for d in batch],
+            metadatas=[d[2] for d in batch],
+        )
+    export_numpy(coll, root / "vector_index")
+    return root / "chroma_db", root / "vector_index"
+
+
+# -------------------- WORKLOADS --------------------
+
+def run_search(rt: RetrievalRuntime, queries: List[str], k: int, concurrency: int):
+    """rt.retrieve from `concurrency` threads (search.py / script callers)."""
+    ms = [0.0] * len(queries)
+    out = [None] * len(queries)
+
+    def one(i):
+        t = time.perf_counter()
+        out[i] = rt.retrieve(queries[i], k)
+        ms[i] = (time.perf_counter() - t) * 1000
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(len(queries))))
+    return ms, out, time.perf_counter() - t0
+
+async def _run_async(fn, queries: List[str], k: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    ms = [0.0] * len(queries)
+    out = [None] * len(queries)
+
+    async def one(i):
+        async with sem:
+            t = time.perf_counter()
+            out[i] = await fn(queries[i], k)
+            ms[i] = (time.perf_counter() - t) * 1000
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(len(queries))))
+    return ms, out, time.perf_counter() - t0
+
+def run_async(fn, queries: List[str], k: int, concurrency: int):
+    """`concurrency` requests in flight on one event loop (the app's request path)."""
+    return asyncio.run(_run_async(fn, queries, k, concurrency))
+
+
+def ground_truth(vec_dir: Path, embedder, queries: List[str], k: int) -> List[List[str]]:
+    """Exact top-k ids by brute-force dot product."""
+    exact = NumpyBackend.open(vec_dir)
+    qvecs = embedder.encode([f"query: {q}" for q in queries], batch_size=64,
+                            normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
+    truth = []
+    for q in np.asarray(qvecs, dtype=np.float32):
+        rows, _ = exact.topk(q, k)
+        truth.append([exact.ids[int(r)] for r in rows])
+    return truth
+
+def context_recall(contexts: List[str], truth: List[List[str]], doc_of: Dict[str, str], k: int) -> float:
+    """recall@k for agent.retrieve_context, which returns joined text instead of ids."""
+    return float(np.mean([sum(doc_of[i] in c for i in t[:k]) / k for c, t in zip(contexts, truth)]))
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, cwd=Path(__file__).parent,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# -------------------- MAIN --------------------
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Latency, QPS and recall@k of the retrieval path on a temp store.")
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--synthetic", type=int, default=20000, help="N generated passages (default)")
+    src.add_argument("--sample", type=int, default=0, help="N passages sampled from data/chunks instead")
+    ap.add_argument("--chunks-dir", type=Path, default=CHUNKS_DIR)
+    ap.add_argument("--model", default="hash",
+                    help='"hash" stand-in (default) or a SentenceTransformer name, run on CPU')
+    ap.add_argument("--embed-ms", type=float, default=0.0,
+                    help="simulated forward-pass cost per encode call for the hash embedder")
+    ap.add_argument("--backends", nargs="+", choices=BACKENDS + ["int8", "binary"], default=BACKENDS)
+    ap.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=WORKLOADS)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--cache", action="store_true",
+                    help="keep the retrieval cache on (default: off, every query hits the index)")
+    ap.add_argument("--lang-partition", action="store_true",
+                    help="route queries by detected language (needs the lingua models)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", type=Path, help="write results here")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    # Dense-only: the BM25 side reads the real lexical_index/, not the temp store
+    retrieval.HYBRID = False
+    retrieval.LANG_PARTITION = args.lang_partition
+
+    embedder = load_embedder(args.model, args.embed_ms)
+    if args.sample:
+        docs = sampled_corpus(args.sample, args.seed, args.chunks_dir)
+        corpus_desc = f"sample of {len(docs):,} chunks"
+    else:
+        docs = synthetic_corpus(args.synthetic, args.seed)
+        corpus_desc = f"{len(docs):,} synthetic passages"
+    queries = make_queries(docs, args.queries, args.seed + 1)
+    doc_of = {i: t for i, t, _ in docs}
+
+    agent = None
+    if "agent" in args.workloads:
+        try:
+            import agent
+        except Exception as e:
+            print(f"⚠️  Skipping the agent workload (agent.py failed to import: {type(e).__name__}: {e})")
+
+    report = {
+        "commit": git_commit(),
+        "at": time.time(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform()},
+        "params": {"corpus": "sample" if args.sample else "synthetic", "n": len(docs), "seed": args.seed,
+                   "model": args.model, "embed_ms": args.embed_ms, "queries": len(queries), "k": args.k,
+                   "cache": args.cache, "lang_partition": args.lang_partition},
+        "runs": [],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building temp store: {corpus_desc} ({args.model} embedder, CPU) ...")
+        t0 = time.perf_counter()
+        chroma_dir, vec_dir = build_store(Path(tmp), docs, embedder)
+        report["build_seconds"] = time.perf_counter() - t0
+        truth = ground_truth(vec_dir, embedder, queries, args.k)
+
+        for backend in args.backends:
+            quant = backend if backend in ("int8", "binary") else "none"
+            rt = RetrievalRuntime(model_name=args.model, chroma_path=str(chroma_dir), collection_name=COLLECTION,
+                                  backend="chroma" if backend == "chroma" else "numpy",
+                                  vector_dir=vec_dir, vector_quant=quant, embedder=embedder)
+            rt.load()
+            retrieval._runtime = rt       # agent.retrieve_context goes through get_runtime()
+
+            for workload in args.workloads:
+                if workload == "agent" and agent is None:
+                    continue
+                for c in args.concurrency:
+                    rt.cache = RetrievalCache(persist_dir=None, max_entries=2048 if args.cache else 0)
+                    rt.retrieve(queries[0], args.k)      # warm up the backend
+                    if workload == "search":
+                        ms, out, wall = run_search(rt, queries, args.k, c)
+                    elif workload == "aretrieve":
+                        ms, out, wall = run_async(rt.aretrieve, queries, args.k, c)
+                    else:
+                        ms, out, wall = run_async(agent.retrieve_context, queries, args.k, c)
+
+                    if workload == "agent":
+                        recall = context_recall(out, truth, doc_of, args.k)
+                    else:
+                        recall = recall_at_k([[h["id"] for h in hits] for hits in out], truth, args.k)
+                    run = {"backend": backend, "workload": workload, "concurrency": c,
+                           **percentiles(ms), "qps": len(queries) / wall, f"recall@{args.k}": recall,
+                           "cache_hit_rate": rt.cache.stats()["hit_rate"]}
+                    report["runs"].append(run)
+                    print(f"  {backend:<7} {workload:<10} c={c:<3} p50 {run['p50_ms']:7.2f}  "
+                          f"p95 {run['p95_ms']:7.2f}  p99 {run['p99_ms']:7.2f} ms  "
+                          f"{run['qps']:8.1f} QPS  recall@{args.k} {recall:.3f}")
+            retrieval._runtime = None
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nSaved → {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -1,134 +1,357 @@
 import os
 import json
 import re
+import time
+import argparse
+import tracemalloc
+import multiprocessing as mp
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import nltk
 
-# Make sure NLTK has the sentence tokenizer
-nltk.download('punkt')
-nltk.download("punkt_tab")
+from manifest import FileManifest, atomic_writer, file_digest, file_stat
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
 
 INPUT_DIR = "data/processed"
 OUTPUT_DIR = "data/chunks"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, ".chunk_manifest.json")
+
+# Books are independent → one process per core. Bump CHUNKER_VERSION when
+# the chunking logic changes so every book is rebuilt on the next run.
+CHUNK_WORKERS = os.cpu_count() or 1
+CHUNKER_VERSION = 2
+
+# Books are streamed: read in paragraph-aligned blocks, segmented block by
+# block and written chunk by chunk, so memory stays flat for huge texts.
+BLOCK_CHARS = 1 << 16         # ~64K characters per sentence-tokenizer call
+SENTENCE_BATCH = 256          # sentences per tokenizer call
+CHUNK_BATCH = 64              # chunks per truncation check / write
+
+
+def ensure_punkt():
+    """Make sure NLTK has the sentence tokenizer (downloads only if missing)."""
+    for name, package in (("tokenizers/punkt", "punkt"), ("tokenizers/punkt_tab", "punkt_tab")):
+        try:
+            nltk.data.find(name)
+        except LookupError:
+            nltk.download(package, quiet=True)
 
 # -----------------------------
-# TOKEN ESTIMATOR (rough)
+# EMBEDDING MODEL WINDOW
 # -----------------------------
-# We approximate tokens using a standard rule: ~4 chars/token for English.
-# Good enough for sizing chunks before real embedding.
-
-def estimate_tokens(text: str) -> int:
-    return max(1, len(text) // 4)
+# Chunks are sized with the embedding model's own tokenizer so that
+# "passage: " + chunk always fits in the window embed.py encodes
+# (keep MODEL_NAME / MAX_SEQ_LENGTH in sync with embed.py).
+
+MODEL_NAME = "intfloat/multilingual-e5-large"
+MAX_SEQ_LENGTH = 512
+PASSAGE_PREFIX = "passage: "
+OVERLAP_RATIO = 0.12          # share of the window repeated between chunks
+
+_tokenizer = None
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    return _tokenizer
+
+def window_limits():
+    """(max chunk tokens, overlap tokens) derived from the model window."""
+    tok = get_tokenizer()
+    reserved = tok.num_special_tokens_to_add() + len(tok(PASSAGE_PREFIX, add_special_tokens=False)["input_ids"])
+    max_tokens = MAX_SEQ_LENGTH - reserved
+    return max_tokens, int(max_tokens * OVERLAP_RATIO)
+
+def chunk_params():
+    """Everything besides the input text that changes the chunker's output."""
+    return {
+        "model": MODEL_NAME,
+        "max_seq_length": MAX_SEQ_LENGTH,
+        "overlap_ratio": OVERLAP_RATIO,
+        "version": CHUNKER_VERSION,
+    }
 
 
 # -----------------------------
-# SENTENCE SPLITTING
+# TOKEN COUNTS (exact, batched)
 # -----------------------------
 
-def split_sentences(text: str):
-    """Split text into sentences using NLTK."""
-    return nltk.sent_tokenize(text)
+def count_tokens(texts):
+    """Tokenizer-exact length of each text, tokenized in one batch."""
+    if not texts:
+        return []
+    enc = get_tokenizer()(list(texts), add_special_tokens=False)
+    return [len(ids) for ids in enc["input_ids"]]
+
+def split_long_sentence(sent: str, max_tokens: int):
+    """Cut a sentence longer than the window at token boundaries."""
+    enc = get_tokenizer()(sent, add_special_tokens=False, return_offsets_mapping=True)
+    offsets = enc["offset_mapping"]
+    pieces = []
+    for i in range(0, len(offsets), max_tokens):
+        window = offsets[i:i + max_tokens]
+        piece = sent[window[0][0]:window[-1][1]].strip()
+        if piece:
+            pieces.append(piece)
+    return pieces
+
+def count_truncated(chunks):
+    """How many chunks would exceed the window once embedded as "passage: ..."."""
+    if not chunks:
+        return 0
+    enc = get_tokenizer()([PASSAGE_PREFIX + c for c in chunks], add_special_tokens=True)
+    return sum(1 for ids in enc["input_ids"] if len(ids) > MAX_SEQ_LENGTH)
 
 
 # -----------------------------
-# BUILD CHUNKS
+# SENTENCE SPLITTING (streaming)
 # -----------------------------
 
-def build_chunks(sentences, max_tokens=900, overlap=120):
-    chunks = []
-    current_chunk = []
-    current_tokens = 0
+def batched(iterable, n: int):
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+def iter_blocks(path: str, block_chars: int = BLOCK_CHARS):
+    """
+    Yield a text file in blocks of roughly `block_chars`, cut at blank
+    lines so no sentence spans two blocks. Files without paragraph breaks
+    are cut at a line boundary once a block grows to 4x the target.
+    """
+    buf, size = [], 0
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            buf.append(line)
+            size += len(line)
+            if size >= block_chars and (not line.strip() or size >= 4 * block_chars):
+                yield "".join(buf)
+                buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+def iter_sentences(blocks):
+    for block in blocks:
+        block = block.strip()
+        if block:
+            yield from nltk.sent_tokenize(block)
 
-    for sent in sentences:
-        sent_tokens = estimate_tokens(sent)
 
-        # Too long sentence → push alone
+# -----------------------------
+# BUILD CHUNKS
+# -----------------------------
+
+def iter_chunks(sentences, max_tokens=None, overlap=None, stats=None):
+    """
+    Pack sentences into chunks of at most `max_tokens` model tokens,
+    repeating up to `overlap` tokens of trailing sentences in the next
+    chunk. Limits default to the embedding model's window. Sentences
+    longer than the window are split at token boundaries (counted in
+    stats["split_sentences"]) instead of being truncated at embed time.
+    """
+    if max_tokens is None or overlap is None:
+        default_max, default_overlap = window_limits()
+        max_tokens = default_max if max_tokens is None else max_tokens
+        overlap = default_overlap if overlap is None else overlap
+
+    window = deque()        # (sentence, tokens) of the chunk being built
+    window_tokens = 0
+
+    for sent, sent_tokens in (
+        pair for batch in batched(sentences, SENTENCE_BATCH) for pair in zip(batch, count_tokens(batch))
+    ):
+        # Too long sentence → flush, then emit it in window-sized pieces
         if sent_tokens > max_tokens:
-            if current_chunk:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = []
-                current_tokens = 0
-            chunks.append(sent)
+            if window:
+                yield " ".join(s for s, _ in window)
+                window.clear()
+                window_tokens = 0
+            if stats is not None:
+                stats["split_sentences"] = stats.get("split_sentences", 0) + 1
+            yield from split_long_sentence(sent, max_tokens)
             continue
 
-        # If adding the sentence would exceed max_tokens → finalize chunk
-        if current_tokens + sent_tokens > max_tokens:
-            chunks.append(" ".join(current_chunk))
-
-            # Create overlap window
-            overlap_sents = []
-            overlap_tokens = 0
-            for s in reversed(current_chunk):
-                t = estimate_tokens(s)
-                if overlap_tokens + t > overlap:
-                    break
-                overlap_sents.insert(0, s)
-                overlap_tokens += t
-
-            current_chunk = overlap_sents.copy()
-            current_tokens = sum(estimate_tokens(s) for s in current_chunk)
+        # If adding the sentence would exceed max_tokens → finalize chunk,
+        # then drop leading sentences until only the overlap tail is left
+        # (and the next sentence fits next to it).
+        if window_tokens + sent_tokens > max_tokens:
+            yield " ".join(s for s, _ in window)
+            while window and (window_tokens > overlap or window_tokens + sent_tokens > max_tokens):
+                window_tokens -= window.popleft()[1]
 
         # Add sentence normally
-        current_chunk.append(sent)
-        current_tokens += sent_tokens
+        window.append((sent, sent_tokens))
+        window_tokens += sent_tokens
 
     # Final remaining chunk
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+    if window:
+        yield " ".join(s for s, _ in window)
 
-    return chunks
+def build_chunks(sentences, max_tokens=None, overlap=None, stats=None):
+    """List form of iter_chunks()."""
+    return list(iter_chunks(sentences, max_tokens, overlap, stats))
 
 
 # -----------------------------
-# MAIN PROCESSOR
+# ONE BOOK (runs in a worker)
 # -----------------------------
 
-def chunk_all_books():
-    for fname in os.listdir(INPUT_DIR):
-        if not fname.endswith(".txt"):
-            continue
-
-        in_path = os.path.join(INPUT_DIR, fname)
-
-        # Extract metadata from filename
-        # Example: "35924_en.txt"
-        base = Path(fname).stem
-        parts = base.split("_")
-
-        if len(parts) == 2:
-            book_id, lang = parts
-        else:
-            # fallback
-            book_id = parts[0]
-            lang = "unknown"
-
-        print(f"\n📚 Chunking Book {book_id} ({lang})")
-
-        with open(in_path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read().strip()
-
-        # Sentence splitting
-        sentences = split_sentences(text)
-
-        # Chunk building
-        chunks = build_chunks(sentences)
-
-        # Save chunks to JSONL
-        out_path = os.path.join(OUTPUT_DIR, f"{book_id}.jsonl")
-        with open(out_path, "w", encoding="utf-8") as out_f:
-            for i, chunk in enumerate(chunks):
+def book_meta(fname: str):
+    """(book_id, lang) from a processed filename, e.g. "35924_en.txt"."""
+    parts = Path(fname).stem.split("_")
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return parts[0], "unknown"
+
+def _init_worker():
+    ensure_punkt()
+    get_tokenizer()
+
+def chunk_book(in_path: str, out_dir: str = OUTPUT_DIR, trace_memory: bool = False):
+    """
+    Stream one processed book into <out_dir>/<book_id>.jsonl (atomically).
+    With trace_memory, the result carries the Python heap peak for this
+    book (tracemalloc; the tokenizer's native buffers are not included).
+    """
+    t0 = time.perf_counter()
+    if trace_memory:
+        tracemalloc.start()
+    fname = os.path.basename(in_path)
+    book_id, lang = book_meta(fname)
+
+    stats = {}
+    chunks = iter_chunks(iter_sentences(iter_blocks(in_path)), stats=stats)
+    n_chunks = truncated = 0
+
+    # Readers (embed.py) never see a half-written file
+    out_path = os.path.join(out_dir, f"{book_id}.jsonl")
+    with atomic_writer(out_path) as out_f:
+        for group in batched(chunks, CHUNK_BATCH):
+            truncated += count_truncated(group)
+            for chunk in group:
                 obj = {
                     "book_id": book_id,
                     "lang": lang,
-                    "chunk_index": i,
+                    "chunk_index": n_chunks,
                     "text": chunk
                 }
                 out_f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+                n_chunks += 1
+
+    result = {
+        "fname": fname,
+        "book_id": book_id,
+        "lang": lang,
+        "output": out_path,
+        "chunks": n_chunks,
+        "split_sentences": stats.get("split_sentences", 0),
+        "truncated": truncated,
+        "seconds": time.perf_counter() - t0,
+        "input_mib": os.path.getsize(in_path) / (1 << 20),
+    }
+    if trace_memory:
+        result["peak_mib"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        tracemalloc.stop()
+    if resource is not None:
+        # Linux reports KiB: high-water mark of this worker so far
+        result["worker_rss_mib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
 
-        print(f"✅ Saved {len(chunks)} chunks → {out_path}")
+# -----------------------------
+# MAIN PROCESSOR
+# -----------------------------
+
+def chunk_all_books(input_dir: str = INPUT_DIR, output_dir: str = OUTPUT_DIR,
+                    workers: int = CHUNK_WORKERS, rescan: bool = False,
+                    trace_memory: bool = False):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = FileManifest(os.path.join(output_dir, os.path.basename(MANIFEST_PATH)))
+    params = chunk_params()
+
+    fnames = sorted(f for f in os.listdir(input_dir) if f.endswith(".txt"))
+
+    # Processed books that disappeared → remove their chunks too
+    removed = 0
+    for key in manifest.keys():
+        if key not in fnames:
+            entry = manifest.drop(key)
+            out = entry.get("output")
+            if out and os.path.exists(out):
+                os.remove(out)
+            removed += 1
+
+    todo, skipped = [], 0
+    for fname in fnames:
+        in_path = os.path.join(input_dir, fname)
+        entry = manifest.get(fname)
+        if (not rescan and entry and os.path.exists(entry.get("output", ""))
+                and manifest.unchanged(fname, in_path, params=params)):
+            skipped += 1
+            continue
+        # Snapshot before chunking: a file edited mid-run no longer matches it, so it is redone next time
+        todo.append((in_path, file_stat(in_path), file_digest(in_path)))
+
+    print(f"📚 {len(fnames)} books: {len(todo)} to chunk, {skipped} unchanged, {removed} removed")
+
+    totals = {"chunks": 0, "split_sentences": 0, "truncated": 0}
+    t0 = time.perf_counter()
+    if todo:
+        workers = max(1, min(workers, len(todo)))
+        # spawn: the HF fast tokenizer runs its own threads, so don't fork
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker) as pool:
+            futures = {pool.submit(chunk_book, job[0], output_dir, trace_memory): job for job in todo}
+            for fut in as_completed(futures):
+                in_path, stat, digest = futures[fut]
+                try:
+                    r = fut.result()
+                except Exception as e:
+                    print(f"❌ {os.path.basename(in_path)}: {e}")
+                    continue
+                manifest.record(r["fname"], in_path, digest=digest, stat=stat,
+                                params=params, output=r["output"], chunks=r["chunks"])
+                manifest.save()
+                mem = f", {r['input_mib']:.1f} MiB in"
+                if "peak_mib" in r:
+                    mem += f", heap peak {r['peak_mib']:.1f} MiB"
+                if "worker_rss_mib" in r:
+                    mem += f", worker RSS {r['worker_rss_mib']:.0f} MiB"
+                print(f"✅ Book {r['book_id']} ({r['lang']}): {r['chunks']} chunks → {r['output']} "
+                      f"({r['split_sentences']} long sentences split, {r['truncated']} over the window, "
+                      f"{r['seconds']:.1f}s{mem})")
+                for k in totals:
+                    totals[k] += r[k]
+    manifest.save()
+    elapsed = time.perf_counter() - t0
+
+    max_tokens, overlap = window_limits()
+    print(f"\n📏 Window: {max_tokens} tokens/chunk, {overlap} overlap ({MODEL_NAME}, {MAX_SEQ_LENGTH} max)")
+    print(f"   {len(todo)} books in {elapsed:.1f}s on {workers if todo else 0} workers: "
+          f"{totals['chunks']} chunks, {totals['split_sentences']} over-long sentences split, "
+          f"{totals['truncated']} chunks would be truncated at embed time")
+    return totals
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Chunk data/processed into data/chunks.")
+    ap.add_argument("--workers", type=int, default=CHUNK_WORKERS, help="chunking processes")
+    ap.add_argument("--rescan", action="store_true",
+                    help="ignore the chunk manifest and rechunk every book")
+    ap.add_argument("--trace-memory", action="store_true",
+                    help="report each book's peak Python heap (tracemalloc; slower)")
+    return ap.parse_args()
 
 
 if __name__ == "__main__":
-    chunk_all_books()
+    args = parse_args()
+    ensure_punkt()
+    chunk_all_books(workers=args.workers, rescan=args.rescan, trace_memory=args.trace_memory)
     print("\n🔥 All books chunked successfully.")
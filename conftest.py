@@ -0,0 +1,2 @@
+# Lets pytest import the top-level modules (http_client, downloader_and_cleaner, ...)
+# from tests/ without installing the project.
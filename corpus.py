@@ -0,0 +1,83 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from manifest import text_digest
+
+# Shared by embed.py and the offline index/analysis tools so they all
+# agree on which files make up the corpus and what each chunk's id is.
+
+CHUNKS_DIR = Path("data/chunks")          # .jsonl files with {"text", "book_id", ...}
+NEAR_DUP_FILE = ".near_duplicates.json"   # written by near_dedup.py, next to the chunks
+EMBED_STATS = Path("chroma_db") / "embed_stats.json"   # last embed.py run's throughput
+
+
+def iter_chunk_files(chunks_dir: Path = CHUNKS_DIR) -> List[Path]:
+    files = sorted(Path(chunks_dir).glob("*.jsonl"))
+    if not files:
+        raise FileNotFoundError(f"No JSONL chunk files in {Path(chunks_dir).resolve()}")
+    return files
+
+
+def load_jsonl(fp: Path):
+    with fp.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            yield json.loads(line)
+
+
+def chunk_vector_id(obj: Dict, fp: Path) -> str:
+    """
+    Deterministic vector id: <book_id>:<id>.
+
+    Uses the chunk's own "id"/"chunk_id" when present, otherwise a
+    content hash of its text, so re-running the indexer maps the same
+    chunk to the same id in every process.
+    """
+    cid = obj.get("id") or obj.get("chunk_id")
+    if not cid:
+        cid = text_digest((obj.get("text") or "").strip())
+    book_id = str(obj.get("book_id") or fp.stem)
+    return f"{book_id}:{cid}"
+
+
+def load_skip_list(chunks_dir: Path = CHUNKS_DIR) -> Dict[str, Set[str]]:
+    """
+    Chunk ids to leave out of the indexes, per chunk file name: the
+    near-duplicates found by near_dedup.py when it ran in "drop" mode.
+    A duplicate is only skipped while the file holding its kept copy
+    still exists. "flag" mode (or no list) skips nothing.
+    """
+    path = Path(chunks_dir) / NEAR_DUP_FILE
+    if not path.exists():
+        return {}
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("mode") != "drop":
+        return {}
+    skip: Dict[str, Set[str]] = {}
+    for dup_id, d in data.get("duplicates", {}).items():
+        if (Path(chunks_dir) / d["kept_file"]).exists():
+            skip.setdefault(d["file"], set()).add(dup_id)
+    return skip
+
+
+def iter_chunks(fp: Path, skip: Optional[Set[str]] = None) -> Iterator[Tuple[str, str, Dict]]:
+    """
+    Yield (vector id, text, metadata) for each non-empty chunk, ids unique
+    per file, leaving out any id in `skip`.
+    """
+    seen = set()
+    for obj in load_jsonl(fp):
+        text = (obj.get("text") or "").strip()
+        if not text:
+            continue
+        vec_id = chunk_vector_id(obj, fp)
+        if skip and vec_id in skip:
+            continue
+        if vec_id in seen:
+            # identical text twice in one book: one vector is enough
+            continue
+        seen.add(vec_id)
+        yield vec_id, text, {k: v for k, v in obj.items() if k != "text"}
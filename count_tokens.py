@@ -1,49 +1,235 @@
 import os
-import tiktoken
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+import chunker
+from corpus import CHUNKS_DIR, EMBED_STATS, iter_chunk_files, load_jsonl
+from manifest import FileManifest, file_digest
 
 INPUT_DIR = "data/processed"
-ENCODING = "cl100k_base"   # Same tokenizer used by OpenAI, Jina, Voyage
+CACHE_PATH = "data/.token_counts.json"     # counts per file digest, per tokenizer
 
-# Load tokenizer
-enc = tiktoken.get_encoding(ENCODING)
+# name → (backend, encoding / model). "e5" is the embedding model's own
+# tokenizer (what embed.py actually sees); cl100k is kept for API cost quotes.
+TOKENIZERS = {
+    "cl100k": ("tiktoken", "cl100k_base"),   # Same tokenizer used by OpenAI, Jina, Voyage
+    "e5": ("hf", chunker.MODEL_NAME),
+}
+DEFAULT_TOKENIZERS = ["cl100k", "e5"]
+TOKEN_WORKERS = os.cpu_count() or 1
+ENCODE_BATCH = 256                         # texts per batched encode call
 
-def count_tokens(text: str) -> int:
-    """Return exact tokenizer-based token count."""
-    return len(enc.encode(text))
+# Chunk length histogram (tokens incl. "passage: " + special tokens for e5)
+BIN_EDGES = [0, 64, 128, 192, 256, 320, 384, 448, 512, 640, 768, 1024, 1 << 30]
 
-def main():
-    total_tokens = 0
 
-    print("\n============================")
-    print("📚 TOKEN COUNT PER BOOK")
-    print("============================")
+# -------------------------------------------------------
+# TOKENIZERS (one set per worker process)
+# -------------------------------------------------------
 
-    for fname in os.listdir(INPUT_DIR):
-        if not fname.endswith(".txt"):
-            continue
+_encoders: Dict[str, object] = {}
+
+def _init_worker(names: List[str]):
+    for name in names:
+        get_encoder(name)
+
+def get_encoder(name: str):
+    if name not in _encoders:
+        backend, model = TOKENIZERS[name]
+        if backend == "tiktoken":
+            import tiktoken
+            _encoders[name] = tiktoken.get_encoding(model)
+        else:
+            _encoders[name] = chunker.get_tokenizer()
+    return _encoders[name]
+
+def count_batch(name: str, texts: List[str], special: bool = False) -> List[int]:
+    """Token count of each text, encoded in one call."""
+    if not texts:
+        return []
+    enc = get_encoder(name)
+    if TOKENIZERS[name][0] == "tiktoken":
+        return [len(ids) for ids in enc.encode_ordinary_batch(texts)]
+    return [len(ids) for ids in enc(texts, add_special_tokens=special)["input_ids"]]
+
+
+# -------------------------------------------------------
+# PER-FILE WORK
+# -------------------------------------------------------
+
+def count_book(path: str, names: List[str]) -> Dict[str, int]:
+    """Tokens of a processed book, read in paragraph-aligned blocks and encoded in batches."""
+    totals = {name: 0 for name in names}
+    for blocks in chunker.batched(chunker.iter_blocks(path), ENCODE_BATCH):
+        for name in names:
+            totals[name] += sum(count_batch(name, blocks))
+    return totals
+
+def chunk_histogram(path: str, names: List[str]) -> Dict[str, Dict]:
+    """Per-tokenizer length histogram of one chunk file, as embed.py would see the passages."""
+    out = {name: {"n": 0, "sum": 0, "max": 0, "over": 0, "bins": [0] * (len(BIN_EDGES) - 1)}
+           for name in names}
+    texts = (obj.get("text") or "" for obj in load_jsonl(Path(path)))
+    for batch in chunker.batched((t for t in texts if t.strip()), ENCODE_BATCH):
+        for name in names:
+            if name == "e5":
+                lens = count_batch(name, [chunker.PASSAGE_PREFIX + t for t in batch], special=True)
+            else:
+                lens = count_batch(name, batch)
+            a = np.asarray(lens)
+            h = out[name]
+            h["n"] += len(a)
+            h["sum"] += int(a.sum())
+            h["max"] = max(h["max"], int(a.max()))
+            h["over"] += int((a > chunker.MAX_SEQ_LENGTH).sum())
+            counts, _ = np.histogram(a, bins=BIN_EDGES)
+            h["bins"] = [x + int(c) for x, c in zip(h["bins"], counts)]
+    return out
 
-        path = os.path.join(INPUT_DIR, fname)
+def _work(kind: str, path: str, names: List[str]):
+    return kind, path, (count_book(path, names) if kind == "book" else chunk_histogram(path, names))
 
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
 
-        tokens = count_tokens(text)
-        total_tokens += tokens
+# -------------------------------------------------------
+# MAIN
+# -------------------------------------------------------
 
-        print(f"{fname:<30} {tokens:>12,} tokens")
+def collect(jobs, cache: FileManifest, names: List[str], workers: int):
+    """
+    Fill results from the cache and compute the rest in a process pool:
+    an unchanged file only runs the tokenizers it has no count for yet.
+    """
+    results, todo = {}, []
+    for kind, path in jobs:
+        key = f"{kind}:{os.path.basename(path)}"
+        entry = cache.get(key)
+        have = entry["counts"] if entry and cache.unchanged(key, path) else {}
+        missing = [n for n in names if n not in have]
+        if missing:
+            todo.append((kind, path, missing))
+        else:
+            results[key] = {n: have[n] for n in names}
+
+    if todo:
+        needed = [n for n in names if any(n in missing for _, _, missing in todo)]
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(todo))),
+                                 mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(needed,)) as pool:
+            futures = [pool.submit(_work, kind, path, missing) for kind, path, missing in todo]
+            for fut in futures:
+                kind, path, counts = fut.result()
+                key = f"{kind}:{os.path.basename(path)}"
+                entry = cache.get(key) or {}
+                digest = file_digest(path)
+                # keep other tokenizers' counts only if they were for this content
+                prev = entry.get("counts", {}) if entry.get("digest") == digest else {}
+                merged = {**prev, **counts}
+                cache.record(key, path, digest=digest, counts=merged)
+                results[key] = {n: merged[n] for n in names}
+        cache.save()
+    return results, len(jobs) - len(todo)
+
+def merge_histograms(hists: List[Dict]) -> Dict:
+    total = {"n": 0, "sum": 0, "max": 0, "over": 0, "bins": [0] * (len(BIN_EDGES) - 1)}
+    for h in hists:
+        total["n"] += h["n"]
+        total["sum"] += h["sum"]
+        total["max"] = max(total["max"], h["max"])
+        total["over"] += h["over"]
+        total["bins"] = [a + b for a, b in zip(total["bins"], h["bins"])]
+    return total
+
+def print_histogram(name: str, h: Dict):
+    print(f"\n[{name}] {h['n']:,} chunks, mean {h['sum'] / h['n'] if h['n'] else 0:.0f}, "
+          f"max {h['max']:,}, over {chunker.MAX_SEQ_LENGTH}: {h['over']:,} "
+          f"({h['over'] / h['n'] if h['n'] else 0:.2%})"
+          + (" ← truncated by embed.py" if name == "e5" and h["over"] else ""))
+    peak = max(h["bins"]) or 1
+    for lo, hi, c in zip(BIN_EDGES, BIN_EDGES[1:], h["bins"]):
+        label = f"{lo:>5}–{hi - 1:<5}" if hi < BIN_EDGES[-1] else f"{lo:>5}+     "
+        print(f"  {label} {c:>9,} {'█' * round(40 * c / peak)}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Token counts of processed books and chunk length histograms.")
+    ap.add_argument("--tokenizers", nargs="+", choices=list(TOKENIZERS), default=DEFAULT_TOKENIZERS)
+    ap.add_argument("--input-dir", default=INPUT_DIR)
+    ap.add_argument("--chunks-dir", type=Path, default=CHUNKS_DIR)
+    ap.add_argument("--workers", type=int, default=TOKEN_WORKERS)
+    ap.add_argument("--no-chunks", action="store_true", help="skip the chunk histograms")
+    ap.add_argument("--json", type=Path, help="write the report here")
+    args = ap.parse_args()
+    names = args.tokenizers
+    t0 = time.perf_counter()
+
+    cache = FileManifest(CACHE_PATH)
+    jobs = [("book", os.path.join(args.input_dir, f))
+            for f in sorted(os.listdir(args.input_dir)) if f.endswith(".txt")]
+    if not args.no_chunks and args.chunks_dir.exists():
+        jobs += [("chunks", str(fp)) for fp in iter_chunk_files(args.chunks_dir)]
+    results, cached = collect(jobs, cache, names, args.workers)
 
     print("\n============================")
-    print("📦 TOTAL TOKEN COUNT")
+    print("📚 TOKEN COUNT PER BOOK")
     print("============================")
-    print(f"Total tokens: {total_tokens:,}")
+    print(f"{'book':<30} " + " ".join(f"{n:>12}" for n in names))
+    totals = {n: 0 for n in names}
+    books = {}
+    for kind, path in jobs:
+        if kind != "book":
+            continue
+        fname = os.path.basename(path)
+        counts = results[f"book:{fname}"]
+        books[fname] = counts
+        for n in names:
+            totals[n] += counts[n]
+        print(f"{fname:<30} " + " ".join(f"{counts[n]:>12,}" for n in names))
 
     print("\n============================")
-    print("💸 COST ESTIMATES")
+    print("📦 TOTAL TOKEN COUNT")
     print("============================")
-    print(f"OpenAI text-embedding-3-small (~$0.02 per 1M):   ${total_tokens / 1_000_000 * 0.02:.4f}")
-    print(f"Jina embedding-small (~$0.01 per 1M):           ${total_tokens / 1_000_000 * 0.01:.4f}")
-    print(f"Jina embedding-large (~$0.10 per 1M):           ${total_tokens / 1_000_000 * 0.10:.4f}")
-    print(f"Voyage large (~$1.00 per 1M):                   ${total_tokens / 1_000_000 * 1.00:.4f}")
+    for n in names:
+        print(f"Total tokens ({n}): {totals[n]:,}")
+    print(f"({cached}/{len(jobs)} files from cache, {time.perf_counter() - t0:.1f}s)")
+
+    if "cl100k" in names:
+        t = totals["cl100k"]
+        print("\n============================")
+        print("💸 COST ESTIMATES (cl100k)")
+        print("============================")
+        print(f"OpenAI text-embedding-3-small (~$0.02 per 1M):   ${t / 1_000_000 * 0.02:.4f}")
+        print(f"Jina embedding-small (~$0.01 per 1M):           ${t / 1_000_000 * 0.01:.4f}")
+        print(f"Jina embedding-large (~$0.10 per 1M):           ${t / 1_000_000 * 0.10:.4f}")
+        print(f"Voyage large (~$1.00 per 1M):                   ${t / 1_000_000 * 1.00:.4f}")
+
+    report = {"tokenizers": names, "books": books, "totals": totals}
+    chunk_keys = [f"chunks:{os.path.basename(p)}" for kind, p in jobs if kind == "chunks"]
+    if chunk_keys:
+        print("\n============================")
+        print("✂️  CHUNK LENGTHS")
+        print("============================")
+        hists = {n: merge_histograms([results[k][n] for k in chunk_keys]) for n in names}
+        for n in names:
+            print_histogram(n, hists[n])
+        report["chunks"] = {"bin_edges": BIN_EDGES, **hists}
+
+        if EMBED_STATS.exists():
+            rate = json.loads(EMBED_STATS.read_text(encoding="utf-8")).get("passages_per_sec")
+            n_chunks = next(iter(hists.values()))["n"]
+            if rate:
+                report["forecast_embed_seconds"] = n_chunks / rate
+                print(f"\n⏱️  Full index forecast: {n_chunks:,} passages at {rate:.1f}/s "
+                      f"(last embed.py run) ≈ {n_chunks / rate / 60:.1f} min")
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nSaved → {args.json}")
 
 if __name__ == "__main__":
     main()
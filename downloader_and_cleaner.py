@@ -1,27 +1,87 @@
 import os
 import re
 import csv
-import requests
+import time
+import argparse
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from http_client import fetch_to_cache, make_session
+from manifest import atomic_write_text
 
 CSV_PATH = "gutenberg_books.csv"
+RAW_DIR = "data/raw"          # untouched downloads (+ .meta.json validators)
 OUT_DIR = "data/clean"
 
-os.makedirs(OUT_DIR, exist_ok=True)
-
-HEADERS = {"User-Agent": "Mozilla/5.0"}
+# Mirror / local stand-in: replaces scheme+host of the CSV URLs
+BASE_URL = os.getenv("PSYBOT_GUTENBERG_BASE", "")
+DOWNLOAD_WORKERS = 4          # concurrent downloads (be polite to gutenberg.org)
 
 
 # -------------------------------------------------------
-# DOWNLOAD TEXT FROM GUTENBERG
+# PHASE 1: DOWNLOAD TEXT FROM GUTENBERG (into the raw cache)
 # -------------------------------------------------------
 
-def download_book(url: str) -> str:
-    """Returns the full text of the book from the .txt.utf-8 URL."""
-    resp = requests.get(url, headers=HEADERS, timeout=30)
-    resp.raise_for_status()
-    resp.encoding = "utf-8"
-    return resp.text
+def read_catalogue(csv_path: str = CSV_PATH) -> List[Dict]:
+    with open(csv_path, "r", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def book_url(url: str, base_url: str = BASE_URL) -> str:
+    if not base_url:
+        return url
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    return base_url.rstrip("/") + path
+
+def raw_path(book_id: str, raw_dir: str = RAW_DIR) -> Path:
+    return Path(raw_dir) / f"{book_id}.txt"
+
+def download_book(session: requests.Session, book_id: str, url: str,
+                  raw_dir: str = RAW_DIR, revalidate: bool = True):
+    """
+    Fetch the .txt.utf-8 file into the raw cache. Reruns revalidate with
+    ETag / Last-Modified (304 → nothing transferred) and an interrupted
+    download resumes from its .part file.
+    """
+    return fetch_to_cache(session, url, raw_path(book_id, raw_dir), revalidate=revalidate)
+
+def download_all(rows: List[Dict], raw_dir: str = RAW_DIR, base_url: str = BASE_URL,
+                 workers: int = DOWNLOAD_WORKERS, revalidate: bool = True,
+                 session: Optional[requests.Session] = None) -> Dict[str, int]:
+    """Bounded-concurrency download of every catalogue row over one pooled session."""
+    session = session or make_session(pool_size=max(workers, 1))
+    counts = {"fetched": 0, "resumed": 0, "not_modified": 0, "cached": 0, "failed": 0, "bytes": 0}
+    t0 = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {
+            pool.submit(download_book, session, row["book_id"],
+                        book_url(row["plain_text_url"], base_url), raw_dir, revalidate): row["book_id"]
+            for row in rows
+        }
+        for fut in as_completed(futures):
+            book_id = futures[fut]
+            try:
+                r = fut.result()
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"❌ Download {book_id}: {e}")
+                continue
+            counts[r.status] += 1
+            counts["bytes"] += r.bytes
+            if r.status in ("fetched", "resumed"):
+                print(f"⬇️  {book_id}: {r.status}, {r.bytes / 1024:.0f} KiB in {r.seconds:.1f}s")
+
+    elapsed = time.perf_counter() - t0
+    print(f"\n📦 Download: {counts['fetched']} fetched, {counts['resumed']} resumed, "
+          f"{counts['not_modified']} not modified, {counts['cached']} cached, {counts['failed']} failed "
+          f"— {counts['bytes'] / (1 << 20):.1f} MiB in {elapsed:.1f}s")
+    return counts
 
 
 # -------------------------------------------------------
@@ -73,41 +133,73 @@ def clean_text(text: str) -> str:
 
 
 # -------------------------------------------------------
-# MAIN PROCESSOR
+# CLEAN STAGE (offline, from the raw cache)
 # -------------------------------------------------------
 
-def process_all_books():
-    with open(CSV_PATH, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-
-        for row in reader:
-            book_id = row["book_id"]
-            url = row["plain_text_url"]
+def clean_book(book_id: str, raw_dir: str = RAW_DIR, out_dir: str = OUT_DIR) -> str:
+    with open(raw_path(book_id, raw_dir), "r", encoding="utf-8", errors="replace") as f:
+        raw_text = f.read()
+
+    # EXTRACT INNER TEXT
+    extracted = extract_gutenberg_content(raw_text)
+
+    # CLEAN
+    cleaned = clean_text(extracted)
+
+    # SAVE
+    out_path = os.path.join(out_dir, f"{book_id}.txt")
+    atomic_write_text(out_path, cleaned)
+    return out_path
+
+def clean_all(book_ids: List[str], raw_dir: str = RAW_DIR, out_dir: str = OUT_DIR) -> int:
+    """Re-run extraction + cleaning over cached raw texts; no network needed."""
+    os.makedirs(out_dir, exist_ok=True)
+    done = 0
+    for book_id in book_ids:
+        if not raw_path(book_id, raw_dir).exists():
+            print(f"⚠️  {book_id}: not in the raw cache, skipped")
+            continue
+        try:
+            out_path = clean_book(book_id, raw_dir, out_dir)
+            done += 1
+            print(f"Saved cleaned book → {out_path}")
+        except Exception as e:
+            print(f"Error processing {book_id}: {e}")
+    return done
 
-            print(f"\n=== Processing Book {book_id} ===")
-            print(f"Downloading: {url}")
 
-            try:
-                # DOWNLOAD
-                raw_text = download_book(url)
-
-                # EXTRACT INNER TEXT
-                extracted = extract_gutenberg_content(raw_text)
-
-                # CLEAN
-                cleaned = clean_text(extracted)
-
-                # SAVE
-                out_path = os.path.join(OUT_DIR, f"{book_id}.txt")
-                with open(out_path, "w", encoding="utf-8") as out_file:
-                    out_file.write(cleaned)
-
-                print(f"Saved cleaned book → {out_path}")
+# -------------------------------------------------------
+# MAIN PROCESSOR
+# -------------------------------------------------------
 
-            except Exception as e:
-                print(f"Error processing {book_id}: {e}")
+def process_all_books(stage: str = "all", csv_path: str = CSV_PATH, raw_dir: str = RAW_DIR,
+                      out_dir: str = OUT_DIR, base_url: str = BASE_URL,
+                      workers: int = DOWNLOAD_WORKERS, revalidate: bool = True):
+    rows = read_catalogue(csv_path)
+    if stage in ("all", "download"):
+        download_all(rows, raw_dir, base_url, workers, revalidate)
+    if stage in ("all", "clean"):
+        n = clean_all([row["book_id"] for row in rows], raw_dir, out_dir)
+        print(f"\n🧹 Cleaned {n}/{len(rows)} books → {out_dir}")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Download Gutenberg books into data/raw and clean them into data/clean.")
+    ap.add_argument("--stage", choices=["all", "download", "clean"], default="all",
+                    help="clean: offline, from the raw cache only")
+    ap.add_argument("--csv", default=CSV_PATH)
+    ap.add_argument("--raw-dir", default=RAW_DIR)
+    ap.add_argument("--out-dir", default=OUT_DIR)
+    ap.add_argument("--base-url", default=BASE_URL,
+                    help="mirror to fetch from instead of the CSV's host (env PSYBOT_GUTENBERG_BASE)")
+    ap.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS)
+    ap.add_argument("--no-revalidate", action="store_true",
+                    help="trust cached raw files without a conditional request")
+    return ap.parse_args()
 
 
 if __name__ == "__main__":
-    process_all_books()
+    args = parse_args()
+    process_all_books(args.stage, args.csv, args.raw_dir, args.out_dir,
+                      args.base_url, args.workers, not args.no_revalidate)
     print("\nAll books downloaded, extracted, and cleaned.")
@@ -1,153 +1,549 @@
 import os
 import json
+import time
+import queue
+import argparse
+import threading
+import multiprocessing as mp
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 
+import numpy as np
 import torch
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 import chromadb
 from chromadb.config import Settings
 
+from corpus import CHUNKS_DIR, EMBED_STATS, iter_chunk_files, iter_chunks, load_skip_list
+import lexical
+import vector_store
+from manifest import FileManifest, atomic_write_text, file_digest, text_digest
+from retrieval_cache import mark_index_changed
+
 # -------------------- CONFIG --------------------
-CHUNKS_DIR = Path("data/chunks")          # .jsonl files with {"text", "book_id", ...}
 PERSIST_DIR = "chroma_db"                 # on-disk vector store
+MANIFEST_PATH = Path(PERSIST_DIR) / "index_manifest.json"   # per-file index state
+STATS_PATH = EMBED_STATS                  # last run's throughput (near_dedup.py, count_tokens.py)
 COLLECTION  = "psybot_multilingual"
 MODEL_NAME  = "intfloat/multilingual-e5-large"  # multilingual, retrieval-optimized
+MAX_SEQ_LENGTH = 512                      # E5 context length; keep consistent
+
+BATCH_SIZE = 512                          # passages per pipeline batch / upsert
+# Forward passes are sized by padded tokens (batch × longest passage), not by
+# count: ~128 full-length passages on an RTX A5000, many more short ones.
+TOKEN_BUDGET = 128 * MAX_SEQ_LENGTH
+CPU_TOKEN_BUDGET = 16 * MAX_SEQ_LENGTH    # per task handed to a CPU worker
+MAX_FORWARD_BATCH = 512                   # hard cap on passages per forward pass
+USE_FP16   = True                         # half precision on GPU (ignored on CPU)
+DEVICE     = "auto"                       # auto | cuda | cpu
+
+# CPU mode: N worker processes, each running torch with T intra-op threads.
+# Workers * threads ≈ physical cores usually beats one process on all cores.
+CPU_THREADS_PER_WORKER = 2
+CPU_WORKERS = max(1, (os.cpu_count() or 1) // CPU_THREADS_PER_WORKER)
 
-BATCH_SIZE = 128                          # RTX A5000 can handle this easily
-USE_FP16   = True                         # half precision on GPU
-DEVICE     = "cuda"                       # force GPU
+QUEUE_DEPTH = 4                           # batches buffered between pipeline stages
 
-# -------------------- SAFETY CHECKS --------------------
-assert torch.cuda.is_available(), "CUDA not available. Make sure nvidia-smi shows your GPU."
-print("GPU:", torch.cuda.get_device_name(0))
+# Set in main(): the model (GPU / single process) or the CPU worker pool,
+# and the target collection.
+model: Optional[SentenceTransformer] = None
+tokenizer = None
+cpu_pool: Optional["CPUEncoderPool"] = None
+collection = None
 
 # -------------------- MODEL --------------------
 # SentenceTransformer wraps pooling & tokenizer for this HF model.
 # E5 expects "passage: ..." for documents (and "query: ..." for queries).
-model_kwargs = {}
-if USE_FP16:
-    # will cast internal forward to fp16 where supported
-    model_kwargs["device"] = DEVICE
-else:
-    model_kwargs["device"] = DEVICE
+def resolve_device(device: str) -> str:
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cuda":
+        assert torch.cuda.is_available(), "CUDA not available. Make sure nvidia-smi shows your GPU."
+    return device
 
-model = SentenceTransformer(MODEL_NAME, **model_kwargs)
-model.max_seq_length = 512  # E5 context length; keep consistent
-print(f"Loaded model: {MODEL_NAME} | dim={model.get_sentence_embedding_dimension()}")
+def load_model(device: str, fp16: bool = USE_FP16) -> SentenceTransformer:
+    m = SentenceTransformer(MODEL_NAME, device=device)
+    m.max_seq_length = MAX_SEQ_LENGTH
+    if device == "cuda":
+        print("GPU:", torch.cuda.get_device_name(0))
+        if fp16:
+            m.half()  # fp16 forward pass; outputs are cast back to float32
+    print(f"Loaded model: {MODEL_NAME} on {device} | dim={m.get_sentence_embedding_dimension()}")
+    return m
 
-# -------------------- CHROMA --------------------
-client = chromadb.PersistentClient(
-    path=PERSIST_DIR,
-    settings=Settings(allow_reset=False)  # keep data
-)
-collection = client.get_or_create_collection(
-    name=COLLECTION,
-    metadata={"hnsw:space": "cosine"}  # cosine works with normalized embeddings
-)
+# -------------------- CPU WORKER POOL --------------------
+_worker_model: Optional[SentenceTransformer] = None
 
-# -------------------- HELPERS --------------------
-def iter_chunk_files():
-    files = sorted(CHUNKS_DIR.glob("*.jsonl"))
-    if not files:
-        raise FileNotFoundError(f"No JSONL chunk files in {CHUNKS_DIR.resolve()}")
-    return files
-
-def load_jsonl(fp: Path):
-    with fp.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            yield json.loads(line)
+def _init_cpu_worker(threads: int):
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(MODEL_NAME, device="cpu")
+    _worker_model.max_seq_length = MAX_SEQ_LENGTH
 
-def embed_passages(texts: List[str]):
-    # Prefix for E5 document embeddings
-    prefixed = [f"passage: {t}" for t in texts]
-    # normalize_embeddings=True gives unit vectors -> cosine ready
-    embs = model.encode(
+def _encode_in_worker(prefixed: List[str]):
+    t0 = time.perf_counter()
+    embs = _worker_model.encode(
         prefixed,
-        batch_size=BATCH_SIZE,
+        batch_size=len(prefixed),
         convert_to_numpy=True,
         normalize_embeddings=True,
         show_progress_bar=False
     )
-    if USE_FP16:
+    return os.getpid(), embs.astype("float32"), time.perf_counter() - t0
+
+class CPUEncoderPool:
+    """Spreads passage encoding over worker processes, one model copy each."""
+
+    def __init__(self, workers: int = CPU_WORKERS, threads: int = CPU_THREADS_PER_WORKER):
+        self.workers = workers
+        self.threads = threads
+        # spawn: torch + fork is not safe once threads exist
+        self.pool = mp.get_context("spawn").Pool(
+            workers, initializer=_init_cpu_worker, initargs=(threads,)
+        )
+        self.per_worker: Dict[int, List[float]] = {}   # pid -> [passages, seconds]
+        print(f"CPU pool: {workers} workers × {threads} threads")
+
+    def encode_batches(self, batches: List[List[str]]) -> List[np.ndarray]:
+        parts = []
+        # imap keeps task order, so vectors line up with the input batches
+        for pid, embs, secs in self.pool.imap(_encode_in_worker, batches):
+            stat = self.per_worker.setdefault(pid, [0, 0.0])
+            stat[0] += len(embs)
+            stat[1] += secs
+            parts.append(embs)
+        return parts
+
+    def report(self):
+        print("\nCPU worker throughput:")
+        total_n, total_s = 0, 0.0
+        for i, (pid, (n, secs)) in enumerate(sorted(self.per_worker.items()), 1):
+            print(f"  worker {i} (pid {pid}): {n:>8,} passages  {n / secs if secs else 0:8.1f} passages/sec")
+            total_n += n
+            total_s = max(total_s, secs)
+        if total_s:
+            print(f"  aggregate: ~{total_n / total_s:.1f} passages/sec")
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+# -------------------- CHROMA --------------------
+def open_collection():
+    client = chromadb.PersistentClient(
+        path=PERSIST_DIR,
+        settings=Settings(allow_reset=False)  # keep data
+    )
+    return client.get_or_create_collection(
+        name=COLLECTION,
+        metadata={"hnsw:space": "cosine"}  # cosine works with normalized embeddings
+    )
+
+# -------------------- HELPERS --------------------
+def get_tokenizer():
+    """The model's tokenizer (standalone in CPU-pool mode, where no model is loaded here)."""
+    global tokenizer
+    if tokenizer is None:
+        if model is not None:
+            tokenizer = model.tokenizer
+        else:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    return tokenizer
+
+def passage_lengths(texts: List[str]) -> np.ndarray:
+    """Tokenized length of each "passage: ..." input, capped at the model window."""
+    enc = get_tokenizer()(
+        [f"passage: {t}" for t in texts],
+        add_special_tokens=True,
+        truncation=True,
+        max_length=MAX_SEQ_LENGTH,
+    )
+    return np.fromiter((len(ids) for ids in enc["input_ids"]), dtype=np.int32, count=len(texts))
+
+def plan_batches(lengths: np.ndarray, token_budget: int = TOKEN_BUDGET,
+                 max_batch: int = MAX_FORWARD_BATCH) -> List[np.ndarray]:
+    """
+    Group passage indices into forward batches of similar length.
+
+    Indices are visited longest first, so each batch is padded to its
+    first member's length; a batch closes when one more passage would
+    push (size × that length) over `token_budget`.
+    """
+    order = np.argsort(-lengths, kind="stable")
+    batches, start = [], 0
+    while start < len(order):
+        longest = max(1, int(lengths[order[start]]))
+        size = max(1, min(max_batch, token_budget // longest, len(order) - start))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+def embed_passages(texts: List[str], lengths: Optional[np.ndarray] = None):
+    # Prefix for E5 document embeddings
+    prefixed = [f"passage: {t}" for t in texts]
+    if lengths is None:
+        lengths = passage_lengths(texts)
+
+    budget = CPU_TOKEN_BUDGET if cpu_pool is not None else TOKEN_BUDGET
+    plan = plan_batches(lengths, budget)
+    groups = [[prefixed[i] for i in idx] for idx in plan]
+
+    if cpu_pool is not None:
+        parts = cpu_pool.encode_batches(groups)
+    else:
+        # normalize_embeddings=True gives unit vectors -> cosine ready
+        parts = [
+            model.encode(
+                group,
+                batch_size=len(group),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            for group in groups
+        ]
+
+    # Scatter back into input order so vectors line up with ids
+    embs = np.empty((len(texts), parts[0].shape[1]), dtype="float32")
+    for idx, part in zip(plan, parts):
         # store as float32 for compatibility; vectors are normalized already
-        embs = embs.astype("float32")
+        embs[idx] = part
     return embs
 
-def already_inserted_ids(ids: List[str]) -> set:
-    """Check which ids exist to make the process idempotent."""
+def stored_ids_for_books(book_ids) -> set:
+    """
+    Every id Chroma holds for these books (only for files the manifest
+    doesn't know yet). Includes vectors stored under older id schemes,
+    e.g. the abs(hash(text)) ids of earlier indexer versions.
+    """
     existing = set()
-    # Chroma doesn’t have a direct bulk-exists API; we probe in chunks.
-    for i in range(0, len(ids), 1000):
-        batch = ids[i:i+1000]
-        res = collection.get(ids=batch, include=[])
-        if res and res.get("ids"):
-            existing.update(res["ids"])
+    for book_id in book_ids:
+        # older runs stored book_id as it came from the JSON (int or str)
+        values = {str(book_id)}
+        if str(book_id).isdigit():
+            values.add(int(book_id))
+        for value in values:
+            res = collection.get(where={"book_id": value}, include=[])
+            if res and res.get("ids"):
+                existing.update(res["ids"])
     return existing
 
-# -------------------- MAIN --------------------
-def main():
-    files = iter_chunk_files()
-    total_added = 0
+# -------------------- PIPELINE --------------------
+# reader (thread) -> encode (main thread) -> writer (thread), joined by
+# bounded queues. The reader fills batches across file boundaries; a file
+# is committed to the manifest by the writer once the batch holding its
+# last passage has been upserted.
 
-    for fp in tqdm(files, desc="Embedding & indexing"):
-        docs: List[str] = []
-        metas: List[Dict] = []
-        ids:   List[str] = []
+@dataclass
+class Batch:
+    ids:   List[str] = field(default_factory=list)
+    docs:  List[str] = field(default_factory=list)
+    metas: List[Dict] = field(default_factory=list)
+    lengths: Optional[np.ndarray] = None   # token counts, filled by the reader
+    embs:  Optional[np.ndarray] = None
+    deletes: List[str] = field(default_factory=list)   # ids to remove first
+    commits: List[Dict] = field(default_factory=list)  # files complete after this batch
 
-        for obj in load_jsonl(fp):
-            text = (obj.get("text") or "").strip()
-            if not text:
-                continue
-            # Build deterministic ID: <bookid>:<chunk_index or hash>
-            # Prefer provided "id"/"chunk_id" if present; else hash text.
-            cid = obj.get("id") or obj.get("chunk_id")
-            if not cid:
-                cid = str(abs(hash(text)) % (10**12))
-            book_id = str(obj.get("book_id") or fp.stem)
-            vec_id  = f"{book_id}:{cid}"
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0          # passages (or ids) handled
+        self.busy = 0.0         # seconds doing work
+        self.depth_sum = 0      # input queue depth, sampled per get
+        self.depth_max = 0
+        self.samples = 0
+
+    def sample(self, q: "queue.Queue"):
+        d = q.qsize()
+        self.depth_sum += d
+        self.depth_max = max(self.depth_max, d)
+        self.samples += 1
+
+    def line(self, wall: float) -> str:
+        rate = self.items / self.busy if self.busy else 0.0
+        util = self.busy / wall if wall else 0.0
+        depth = self.depth_sum / self.samples if self.samples else 0.0
+        return (f"  {self.name:<7} {self.items:>9,} items  {rate:9.1f}/s busy  "
+                f"{util:6.1%} util  in-queue avg {depth:4.1f} max {self.depth_max}")
 
+class Aborted(Exception):
+    pass
+
+def _put(q: "queue.Queue", item, abort: threading.Event):
+    while True:
+        if abort.is_set():
+            raise Aborted()
+        try:
+            q.put(item, timeout=0.2)
+            return
+        except queue.Full:
+            continue
+
+def _get(q: "queue.Queue", abort: threading.Event, stats: StageStats):
+    stats.sample(q)
+    while True:
+        if abort.is_set():
+            raise Aborted()
+        try:
+            return q.get(timeout=0.2)
+        except queue.Empty:
+            continue
+
+def reader_stage(files: List[Path], manifest: FileManifest, lock: threading.Lock,
+                 out_q: "queue.Queue", abort: threading.Event, stats: StageStats, counters: Dict):
+    batch = Batch()
+    skip_list = load_skip_list(CHUNKS_DIR)
+    for fp in files:
+        t0 = time.perf_counter()
+        # Near-duplicates dropped by near_dedup.py; a changed list re-diffs the file
+        skip = skip_list.get(fp.name)
+        dedup = text_digest(",".join(sorted(skip))) if skip else None
+        # Unchanged file (same size/mtime or same digest, same model): no Chroma traffic
+        with lock:
+            unchanged = manifest.unchanged(fp.name, fp, model=MODEL_NAME, dedup=dedup)
+            prev = manifest.get(fp.name)
+        if unchanged:
+            counters["skipped"] += 1
+            stats.busy += time.perf_counter() - t0
+            continue
+
+        digest = file_digest(fp)
+        ids, docs, metas = [], [], []
+        for vec_id, text, meta in iter_chunks(fp, skip):
             ids.append(vec_id)
             docs.append(text)
-            metas.append({k: v for k, v in obj.items() if k != "text"})
+            metas.append(meta)
 
-        if not ids:
-            continue
+        if prev is not None and prev.get("model") == MODEL_NAME:
+            # Diff against what we indexed last time for this file
+            known = set(prev.get("ids", []))
+        elif prev is None:
+            # Unknown file (first run with a manifest): ask Chroma what this
+            # book already has; ids it no longer produces (e.g. legacy
+            # hash ids) are deleted so they don't sit next to the new ones
+            book_ids = {str(m.get("book_id") or fp.stem) for m in metas} or {fp.stem}
+            stored = stored_ids_for_books(book_ids)
+            known = stored & set(ids)
+            batch.deletes.extend(stored - set(ids))
+        else:
+            known = set()   # model changed: re-embed everything
 
-        # Skip already present vector ids (idempotent)
-        exist = already_inserted_ids(ids)
-        if exist:
-            keep = [(i, d, m) for i, d, m in zip(ids, docs, metas) if i not in exist]
-            if not keep:
+        if prev is not None:
+            batch.deletes.extend(set(prev.get("ids", [])) - set(ids))
+
+        for i, d, m in zip(ids, docs, metas):
+            if i in known:
                 continue
-            ids, docs, metas = map(list, zip(*keep))
+            batch.ids.append(i)
+            batch.docs.append(d)
+            batch.metas.append(m)
+            stats.items += 1
+            if len(batch.ids) >= BATCH_SIZE:
+                # Tokenizing here keeps it off the encoder's critical path
+                batch.lengths = passage_lengths(batch.docs)
+                stats.busy += time.perf_counter() - t0
+                _put(out_q, batch, abort)
+                t0 = time.perf_counter()
+                batch = Batch()
+
+        # Committed by the writer after whatever batch now holds its tail
+        batch.commits.append({"name": fp.name, "path": fp, "digest": digest, "ids": ids, "dedup": dedup})
+        stats.busy += time.perf_counter() - t0
 
-        # Embed & upsert in batches
-        for i in range(0, len(docs), BATCH_SIZE):
-            batch_docs = docs[i:i+BATCH_SIZE]
-            batch_ids  = ids[i:i+BATCH_SIZE]
-            batch_meta = metas[i:i+BATCH_SIZE]
+    if batch.ids or batch.deletes or batch.commits:
+        if batch.docs:
+            batch.lengths = passage_lengths(batch.docs)
+        _put(out_q, batch, abort)
+    _put(out_q, None, abort)
 
-            embs = embed_passages(batch_docs)  # np.float32 (normalized)
+def encode_stage(in_q: "queue.Queue", out_q: "queue.Queue", abort: threading.Event,
+                 stats: StageStats, progress: tqdm):
+    while True:
+        batch = _get(in_q, abort, stats)
+        if batch is None:
+            _put(out_q, None, abort)
+            return
+        if batch.docs:
+            t0 = time.perf_counter()
+            batch.embs = embed_passages(batch.docs, batch.lengths)  # np.float32 (normalized)
+            stats.busy += time.perf_counter() - t0
+            stats.items += len(batch.docs)
+            progress.update(len(batch.docs))
+        _put(out_q, batch, abort)
+
+def writer_stage(in_q: "queue.Queue", manifest: FileManifest, lock: threading.Lock,
+                 abort: threading.Event, stats: StageStats, counters: Dict):
+    while True:
+        batch = _get(in_q, abort, stats)
+        if batch is None:
+            return
+        t0 = time.perf_counter()
+        for i in range(0, len(batch.deletes), 1000):
+            collection.delete(ids=batch.deletes[i:i+1000])
+        counters["deleted"] += len(batch.deletes)
+
+        if batch.ids:
             collection.upsert(
-                ids=batch_ids,
-                documents=batch_docs,
-                embeddings=embs,
-                metadatas=batch_meta,
+                ids=batch.ids,
+                documents=batch.docs,
+                embeddings=batch.embs,
+                metadatas=batch.metas,
             )
-            total_added += len(batch_ids)
+            counters["added"] += len(batch.ids)
+            stats.items += len(batch.ids)
+
+        # Record files only once all their vectors are in
+        if batch.commits:
+            with lock:
+                for c in batch.commits:
+                    manifest.record(c["name"], c["path"], digest=c["digest"],
+                                    model=MODEL_NAME, ids=c["ids"], dedup=c["dedup"])
+                manifest.save()
+        stats.busy += time.perf_counter() - t0
+
+def run_pipeline(files: List[Path], manifest: FileManifest) -> Dict:
+    lock = threading.Lock()
+    abort = threading.Event()
+    encode_q: "queue.Queue" = queue.Queue(maxsize=QUEUE_DEPTH)
+    write_q:  "queue.Queue" = queue.Queue(maxsize=QUEUE_DEPTH)
+    counters = {"added": 0, "deleted": 0, "skipped": 0}
+    stats = {n: StageStats(n) for n in ("read", "encode", "write")}
+    errors: List[BaseException] = []
+
+    def guarded(fn, *a):
+        def run():
+            try:
+                fn(*a)
+            except Aborted:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                abort.set()
+        return run
+
+    reader = threading.Thread(target=guarded(reader_stage, files, manifest, lock, encode_q,
+                                             abort, stats["read"], counters), name="index-reader")
+    writer = threading.Thread(target=guarded(writer_stage, write_q, manifest, lock,
+                                             abort, stats["write"], counters), name="index-writer")
+    t0 = time.perf_counter()
+    reader.start()
+    writer.start()
+    with tqdm(desc="Embedding & indexing", unit="passage") as progress:
+        try:
+            guarded(encode_stage, encode_q, write_q, abort, stats["encode"], progress)()
+        finally:
+            reader.join()
+            writer.join()
+    wall = time.perf_counter() - t0
+
+    if errors:
+        raise errors[0]
+
+    print(f"\nPipeline ({wall:.1f}s wall):")
+    for st in stats.values():
+        print(st.line(wall))
+    busiest = max(stats.values(), key=lambda st: st.busy)
+    print(f"  bottleneck: {busiest.name}")
+    enc = stats["encode"]
+    if enc.items:
+        # Lets near_dedup.py turn "vectors skipped" into "embedding time saved"
+        atomic_write_text(STATS_PATH, json.dumps({
+            "model": MODEL_NAME,
+            "passages": enc.items,
+            "passages_per_sec": enc.items / wall,
+            "encode_passages_per_sec": enc.items / enc.busy if enc.busy else None,
+            "at": time.time(),
+        }))
+    with lock:
+        manifest.save()   # persists stat refreshes of touched-but-identical files
+    return counters
+
+# -------------------- MAIN --------------------
+def parse_args():
+    ap = argparse.ArgumentParser(description="Embed data/chunks into Chroma.")
+    ap.add_argument("--device", default=DEVICE, choices=["auto", "cuda", "cpu"])
+    ap.add_argument("--workers", type=int, default=CPU_WORKERS,
+                    help="CPU mode: encoder processes (1 = encode in this process)")
+    ap.add_argument("--threads", type=int, default=CPU_THREADS_PER_WORKER,
+                    help="CPU mode: torch threads per worker process")
+    ap.add_argument("--no-fp16", action="store_true", help="GPU mode: keep fp32 weights")
+    ap.add_argument("--no-lexical", action="store_true",
+                    help="don't rebuild the BM25 index used for hybrid search")
+    ap.add_argument("--no-export", action="store_true",
+                    help="don't refresh the NumPy export used by the exact-search backend")
+    ap.add_argument("--rescan", action="store_true",
+                    help="ignore the manifest and re-check every file against Chroma")
+    return ap.parse_args()
+
+def main():
+    global model, cpu_pool, collection
+    args = parse_args()
+
+    device = resolve_device(args.device)
+    if device == "cpu" and args.workers > 1:
+        cpu_pool = CPUEncoderPool(workers=args.workers, threads=args.threads)
+    else:
+        if device == "cpu":
+            torch.set_num_threads(args.threads)
+        model = load_model(device, fp16=USE_FP16 and not args.no_fp16)
+    collection = open_collection()
+
+    files = iter_chunk_files()
+    manifest = FileManifest(MANIFEST_PATH)
+    if args.rescan:
+        manifest.entries.clear()
+    total_deleted = 0
+    t_start = time.perf_counter()
+
+    # Files that vanished from data/chunks: drop their vectors
+    present = {fp.name for fp in files}
+    for name in manifest.keys():
+        if name not in present:
+            old_ids = manifest.drop(name).get("ids", [])
+            for i in range(0, len(old_ids), 1000):
+                collection.delete(ids=old_ids[i:i+1000])
+            total_deleted += len(old_ids)
+            manifest.save()
+            print(f"Removed {len(old_ids)} vectors of deleted file {name}")
+
+    counters = run_pipeline(files, manifest)
+    total_added = counters["added"]
+    total_deleted += counters["deleted"]
+    skipped = counters["skipped"]
+
+    # BM25 side of hybrid search, over the same chunks and ids
+    if not args.no_lexical and (total_added or total_deleted
+                                or not (lexical.LEXICAL_DIR / "meta.json").exists()):
+        meta = lexical.build_index(CHUNKS_DIR, lexical.LEXICAL_DIR)
+        print(f"Lexical index: {meta['n_docs']:,} docs, {meta['n_terms']:,} terms "
+              f"({meta['seconds']:.1f}s) → {lexical.LEXICAL_DIR}")
+
+    # Contiguous float32 matrix + id/offset table for the NumPy backend
+    if not args.no_export and (total_added or total_deleted
+                               or not (vector_store.VECTOR_DIR / "meta.json").exists()):
+        meta = vector_store.export_numpy(collection, vector_store.VECTOR_DIR,
+                                         model=MODEL_NAME, collection=COLLECTION)
+        print(f"NumPy export: {meta['n']:,} × {meta['dim']} ({meta['seconds']:.1f}s) → {vector_store.VECTOR_DIR}")
+
+    if total_added or total_deleted:
+        # Tell running retrievers their cached hits are stale
+        mark_index_changed(PERSIST_DIR)
 
-        # Persist after each file to be safe
-        # (PersistentClient commits automatically, this is just a log)
-        print(f"Indexed {len(ids)} from {fp.name} (total so far: {total_added})")
+    elapsed = time.perf_counter() - t_start
+    if cpu_pool is not None:
+        cpu_pool.report()
+        cpu_pool.close()
 
     print("\n✅ Done.")
     print(f"Chroma path: {Path(PERSIST_DIR).resolve()}")
     print(f"Collection:  {COLLECTION}")
     print(f"Total new vectors: {total_added}")
+    print(f"Deleted vectors:   {total_deleted}")
+    print(f"Unchanged files:   {skipped}/{len(files)}")
+    print(f"Elapsed: {elapsed:.1f}s ({total_added / elapsed if elapsed else 0:.1f} passages/sec)")
 
 if __name__ == "__main__":
     main()
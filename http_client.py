@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from manifest import atomic_write_text
+
+# Shared HTTP plumbing for the downloader and the scraper: one pooled
+# session with status retries, and an on-disk cache where each file has a
+# <name>.meta.json sidecar holding its validators (ETag / Last-Modified)
+# so reruns send conditional requests, and interrupted downloads resume
+# from <name>.part with a Range request.
+
+PathLike = Union[str, Path]
+
+USER_AGENT = "Mozilla/5.0"
+POOL_SIZE = 16                 # keep-alive connections per host
+TIMEOUT = 30                   # seconds, connect and read
+RETRIES = 4
+BACKOFF = 0.5                  # seconds, doubled per attempt (plus jitter)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 1 << 16
+
+
+# -------------------- SESSION --------------------
+
+def make_session(pool_size: int = POOL_SIZE, retries: int = RETRIES,
+                 backoff: float = BACKOFF) -> requests.Session:
+    """Session with a shared connection pool; 429/5xx are retried with backoff (honouring Retry-After)."""
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT})
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# -------------------- CACHE --------------------
+
+@dataclass
+class FetchResult:
+    path: Path
+    status: str          # fetched | resumed | not_modified | cached
+    bytes: int = 0       # body bytes transferred by this call
+    seconds: float = 0.0
+
+def _meta_path(path: Path) -> Path:
+    return path.with_name(path.name + ".meta.json")
+
+def read_cache_meta(path: PathLike) -> Dict:
+    meta = _meta_path(Path(path))
+    if not meta.exists():
+        return {}
+    try:
+        return json.loads(meta.read_text(encoding="utf-8"))
+    except ValueError:
+        return {}
+
+def _write_cache_meta(path: Path, meta: Dict):
+    atomic_write_text(_meta_path(path), json.dumps(meta))
+
+def _validators(resp: requests.Response) -> Dict:
+    return {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+
+class IncompleteBody(requests.ConnectionError):
+    """Body shorter than Content-Length: retried (and resumed) like a dropped connection."""
+
+
+def fetch_to_cache(session: requests.Session, url: str, path: PathLike, *,
+                   revalidate: bool = True, timeout: float = TIMEOUT,
+                   retries: int = RETRIES, backoff: float = BACKOFF) -> FetchResult:
+    """
+    Make `path` hold the current body of `url`.
+
+    - cached copy + revalidate=False → no request at all
+    - cached copy → conditional GET; 304 leaves the file untouched
+    - leftover <path>.part from an interrupted run → Range request guarded by
+      If-Range, so a changed resource restarts instead of being spliced
+    - dropped connections / short bodies → retried with jittered exponential
+      backoff, resuming from the bytes already on disk
+
+    4xx responses raise immediately; 429/5xx are retried by the session.
+    """
+    path = Path(path)
+    part = path.with_name(path.name + ".part")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    meta = read_cache_meta(path)
+    if meta.get("url") != url:
+        meta = {"url": url}
+
+    have_copy = path.exists() and "size" in meta
+    if have_copy and not revalidate:
+        return FetchResult(path, "cached")
+
+    transferred = 0
+    resumed_any = False
+    for attempt in range(retries + 1):
+        headers = {}
+        if have_copy:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        part_validators = meta.get("part") or {}
+        offset = part.stat().st_size if part.exists() else 0
+        if offset and (part_validators.get("etag") or part_validators.get("last_modified")):
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = part_validators.get("etag") or part_validators["last_modified"]
+            # byte offsets refer to the identity encoding
+            headers["Accept-Encoding"] = "identity"
+        else:
+            offset = 0
+
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as resp:
+                if resp.status_code == 304:
+                    if part.exists():
+                        # the copy we have is current; drop a stale partial update
+                        part.unlink()
+                        meta.pop("part", None)
+                        _write_cache_meta(path, meta)
+                    return FetchResult(path, "not_modified", 0, time.perf_counter() - t0)
+                if resp.status_code == 416 and offset:
+                    # .part doesn't fit the resource any more: start over
+                    part.unlink(missing_ok=True)
+                    meta.pop("part", None)
+                    continue
+                resp.raise_for_status()
+
+                resumed = resp.status_code == 206
+                resumed_any = resumed_any or resumed
+                if not resumed:
+                    offset = 0
+                    meta["part"] = _validators(resp)
+                    _write_cache_meta(path, meta)
+
+                expected = None
+                if not resp.headers.get("Content-Encoding") and resp.headers.get("Content-Length"):
+                    expected = int(resp.headers["Content-Length"])
+
+                written = 0
+                with open(part, "ab" if resumed else "wb") as f:
+                    for block in resp.iter_content(CHUNK_SIZE):
+                        f.write(block)
+                        written += len(block)
+                        transferred += len(block)
+                if expected is not None and written < expected:
+                    raise IncompleteBody(f"{url}: got {written} of {expected} bytes")
+
+            os.replace(part, path)
+            meta.pop("part", None)
+            meta.update(_validators(resp))
+            meta.update({"size": path.stat().st_size, "fetched_at": time.time()})
+            _write_cache_meta(path, meta)
+            status = "resumed" if resumed_any else "fetched"
+            return FetchResult(path, status, transferred, time.perf_counter() - t0)
+
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+    raise requests.ConnectionError(f"{url}: gave up after {retries + 1} attempts")
@@ -0,0 +1,67 @@
+import threading
+from functools import lru_cache
+from typing import Optional
+
+from lingua import Language, LanguageDetectorBuilder
+
+# -------------------------------------------------------
+# LANGUAGES OF THE CORPUS
+# -------------------------------------------------------
+# Shared by the preprocessor (tags each book) and the retriever (routes
+# each query to the matching language partition).
+
+LANGUAGES = [
+    Language.ENGLISH,
+    Language.GERMAN,
+    Language.FRENCH,
+    Language.DUTCH,
+    Language.ITALIAN,
+    Language.SPANISH,
+    Language.SWEDISH,
+    Language.DANISH,
+    Language.PORTUGUESE,
+    Language.FINNISH,
+    Language.POLISH,
+    Language.CZECH,
+    Language.LATIN,
+]
+
+# Below this confidence a query is treated as language-neutral
+QUERY_MIN_CONFIDENCE = 0.5
+QUERY_CACHE_SIZE = 4096
+
+
+def build_detector():
+    return LanguageDetectorBuilder.from_languages(*LANGUAGES).build()
+
+
+def iso_code(lang) -> str:
+    return lang.iso_code_639_1.name.lower() if lang else "unknown"
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+def get_detector():
+    """Process-wide detector, built on first use (it is slow to construct)."""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = build_detector()
+    return _detector
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def detect_query_language(text: str) -> Optional[str]:
+    """
+    ISO 639-1 code of a chat message, or None when the detector isn't
+    confident enough (short greetings, mixed-language messages).
+    """
+    text = text.strip()
+    if not text:
+        return None
+    values = get_detector().compute_language_confidence_values(text)
+    if not values or values[0].value < QUERY_MIN_CONFIDENCE:
+        return None
+    return iso_code(values[0].language)
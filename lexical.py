@@ -0,0 +1,223 @@
+import re
+import json
+import time
+import hashlib
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from corpus import CHUNKS_DIR, iter_chunk_files, iter_chunks, load_skip_list
+from manifest import atomic_dir
+
+# -------------------- CONFIG --------------------
+LEXICAL_DIR = Path("lexical_index")   # sits next to chroma_db
+BM25_K1 = 1.2
+BM25_B = 0.75
+MIN_TOKEN_LEN = 2
+
+# On-disk layout (all .npy files are opened with mmap_mode="r"):
+#   term_hash.npy  uint64[V]    sorted 64-bit hashes of the vocabulary
+#   term_ptr.npy   int64[V+1]   CSR offsets into the postings arrays
+#   post_doc.npy   int32[P]     document row of each posting
+#   post_tf.npy    uint16[P]    term frequency of each posting
+#   doc_len.npy    int32[N]     tokens per document
+#   doc_ids.json                vector id (same as Chroma) per document row
+#   doc_lang.json               chunk "lang" per document row
+#   meta.json                   N, avgdl, build time
+
+
+# -------------------- TOKENIZER --------------------
+# Unicode word runs after NFKC + casefold, so "Nachträglichkeit" and
+# "NACHTRÄGLICHKEIT" are the same term; no stemming, so exact technical
+# vocabulary stays distinct.
+
+_word = re.compile(r"\w+", flags=re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return [t for t in _word.findall(text) if len(t) >= MIN_TOKEN_LEN and not t.isdigit()]
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# -------------------- BUILD --------------------
+
+def build_index(chunks_dir: Path = CHUNKS_DIR, out_dir: Path = LEXICAL_DIR) -> Dict:
+    """Build the BM25 index for every chunk file and swap it into `out_dir`."""
+    t0 = time.perf_counter()
+    hash_of: Dict[str, int] = {}
+    doc_ids: List[str] = []
+    doc_lang: List[str] = []
+    doc_len: List[int] = []
+    # Per-document (term hash, tf) arrays, concatenated once at the end
+    post_terms: List[np.ndarray] = []
+    post_docs: List[np.ndarray] = []
+    post_tfs: List[np.ndarray] = []
+
+    skip = load_skip_list(chunks_dir)   # same near-duplicates embed.py leaves out
+    for fp in iter_chunk_files(chunks_dir):
+        for vec_id, text, meta in iter_chunks(fp, skip.get(fp.name)):
+            toks = tokenize(text)
+            row = len(doc_ids)
+            doc_ids.append(vec_id)
+            doc_lang.append(str(meta.get("lang") or "unknown"))
+            doc_len.append(len(toks))
+            if not toks:
+                continue
+            hashes = np.fromiter(
+                (hash_of[t] if t in hash_of else hash_of.setdefault(t, term_hash(t)) for t in toks),
+                dtype=np.uint64, count=len(toks),
+            )
+            uniq, tf = np.unique(hashes, return_counts=True)
+            post_terms.append(uniq)
+            post_docs.append(np.full(len(uniq), row, dtype=np.int32))
+            post_tfs.append(np.minimum(tf, np.iinfo(np.uint16).max).astype(np.uint16))
+
+    terms = np.concatenate(post_terms) if post_terms else np.zeros(0, dtype=np.uint64)
+    docs = np.concatenate(post_docs) if post_docs else np.zeros(0, dtype=np.int32)
+    tfs = np.concatenate(post_tfs) if post_tfs else np.zeros(0, dtype=np.uint16)
+    del post_terms, post_docs, post_tfs
+
+    # Group postings by term (stable, so doc rows stay ascending inside a term)
+    order = np.argsort(terms, kind="stable")
+    terms, docs, tfs = terms[order], docs[order], tfs[order]
+    vocab, starts = np.unique(terms, return_index=True)
+    ptr = np.append(starts, len(terms)).astype(np.int64)
+
+    lens = np.asarray(doc_len, dtype=np.int32)
+    meta = {
+        "n_docs": len(doc_ids),
+        "n_terms": int(len(vocab)),
+        "n_postings": int(len(terms)),
+        "avgdl": float(lens.mean()) if len(lens) else 0.0,
+        "built_at": time.time(),
+    }
+
+    # Write to a sibling temp dir, then swap, so readers never see half an index
+    with atomic_dir(out_dir) as tmp_dir:
+        np.save(tmp_dir / "term_hash.npy", vocab)
+        np.save(tmp_dir / "term_ptr.npy", ptr)
+        np.save(tmp_dir / "post_doc.npy", docs)
+        np.save(tmp_dir / "post_tf.npy", tfs)
+        np.save(tmp_dir / "doc_len.npy", lens)
+        (tmp_dir / "doc_ids.json").write_text(json.dumps(doc_ids), encoding="utf-8")
+        (tmp_dir / "doc_lang.json").write_text(json.dumps(doc_lang), encoding="utf-8")
+        (tmp_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    meta["seconds"] = time.perf_counter() - t0
+    return meta
+
+
+# -------------------- SEARCH --------------------
+
+class LexicalIndex:
+    """Read-only BM25 index over memory-mapped postings."""
+
+    def __init__(self, index_dir: Path = LEXICAL_DIR, k1: float = BM25_K1, b: float = BM25_B):
+        # Read one version throughout: index_dir is a symlink a rebuild repoints
+        self.index_dir = Path(index_dir)
+        index_dir = self.index_dir.resolve()
+        self.k1 = k1
+        self.b = b
+        self.meta = json.loads((index_dir / "meta.json").read_text(encoding="utf-8"))
+        self.stamp = (index_dir / "meta.json").stat().st_mtime_ns
+
+        self.term_hash = np.load(index_dir / "term_hash.npy", mmap_mode="r")
+        self.term_ptr = np.load(index_dir / "term_ptr.npy", mmap_mode="r")
+        self.post_doc = np.load(index_dir / "post_doc.npy", mmap_mode="r")
+        self.post_tf = np.load(index_dir / "post_tf.npy", mmap_mode="r")
+        doc_len = np.load(index_dir / "doc_len.npy", mmap_mode="r")
+        self.doc_ids: List[str] = json.loads((index_dir / "doc_ids.json").read_text(encoding="utf-8"))
+        self.doc_lang: List[str] = json.loads((index_dir / "doc_lang.json").read_text(encoding="utf-8"))
+
+        self._lang_masks: Dict[str, np.ndarray] = {}
+
+        self.n_docs = int(self.meta["n_docs"])
+        avgdl = self.meta["avgdl"] or 1.0
+        # Length normalisation term of BM25, precomputed once per document
+        self.norm = (self.k1 * (1 - self.b + self.b * np.asarray(doc_len, dtype=np.float32) / avgdl)).astype(np.float32)
+
+    @classmethod
+    def open(cls, index_dir: Path = LEXICAL_DIR) -> Optional["LexicalIndex"]:
+        """Load the index if one has been built, else None."""
+        if not (Path(index_dir) / "meta.json").exists():
+            return None
+        return cls(index_dir)
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return (self.index_dir / "meta.json").stat().st_mtime_ns != self.stamp
+        except FileNotFoundError:
+            return False
+
+    def lang_mask(self, lang: str) -> Optional[np.ndarray]:
+        """Boolean row mask of one language partition (None if absent)."""
+        mask = self._lang_masks.get(lang)
+        if mask is None:
+            mask = np.fromiter((l == lang for l in self.doc_lang), dtype=bool, count=len(self.doc_lang))
+            if not mask.any():
+                return None
+            self._lang_masks[lang] = mask
+        return mask
+
+    def search(self, query: str, k: int = 20, rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (vector id, BM25 score). `rows`, if given, is a boolean mask
+        over documents restricting the search to a subset.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.n_docs:
+            return []
+        hashes = np.array(sorted(term_hash(t) for t in terms), dtype=np.uint64)
+        pos = np.searchsorted(self.term_hash, hashes)
+        found = pos < len(self.term_hash)
+        found[found] = self.term_hash[pos[found]] == hashes[found]
+        pos = pos[found]
+        if not len(pos):
+            return []
+
+        doc_parts, score_parts = [], []
+        for p in pos:
+            lo, hi = int(self.term_ptr[p]), int(self.term_ptr[p + 1])
+            df = hi - lo
+            idf = np.log((self.n_docs - df + 0.5) / (df + 0.5) + 1.0)
+            d = np.asarray(self.post_doc[lo:hi])
+            tf = np.asarray(self.post_tf[lo:hi], dtype=np.float32)
+            doc_parts.append(d)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + self.norm[d]))
+
+        d = np.concatenate(doc_parts)
+        w = np.concatenate(score_parts)
+        if rows is not None:
+            keep = rows[d]
+            d, w = d[keep], w[keep]
+            if not len(d):
+                return []
+        # Sum per document over touched rows only
+        uniq, inv = np.unique(d, return_inverse=True)
+        scores = np.bincount(inv, weights=w).astype(np.float32)
+
+        k = min(k, len(uniq))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[uniq[i]], float(scores[i])) for i in top]
+
+
+# -------------------- FUSION --------------------
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Reciprocal-rank fusion: score(id) = Σ 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+if __name__ == "__main__":
+    meta = build_index()
+    print(f"✅ Lexical index: {meta['n_docs']:,} docs, {meta['n_terms']:,} terms, "
+          f"{meta['n_postings']:,} postings in {meta['seconds']:.1f}s → {LEXICAL_DIR.resolve()}")
@@ -0,0 +1,178 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+PathLike = Union[str, Path]
+
+
+# -------------------- DIGESTS --------------------
+
+def file_digest(path: PathLike, block_size: int = 1 << 20) -> str:
+    """sha256 of a file's bytes, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_digest(text: str, length: int = 16) -> str:
+    """Stable short content hash (unlike hash(), not salted per process)."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:length]
+
+
+def file_stat(path: PathLike) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+# -------------------- ATOMIC WRITES --------------------
+
+def atomic_write_text(path: PathLike, text: str, encoding: str = "utf-8"):
+    """Write via a temp file in the same directory + os.replace."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding=encoding) as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def atomic_writer(path: PathLike, mode: str = "w", encoding: Optional[str] = "utf-8"):
+    """
+    File handle for incremental writes that only replaces `path` if the
+    block exits cleanly; readers see either the old file or the new one.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def atomic_dir(path: PathLike) -> Iterator[Path]:
+    """
+    New versioned directory (<name>.v<ns>) to build `path` in. On a clean
+    exit `path`, a symlink, is repointed at it with a single os.replace, so
+    a reader that resolves `path` once sees either the old tree or the new
+    one, never a gap. The previous version stays for readers still opening
+    it; older ones are removed.
+    """
+    path = Path(path)
+    version = path.with_name(f"{path.name}.v{time.time_ns()}")
+    version.mkdir(parents=True)
+    try:
+        yield version
+    except BaseException:
+        shutil.rmtree(version, ignore_errors=True)
+        raise
+
+    previous = os.readlink(path) if path.is_symlink() else None
+    legacy = path.with_name(path.name + ".old")
+    if path.is_dir() and not path.is_symlink():
+        # a plain directory from before versioned builds: moved aside once
+        shutil.rmtree(legacy, ignore_errors=True)
+        os.replace(path, legacy)
+    link = path.with_name(path.name + ".link")
+    if link.is_symlink():
+        link.unlink()
+    os.symlink(version.name, link, target_is_directory=True)
+    os.replace(link, path)
+
+    shutil.rmtree(legacy, ignore_errors=True)
+    for old in path.parent.glob(f"{path.name}.v*"):
+        if old.name not in (version.name, previous):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+# -------------------- MANIFEST --------------------
+
+class FileManifest:
+    """
+    JSON map of artifact name -> entry, where each entry records at least
+    the file's size, mtime and content digest at the time it was processed.
+
+    `unchanged()` answers "can I skip this file?" cheaply: a matching
+    size + mtime is trusted outright; otherwise the digest is recomputed
+    and compared, so a touched-but-identical file is still skipped.
+    """
+
+    def __init__(self, path: PathLike, entries: Optional[Dict[str, Dict]] = None):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict] = {}
+        if entries is not None:
+            # a worker's view of a few entries, handed over by the owning process
+            self.entries = dict(entries)
+        elif self.path.exists():
+            with self.path.open("r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("files", {})
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.entries.get(key)
+
+    def set(self, key: str, entry: Dict):
+        self.entries[key] = entry
+
+    def drop(self, key: str) -> Optional[Dict]:
+        return self.entries.pop(key, None)
+
+    def keys(self) -> Iterator[str]:
+        return iter(list(self.entries))
+
+    def unchanged(self, key: str, path: PathLike, **expect) -> bool:
+        """
+        True if `path` still matches the stored entry and every extra
+        field in `expect` (e.g. model=..., params=...) is equal.
+        Refreshes the stored stat when only the mtime moved.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if any(entry.get(k) != v for k, v in expect.items()):
+            return False
+        stat = file_stat(path)
+        if entry.get("size") == stat["size"] and entry.get("mtime_ns") == stat["mtime_ns"]:
+            return True
+        if entry.get("size") != stat["size"]:
+            return False
+        if entry.get("digest") != file_digest(path):
+            return False
+        entry.update(stat)
+        return True
+
+    def record(self, key: str, path: PathLike, digest: Optional[str] = None,
+               stat: Optional[Dict[str, int]] = None, **fields):
+        """
+        Store stat + digest of `path` (plus any extra fields) under `key`.
+        Pass `stat` and `digest` taken before the work to record what it read.
+        """
+        entry = dict(stat or file_stat(path))
+        entry["digest"] = digest or file_digest(path)
+        entry.update(fields)
+        self.entries[key] = entry
+
+    def save(self):
+        atomic_write_text(self.path, json.dumps({"files": self.entries}, ensure_ascii=False))
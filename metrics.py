@@ -0,0 +1,310 @@
+import os
+import json
+import math
+import time
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# In-process metrics for the web app: counters, gauges and histograms kept
+# in memory and rendered in the Prometheus text format at /metrics, plus
+# structured (one JSON object per line) logging. `span()` times one stage
+# of the chat path into psybot_stage_seconds{stage} and logs it, tagged
+# with the id of the request it belongs to.
+
+# ---------- CONFIG ----------
+LOG_LEVEL = os.getenv("PSYBOT_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("PSYBOT_LOG_FORMAT", "json")    # json | text
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelKey = Tuple[str, ...]
+
+
+# ---------- METRIC TYPES ----------
+
+class Metric:
+    """A named family of samples, one per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values: Dict[LabelKey, object] = {}
+        self._fn: Optional[Callable[[], object]] = None
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def set_function(self, fn: Callable[[], object]):
+        """
+        Read the value at scrape time instead: `fn()` returns a number, or
+        for labelled metrics a {label values tuple: number} dict. For state
+        another object already counts (queue sizes, cache stats).
+        """
+        self._fn = fn
+
+    def _current(self) -> Dict[LabelKey, object]:
+        if self._fn is None:
+            with self._lock:
+                return dict(self._values)
+        try:
+            value = self._fn()
+        except Exception:
+            return {}
+        return value if isinstance(value, dict) else {(): value}
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for key, value in sorted(self._current().items()):
+            yield self.name, dict(zip(self.labelnames, key)), float(value)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError("counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Cumulative buckets + sum + count per label set, like a Prometheus histogram."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {k: (list(c), s) for k, (c, s) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            running = 0
+            for le, c in zip(list(self.buckets) + [math.inf], counts):
+                running += c
+                yield f"{self.name}_bucket", {**labels, "le": _fmt(le)}, float(running)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, float(running)
+
+
+# ---------- REGISTRY ----------
+
+def _fmt(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v))
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Everything, in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{body}}} {_fmt(value)}")
+                else:
+                    lines.append(f"{name} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labels))
+
+def histogram(name: str, help: str, labels: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+# ---------- APP METRICS ----------
+REQUESTS = counter("psybot_requests_total", "HTTP requests by route and status code.", ("route", "status"))
+REQUEST_ERRORS = counter("psybot_request_errors_total", "Failed requests by route and error.", ("route", "error"))
+REQUEST_SECONDS = histogram("psybot_request_seconds", "Time to response headers, by route.", ("route",))
+STAGE_SECONDS = histogram("psybot_stage_seconds", "Time spent in each stage of the chat path.", ("stage",))
+LLM_TOKENS = counter("psybot_llm_tokens_total", "LLM tokens used, by direction.", ("kind",))
+CACHE_LOOKUPS = counter("psybot_retrieval_cache_lookups_total", "Retrieval cache lookups by result.", ("result",))
+ENCODER_BATCHES = counter("psybot_query_encoder_batches_total", "Forward passes run by the query encoder.")
+ENCODER_QUERIES = counter("psybot_query_encoder_queries_total", "Queries encoded by the query encoder.")
+QUEUE_DEPTH = gauge("psybot_reply_queue_depth", "Inbound messages waiting for a reply worker.")
+REPLY_MESSAGES = counter("psybot_reply_messages_total", "Async reply pool messages by outcome.", ("result",))
+
+
+def record_llm_usage(result) -> Dict[str, int]:
+    """
+    Count a pydantic-ai run's token usage; returns it for the span/log line.
+    Best-effort: accounting problems are logged, never raised into the reply.
+    """
+    try:
+        # a method in some pydantic-ai versions, a property in others
+        usage = getattr(result, "usage", None)
+        if callable(usage):
+            usage = usage()
+        tokens = {
+            # input_tokens/output_tokens in newer pydantic-ai, request_/response_ before
+            "input": getattr(usage, "input_tokens", None) or getattr(usage, "request_tokens", None) or 0,
+            "output": getattr(usage, "output_tokens", None) or getattr(usage, "response_tokens", None) or 0,
+        }
+        for kind, n in tokens.items():
+            if n:
+                LLM_TOKENS.inc(n, kind=kind)
+    except Exception as e:
+        log_event("llm_usage_failed", level=logging.WARNING, error=f"{type(e).__name__}: {e}")
+        return {}
+    return {f"{kind}_tokens": n for kind, n in tokens.items()}
+
+
+# ---------- STRUCTURED LOGGING ----------
+log = logging.getLogger("psybot")
+_request_id: contextvars.ContextVar = contextvars.ContextVar("psybot_request_id", default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, event, request_id + the call's fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        rid = _request_id.get()
+        if rid:
+            out["request_id"] = rid
+        out.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """`event key=value ...` for reading logs in a terminal."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = dict(getattr(record, "fields", {}))
+        rid = _request_id.get()
+        if rid:
+            fields = {"request_id": rid, **fields}
+        line = " ".join([record.levelname, record.getMessage()] + [f"{k}={v}" for k, v in fields.items()])
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Send psybot's log lines to stderr (idempotent). Scripts that never call this stay quiet."""
+    if any(getattr(h, "_psybot", False) for h in log.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    handler._psybot = True
+    log.addHandler(handler)
+    log.setLevel(level.upper())
+    log.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, exc_info: bool = False, **fields):
+    if log.isEnabledFor(level):
+        log.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+
+@contextmanager
+def bind_request_id(rid: str):
+    """Tag every log line (and span) inside the block with this request id."""
+    token = _request_id.set(rid)
+    try:
+        yield rid
+    finally:
+        _request_id.reset(token)
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+def mask_sender(sender: Optional[str]) -> Optional[str]:
+    """Phone numbers stay out of the logs: "whatsapp:+34600123456" → "whatsapp:…3456"."""
+    if not sender:
+        return sender
+    channel, _, number = sender.rpartition(":")
+    return f"{channel + ':' if channel else ''}…{number[-4:]}"
+
+
+# ---------- SPANS ----------
+
+@contextmanager
+def span(stage: str, **fields):
+    """
+    Time a block as one stage of the chat path: observed in
+    psybot_stage_seconds{stage} and logged as a "span" line with its status.
+    Yields `fields`, so the block can attach results (e.g. hits=5).
+    """
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException as e:
+        status = "error"
+        fields.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        log_event("span", stage=stage, ms=round(seconds * 1000, 2), status=status, **fields)
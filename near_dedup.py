@@ -0,0 +1,224 @@
+import json
+import time
+import zlib
+import argparse
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from corpus import CHUNKS_DIR, EMBED_STATS, NEAR_DUP_FILE, iter_chunk_files, iter_chunks
+from lexical import tokenize
+from manifest import atomic_write_text
+
+# Corpus-wide near-duplicate chunks (overlapping editions, shared front
+# matter, anthology reprints) via word shingles → MinHash → LSH banding.
+# Chunks are visited in file order; the first copy is kept and later
+# copies are recorded against it in data/chunks/.near_duplicates.json.
+# In "drop" mode embed.py and the lexical index leave them out; "flag"
+# mode only writes the list for review. Run after chunker.py, before embed.py.
+
+SHINGLE_SIZE = 5          # words per shingle
+NUM_PERM = 128            # MinHash signature length
+BANDS = 16                # LSH bands × rows = NUM_PERM; ~0.7 Jaccard S-curve midpoint
+THRESHOLD = 0.8           # estimated Jaccard to count as a duplicate
+MODE = "drop"             # drop | flag
+
+VECTOR_META = Path("vector_index") / "meta.json"        # for the vector dim, if exported
+DEFAULT_DIM = 1024                                      # multilingual-e5-large
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+
+
+# -------------------- MINHASH --------------------
+
+class MinHasher:
+    """Fixed random permutations (a·x + b mod 2^61-1) over 32-bit shingle hashes."""
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a, b < 2^32 and x < 2^32 keep a·x + b inside uint64
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.shingle_size = shingle_size
+
+    def shingles(self, text: str) -> Optional[np.ndarray]:
+        """Distinct 32-bit hashes of the text's word k-grams (None if too short)."""
+        toks = tokenize(text)
+        if len(toks) < self.shingle_size:
+            return None
+        h = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in toks), dtype=np.uint64, count=len(toks))
+        n = len(h) - self.shingle_size + 1
+        acc = np.zeros(n, dtype=np.uint64)
+        for j in range(self.shingle_size):
+            acc = acc * np.uint64(1000003) + h[j:j + n]   # wraps mod 2^64
+        return np.unique((acc ^ (acc >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        perm = (shingles[:, None] * self.a[None, :] + self.b[None, :]) % _MERSENNE
+        return perm.min(axis=0).astype(np.uint32)
+
+
+# -------------------- LSH --------------------
+
+class LSHIndex:
+    """Banded signatures → candidate lists; only kept (non-duplicate) chunks are indexed."""
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS):
+        if num_perm % bands:
+            raise ValueError("NUM_PERM must be a multiple of BANDS")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bands)]
+        self.sigs: List[np.ndarray] = []
+
+    def _keys(self, sig: np.ndarray):
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def best_match(self, sig: np.ndarray):
+        """(row, estimated Jaccard) of the most similar indexed candidate, or (None, 0)."""
+        candidates = set()
+        for band, key in self._keys(sig):
+            candidates.update(self.buckets[band].get(key, ()))
+        if not candidates:
+            return None, 0.0
+        rows = np.fromiter(candidates, dtype=np.int64)
+        sims = (np.stack([self.sigs[r] for r in rows]) == sig).mean(axis=1)
+        best = int(sims.argmax())
+        return int(rows[best]), float(sims[best])
+
+    def add(self, sig: np.ndarray) -> int:
+        row = len(self.sigs)
+        self.sigs.append(sig)
+        for band, key in self._keys(sig):
+            self.buckets[band][key].append(row)
+        return row
+
+
+# -------------------- SCAN --------------------
+
+def find_near_duplicates(chunks_dir: Path = CHUNKS_DIR, threshold: float = THRESHOLD) -> Dict:
+    t0 = time.perf_counter()
+    hasher = MinHasher()
+    index = LSHIndex()
+    kept: List[Dict] = []           # index row → {"id", "file", "book_id"}
+    duplicates: Dict[str, Dict] = {}
+    n_chunks = too_short = dup_chars = 0
+
+    for fp in iter_chunk_files(chunks_dir):
+        for vec_id, text, meta in iter_chunks(fp):
+            n_chunks += 1
+            shingles = hasher.shingles(text)
+            if shingles is None:
+                too_short += 1
+                continue
+            sig = hasher.signature(shingles)
+            row, sim = index.best_match(sig)
+            book_id = str(meta.get("book_id") or fp.stem)
+            if row is not None and sim >= threshold:
+                keeper = kept[row]
+                duplicates[vec_id] = {
+                    "file": fp.name,
+                    "of": keeper["id"],
+                    "kept_file": keeper["file"],
+                    "similarity": round(sim, 3),
+                    "cross_book": keeper["book_id"] != book_id,
+                }
+                dup_chars += len(text)
+                continue
+            index.add(sig)
+            kept.append({"id": vec_id, "file": fp.name, "book_id": book_id})
+
+    return {
+        "chunks": n_chunks,
+        "too_short": too_short,
+        "duplicates": duplicates,
+        "duplicate_chars": dup_chars,
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+# -------------------- REPORT --------------------
+
+def _load_json(path: Path) -> Optional[Dict]:
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+def savings(n_dups: int, embed_rate: Optional[float] = None) -> Dict:
+    """Vectors, storage and (if a rate is known) embedding time not spent on duplicates."""
+    stats = _load_json(EMBED_STATS) or {}
+    vec_meta = _load_json(VECTOR_META) or {}
+    rate = embed_rate or stats.get("passages_per_sec")
+    dim = int(vec_meta.get("dim") or DEFAULT_DIM)
+    return {
+        "vectors": n_dups,
+        "float32_mib": n_dups * dim * 4 / (1 << 20),
+        "passages_per_sec": rate,
+        "embed_seconds": n_dups / rate if rate else None,
+    }
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Find near-duplicate chunks across books (MinHash/LSH).")
+    ap.add_argument("--chunks-dir", type=Path, default=CHUNKS_DIR)
+    ap.add_argument("--mode", choices=["drop", "flag"], default=MODE,
+                    help="drop: embed.py skips duplicates; flag: only write the list")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD,
+                    help="estimated Jaccard similarity to count as a duplicate")
+    ap.add_argument("--embed-rate", type=float, default=None,
+                    help="passages/sec for the time estimate (default: embed.py's last run)")
+    ap.add_argument("--json", type=Path, help="also write the report here")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    print(f"🔎 Scanning {args.chunks_dir} (shingles of {SHINGLE_SIZE} words, {NUM_PERM} perms, "
+          f"{BANDS} bands, threshold {args.threshold})")
+    found = find_near_duplicates(args.chunks_dir, args.threshold)
+    dups = found["duplicates"]
+    cross = sum(1 for d in dups.values() if d["cross_book"])
+
+    out_path = args.chunks_dir / NEAR_DUP_FILE
+    atomic_write_text(out_path, json.dumps({
+        "mode": args.mode,
+        "params": {"shingle_size": SHINGLE_SIZE, "num_perm": NUM_PERM,
+                   "bands": BANDS, "threshold": args.threshold},
+        "created_at": time.time(),
+        "duplicates": dups,
+    }, ensure_ascii=False))
+
+    saved = savings(len(dups), args.embed_rate)
+    report = {
+        "mode": args.mode,
+        "chunks": found["chunks"],
+        "too_short": found["too_short"],
+        "near_duplicates": len(dups),
+        "cross_book": cross,
+        "duplicate_chars": found["duplicate_chars"],
+        "scan_seconds": found["seconds"],
+        "saved": saved,
+    }
+
+    share = len(dups) / found["chunks"] if found["chunks"] else 0.0
+    print(f"\n📊 {found['chunks']:,} chunks scanned in {found['seconds']:.1f}s "
+          f"({found['too_short']:,} too short to compare)")
+    print(f"   {len(dups):,} near-duplicates ({share:.1%}), {cross:,} of them across books")
+    print(f"   → {out_path} (mode: {args.mode})")
+    verb = "Saves" if args.mode == "drop" else "Would save"
+    line = f"   {verb} {saved['vectors']:,} vectors, {saved['float32_mib']:.1f} MiB of float32"
+    if saved["embed_seconds"] is not None:
+        line += f", ~{saved['embed_seconds']:.0f}s of embedding at {saved['passages_per_sec']:.1f} passages/s"
+    else:
+        line += " (embedding time: run embed.py once or pass --embed-rate)"
+    print(line)
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nSaved report → {args.json}")
+
+if __name__ == "__main__":
+    main()
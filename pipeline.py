@@ -0,0 +1,254 @@
+import os
+import sys
+import time
+import inspect
+import argparse
+import subprocess
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import chunker
+import corpus
+import downloader_and_cleaner as dc
+import language
+import preprocessor
+from manifest import FileManifest, text_digest
+
+# -------------------------------------------------------
+# ONE ENTRY POINT FOR THE CORPUS
+# -------------------------------------------------------
+# catalogue (scraper) → download → clean → process → chunk → [near-dedup] → embed
+#
+# Per-book stages record, for every artifact they build, the digest of
+# their input file and a stamp of their own code/params. A stage reruns
+# only when one of those changed, and a rebuilt output that comes out
+# byte-identical stops the change there (the next stage sees the same
+# input digest). So a cleaning-rule tweak rechunks only the books whose
+# cleaned text actually changed, and embed.py re-embeds only their chunk
+# files. Books run through their stages independently in a process pool.
+
+DATA_DIR = "data"
+STATE_FILE = ".pipeline_state.json"
+PIPELINE_WORKERS = os.cpu_count() or 1
+
+
+@dataclass(frozen=True)
+class Dirs:
+    raw: str
+    clean: str
+    processed: str
+    chunks: str
+
+    @classmethod
+    def under(cls, root: str) -> "Dirs":
+        return cls(*(os.path.join(root, d) for d in ("raw", "clean", "processed", "chunks")))
+
+
+def code_stamp(*parts) -> str:
+    """Digest of the functions (source) and constants (repr) a stage's output depends on."""
+    text = "\n".join(inspect.getsource(p) if callable(p) else repr(p) for p in parts)
+    return text_digest(text)
+
+
+# -------------------------------------------------------
+# STAGES (input file → output file, per book)
+# -------------------------------------------------------
+
+def _run_clean(book_id: str, in_path: str, dirs: Dirs) -> str:
+    return dc.clean_book(book_id, dirs.raw, dirs.clean)
+
+def _run_process(book_id: str, in_path: str, dirs: Dirs) -> str:
+    return preprocessor.process_book(in_path, book_id, dirs.processed)["output"]
+
+def _run_chunk(book_id: str, in_path: str, dirs: Dirs) -> str:
+    return chunker.chunk_book(in_path, dirs.chunks)["output"]
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    inputs: str                       # what the stage reads (for --dry-run / docs)
+    outputs: str                      # what it writes
+    run: Callable[[str, str, Dirs], str]
+    code: Callable[[], str]
+
+STAGES: List[Stage] = [
+    Stage("clean", "raw/<id>.txt", "clean/<id>.txt", _run_clean,
+          lambda: code_stamp(dc.extract_gutenberg_content, dc.clean_text, dc.clean_book)),
+    Stage("process", "clean/<id>.txt", "processed/<id>_<lang>.txt", _run_process,
+          lambda: code_stamp(preprocessor.iter_lines, preprocessor.remove_trailing_sections,
+                             preprocessor.iter_paragraphs, preprocessor.dedupe_paragraphs,
+                             preprocessor.process_book, preprocessor.NOISE_HEADERS,
+                             preprocessor.detect_language, preprocessor.LANG_SAMPLE_CHARS,
+                             language.build_detector, language.iso_code, language.LANGUAGES)),
+    Stage("chunk", "processed/<id>_<lang>.txt", "chunks/<id>.jsonl", _run_chunk,
+          lambda: code_stamp(chunker.chunk_params(), chunker.iter_blocks, chunker.iter_sentences,
+                             chunker.iter_chunks, chunker.split_long_sentence, chunker.count_tokens,
+                             chunker.window_limits, chunker.batched, chunker.book_meta,
+                             chunker.chunk_book)),
+]
+
+
+def _fresh(state: FileManifest, key: str, in_path: str, code: str) -> bool:
+    entry = state.get(key)
+    return (entry is not None and os.path.exists(in_path) and os.path.exists(entry.get("output", ""))
+            and state.unchanged(key, in_path, code=code))
+
+
+def plan_book(book_id: str, entries: Dict[str, Dict], dirs: Dirs, codes: Dict[str, str]) -> Optional[str]:
+    """First stage that would rebuild for this book (None = up to date)."""
+    state = FileManifest(STATE_FILE, entries)
+    in_path = str(dc.raw_path(book_id, dirs.raw))
+    for stage in STAGES:
+        key = f"{stage.name}:{book_id}"
+        if not _fresh(state, key, in_path, codes[stage.name]):
+            return stage.name
+        in_path = state.get(key)["output"]
+    return None
+
+
+def _init_worker():
+    preprocessor._init_worker()
+    chunker._init_worker()
+
+def build_book(book_id: str, entries: Dict[str, Dict], dirs: Dirs, codes: Dict[str, str]) -> Dict:
+    """
+    Run one book through every stage, skipping the fresh ones. Returns the
+    book's updated state entries and which stages actually ran.
+    """
+    t0 = time.perf_counter()
+    state = FileManifest(STATE_FILE, entries)
+    in_path = str(dc.raw_path(book_id, dirs.raw))
+    ran = []
+    for stage in STAGES:
+        key = f"{stage.name}:{book_id}"
+        if _fresh(state, key, in_path, codes[stage.name]):
+            in_path = state.get(key)["output"]
+            continue
+        prev = state.get(key) or {}
+        out_path = stage.run(book_id, in_path, dirs)
+        # e.g. the detected language changed → the old processed file is stale
+        if prev.get("output") and prev["output"] != out_path and os.path.exists(prev["output"]):
+            os.remove(prev["output"])
+        state.record(key, in_path, code=codes[stage.name], output=out_path)
+        ran.append(stage.name)
+        in_path = out_path
+    return {"book_id": book_id, "entries": state.entries, "ran": ran, "seconds": time.perf_counter() - t0}
+
+
+# -------------------------------------------------------
+# CORPUS-WIDE STAGES
+# -------------------------------------------------------
+
+def run_script(*argv: str):
+    print(f"\n▶️  {' '.join(argv)}")
+    subprocess.run([sys.executable, *argv], check=True)
+
+
+# -------------------------------------------------------
+# MAIN
+# -------------------------------------------------------
+
+def run(args):
+    dirs = Dirs.under(args.data_dir)
+    state = FileManifest(os.path.join(args.data_dir, STATE_FILE))
+    codes = {stage.name: stage.code() for stage in STAGES}
+    t_start = time.perf_counter()
+
+    if args.refresh_catalogue and not args.dry_run:
+        run_script("scraper.py", "--csv", args.csv)
+
+    rows = dc.read_catalogue(args.csv)
+    book_ids = [row["book_id"] for row in rows]
+
+    if args.offline or args.dry_run:
+        missing = [b for b in book_ids if not dc.raw_path(b, dirs.raw).exists()]
+        if missing:
+            print(f"⚠️  {len(missing)} book(s) not in the raw cache: {', '.join(missing[:10])}"
+                  f"{' ...' if len(missing) > 10 else ''}")
+        book_ids = [b for b in book_ids if b not in missing]
+        if args.dry_run and not args.offline:
+            print(f"   (download: {len(rows)} conditional requests skipped in dry run)")
+    else:
+        dc.download_all(rows, dirs.raw, args.base_url, args.download_workers)
+        book_ids = [b for b in book_ids if dc.raw_path(b, dirs.raw).exists()]
+
+    def entries_of(book_id):
+        return {f"{s.name}:{book_id}": state.get(f"{s.name}:{book_id}")
+                for s in STAGES if state.get(f"{s.name}:{book_id}")}
+
+    plan = {b: plan_book(b, entries_of(b), dirs, codes) for b in book_ids}
+    todo = [b for b, first in plan.items() if first]
+
+    print(f"\n📋 {len(book_ids)} books: {len(todo)} to rebuild, {len(book_ids) - len(todo)} up to date")
+    for stage in STAGES:
+        n = sum(1 for first in plan.values() if first == stage.name)
+        if n:
+            print(f"   from {stage.name:<8} ({stage.inputs} → {stage.outputs}): {n}")
+
+    if args.dry_run:
+        for b in todo:
+            names = [s.name for s in STAGES]
+            rest = names[names.index(plan[b]):]
+            print(f"   {b}: {' → '.join(rest)} (later stages only if the output changes) → embed")
+        return
+
+    rebuilt_chunks = 0
+    if todo:
+        workers = max(1, min(args.workers, len(todo)))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker) as pool:
+            futures = {pool.submit(build_book, b, entries_of(b), dirs, codes): b for b in todo}
+            for fut in as_completed(futures):
+                book_id = futures[fut]
+                try:
+                    r = fut.result()
+                except Exception as e:
+                    print(f"❌ {book_id}: {e}")
+                    continue
+                for key, entry in r["entries"].items():
+                    state.set(key, entry)
+                state.save()
+                rebuilt_chunks += "chunk" in r["ran"]
+                print(f"✅ {book_id}: ran {', '.join(r['ran']) or 'nothing (outputs unchanged)'} "
+                      f"({r['seconds']:.1f}s)")
+
+    print(f"\n🧱 Books done in {time.perf_counter() - t_start:.1f}s; {rebuilt_chunks} chunk file(s) rebuilt")
+
+    # embed.py / near_dedup.py read corpus.CHUNKS_DIR
+    if Path(dirs.chunks) != corpus.CHUNKS_DIR:
+        print(f"ℹ️  Chunks are in {dirs.chunks}, not {corpus.CHUNKS_DIR}: skipping dedup/embed")
+        return
+    if rebuilt_chunks or args.force_embed:
+        if args.dedup:
+            run_script("near_dedup.py", "--mode", args.dedup)
+        run_script("embed.py", *args.embed_args)
+    else:
+        print("Index is up to date: nothing to embed.")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Incremental corpus pipeline: download → clean → process → chunk → embed.")
+    ap.add_argument("--dry-run", action="store_true", help="show what would rebuild; no network, no writes")
+    ap.add_argument("--offline", action="store_true", help="skip downloading; build from the raw cache")
+    ap.add_argument("--refresh-catalogue", action="store_true", help="run the incremental scraper first")
+    ap.add_argument("--csv", default=dc.CSV_PATH)
+    ap.add_argument("--data-dir", default=DATA_DIR)
+    ap.add_argument("--base-url", default=dc.BASE_URL)
+    ap.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="book processes")
+    ap.add_argument("--download-workers", type=int, default=dc.DOWNLOAD_WORKERS)
+    ap.add_argument("--dedup", choices=["drop", "flag"], default=None,
+                    help="run near_dedup.py before embedding")
+    ap.add_argument("--force-embed", action="store_true", help="run embed.py even if no chunks changed")
+    ap.add_argument("embed_args", nargs=argparse.REMAINDER,
+                    help="extra arguments for embed.py, after --")
+    args = ap.parse_args()
+    if args.embed_args[:1] == ["--"]:
+        args.embed_args = args.embed_args[1:]
+    return args
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -1,39 +1,38 @@
 import os
 import re
-import unicodedata
-from lingua import Language, LanguageDetectorBuilder
+import time
+import argparse
+import tracemalloc
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from language import build_detector, iso_code
+from manifest import atomic_writer, text_digest
 
 INPUT_DIR = "data/clean"
 OUTPUT_DIR = "data/processed"
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Books are independent → one process per core, each with its own detector
+PREPROCESS_WORKERS = os.cpu_count() or 1
 
 # -------------------------------------------------------
 # LANGUAGE DETECTOR (LINGUA)
 # -------------------------------------------------------
+# Slow to build, so it's created once per worker process (pool
+# initializer) rather than at import or per book.
 
-LANGUAGES = [
-    Language.ENGLISH,
-    Language.GERMAN,
-    Language.FRENCH,
-    Language.DUTCH,
-    Language.ITALIAN,
-    Language.SPANISH,
-    Language.SWEDISH,
-    Language.DANISH,
-    Language.PORTUGUESE,
-    Language.FINNISH,
-    Language.POLISH,
-    Language.CZECH,
-    Language.LATIN,
-]
+detector = None
+
+def _init_worker():
+    global detector
+    if detector is None:
+        detector = build_detector()
 
-detector = LanguageDetectorBuilder.from_languages(*LANGUAGES).build()
+LANG_SAMPLE_CHARS = 4000  # small sample is enough
 
 def detect_language(text: str) -> str:
-    sample = text[:4000]  # small sample is enough
-    lang = detector.detect_language_of(sample)
-    return lang.iso_code_639_1.name.lower() if lang else "unknown"
+    _init_worker()
+    sample = text[:LANG_SAMPLE_CHARS]
+    return iso_code(detector.detect_language_of(sample))
 
 
 # -------------------------------------------------------
@@ -62,86 +61,160 @@ NOISE_HEADERS = [
 
 combined_noise_pattern = re.compile("|".join(NOISE_HEADERS), flags=re.IGNORECASE)
 
-def remove_trailing_sections(text: str) -> str:
-    lines = text.split("\n")
-    cutoff = len(lines)
+def iter_lines(f):
+    """(byte offset after the line, decoded line) for a file opened in binary mode."""
+    pos = 0
+    for raw in f:
+        pos += len(raw)
+        yield pos, raw.decode("utf-8", errors="ignore")
 
-    for i, line in enumerate(lines):
-        clean = line.strip().upper()
+def remove_trailing_sections(lines, total_bytes: int):
+    """
+    Yield lines up to the first noise header (INDEX, NOTES, ...) found
+    after 30% of the book. Position is measured in bytes against the
+    file size, so the cut is decided in the same pass that reads it.
+    """
+    cut_after = total_bytes * 0.30
+    for pos, line in lines:
+        # Flexible match for headers (pattern is case-insensitive)
+        if pos > cut_after and combined_noise_pattern.match(line.strip()):
+            return
 
-        # Flexible match for headers
-        if combined_noise_pattern.match(clean):
-            # Only cut if this happens after 30% of the text
-            if i > len(lines) * 0.30:
-                cutoff = i
-                break
-
-        # TOC-style rows "CHAPTER I ...... 12"
-        if re.match(r".+\.{2,}\s*\d+$", clean) and i < len(lines) * 0.25:
-            continue
-
-    return "\n".join(lines[:cutoff]).strip()
+        yield line
 
 
 # -------------------------------------------------------
 # DEDUPLICATE PARAGRAPHS
 # -------------------------------------------------------
 
-def dedupe_paragraphs(text: str) -> str:
+def iter_paragraphs(lines):
+    """Group lines into stripped paragraphs separated by blank lines."""
+    para = []
+    for line in lines:
+        if line.strip():
+            para.append(line.rstrip("\r\n"))
+        elif para:
+            yield "\n".join(para).strip()
+            para = []
+    if para:
+        yield "\n".join(para).strip()
+
+def dedupe_paragraphs(paragraphs):
+    """
+    Drop repeated paragraphs. Only a short digest of each normalized
+    paragraph is remembered, not the text itself.
+    """
     seen = set()
-    final = []
 
-    for para in text.split("\n\n"):
-        cleaned = para.strip()
+    for cleaned in paragraphs:
         if not cleaned:
             continue
 
         # For dedupe, normalize internal whitespace + lowercase
-        key = re.sub(r"\s+", " ", cleaned.lower())
+        key = text_digest(" ".join(cleaned.lower().split()))
 
         if key not in seen:
             seen.add(key)
-            final.append(cleaned)
-
-    return "\n\n".join(final)
+            yield cleaned
 
 
 # -------------------------------------------------------
 # MAIN PIPELINE
 # -------------------------------------------------------
 
-def postprocess_books():
-    for fname in os.listdir(INPUT_DIR):
-        if not fname.endswith(".txt"):
-            continue
-
-        book_id = fname.replace(".txt", "")
-        in_path = os.path.join(INPUT_DIR, fname)
-
-        print(f"\n=== Postprocessing {book_id} ===")
-
-        try:
-            with open(in_path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-
-            # Apply additional cleaning layers
-            text = remove_trailing_sections(text)
-            text = dedupe_paragraphs(text)
-
-            # Detect language
-            lang = detect_language(text)
-
-            # Output path
-            out_path = os.path.join(OUTPUT_DIR, f"{book_id}_{lang}.txt")
-            with open(out_path, "w", encoding="utf-8") as f:
-                f.write(text)
-
-            print(f"Saved processed book → {out_path}")
-
-        except Exception as e:
-            print(f"❌ Error processing {fname}: {e}")
+def process_book(in_path: str, book_id: str, out_dir: str = OUTPUT_DIR, trace_memory: bool = False):
+    """
+    Stream one cleaned book through the filters into
+    <out_dir>/<book_id>_<lang>.txt in a single read. Paragraphs are
+    buffered only until there's enough text to detect the language
+    (which names the file).
+    """
+    t0 = time.perf_counter()
+    if trace_memory:
+        tracemalloc.start()
+
+    total_bytes = os.path.getsize(in_path)
+    with open(in_path, "rb") as f:
+        paragraphs = dedupe_paragraphs(iter_paragraphs(remove_trailing_sections(iter_lines(f), total_bytes)))
+
+        head, head_chars = [], 0
+        for para in paragraphs:
+            head.append(para)
+            head_chars += len(para) + 2
+            if head_chars >= LANG_SAMPLE_CHARS:
+                break
+        lang = detect_language("\n\n".join(head))
+
+        out_path = os.path.join(out_dir, f"{book_id}_{lang}.txt")
+        written = 0
+        with atomic_writer(out_path) as out:
+            for para in head:
+                out.write(("\n\n" if written else "") + para)
+                written += 1
+            for para in paragraphs:
+                out.write(("\n\n" if written else "") + para)
+                written += 1
+
+    result = {
+        "book_id": book_id,
+        "output": out_path,
+        "paragraphs": written,
+        "input_mib": total_bytes / (1 << 20),
+        "seconds": time.perf_counter() - t0,
+    }
+    if trace_memory:
+        result["peak_mib"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        tracemalloc.stop()
+    return result
+
+
+def postprocess_books(input_dir: str = INPUT_DIR, output_dir: str = OUTPUT_DIR,
+                      workers: int = PREPROCESS_WORKERS, trace_memory: bool = False, quiet: bool = False):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [
+        (os.path.join(input_dir, fname), fname.replace(".txt", ""))
+        for fname in sorted(os.listdir(input_dir)) if fname.endswith(".txt")
+    ]
+
+    def report(r):
+        if quiet:
+            return
+        mem = f", heap peak {r['peak_mib']:.1f} MiB" if "peak_mib" in r else ""
+        print(f"✅ {r['book_id']} → {r['output']}: {r['paragraphs']} paragraphs "
+              f"({r['input_mib']:.1f} MiB in, {r['seconds']:.2f}s{mem})")
+
+    done = 0
+    if workers <= 1 or len(jobs) <= 1:
+        for in_path, book_id in jobs:
+            try:
+                report(process_book(in_path, book_id, output_dir, trace_memory))
+                done += 1
+            except Exception as e:
+                print(f"❌ Error processing {os.path.basename(in_path)}: {e}")
+        return done
+
+    # spawn: each worker starts clean and builds exactly one detector
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=mp.get_context("spawn"),
+                             initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(process_book, in_path, book_id, output_dir, trace_memory): in_path
+            for in_path, book_id in jobs
+        }
+        for fut in as_completed(futures):
+            try:
+                report(fut.result())
+                done += 1
+            except Exception as e:
+                print(f"❌ Error processing {os.path.basename(futures[fut])}: {e}")
+    return done
 
 
 if __name__ == "__main__":
-    postprocess_books()
-    print("\n🔥 Phase 3+ cleaning complete for all books.")
+    ap = argparse.ArgumentParser(description="Filter data/clean into data/processed.")
+    ap.add_argument("--workers", type=int, default=PREPROCESS_WORKERS, help="preprocessing processes")
+    ap.add_argument("--trace-memory", action="store_true",
+                    help="report each book's peak Python heap (tracemalloc; slower)")
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    n = postprocess_books(workers=args.workers, trace_memory=args.trace_memory)
+    print(f"\n🔥 Phase 3+ cleaning complete: {n} books in {time.perf_counter() - t0:.1f}s.")
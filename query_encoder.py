@@ -0,0 +1,132 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# ---------- CONFIG ----------
+MAX_BATCH_SIZE = 32      # queries folded into a single forward pass
+
+
+class QueryEncoder:
+    """
+    Micro-batching wrapper around a SentenceTransformer for query embeddings.
+
+    Concurrent callers of `encode()` are queued; a single background task
+    drains the queue into batches of up to `max_batch_size` queries and runs
+    one `model.encode` per batch on a dedicated thread, so the event loop
+    keeps serving other requests while the model runs. An idle encoder
+    dispatches a query at once; while a batch is running, the next one keeps
+    filling until it finishes, so batches grow with load (one in flight).
+    """
+
+    def __init__(self, model, max_batch_size: int = MAX_BATCH_SIZE, prefix: str = "query: "):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.prefix = prefix
+
+        # One thread: the model is not re-entrant and torch already uses
+        # all cores inside a single forward pass.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-encoder")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.queries = 0
+
+    # ---------- SYNC PATH ----------
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encode a list of raw queries in one call (blocking), on the encoder thread."""
+        return self._executor.submit(self._encode, texts).result()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vecs = self.model.encode(
+            [f"{self.prefix}{t}" for t in texts],
+            batch_size=len(texts),
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(vecs, dtype=np.float32)
+
+    # ---------- ASYNC PATH ----------
+    async def encode(self, text: str) -> np.ndarray:
+        """Encode a single query, batched with whatever else is in flight."""
+        self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, fut))
+        return await fut
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._inflight = None
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _collect(self, inflight: Optional[asyncio.Task]) -> List[Tuple[str, asyncio.Future]]:
+        """
+        Next batch: everything already queued, and while `inflight` is still
+        encoding, whatever arrives before it finishes (up to max_batch_size).
+        """
+        batch = [await self._queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            # Encoder idle: waiting would only add latency
+            if inflight is None or inflight.done():
+                break
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter, inflight}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                batch.append(getter.result())
+            else:
+                getter.cancel()   # an item it was woken for stays in the queue
+                break
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect(self._inflight)
+            # At most one batch on the encoder thread; a full batch waits its turn
+            if self._inflight is not None:
+                await asyncio.wait({self._inflight})
+            # Callers that went away (e.g. client disconnect) don't need a slot
+            batch = [(t, f) for t, f in batch if not f.done()]
+            if batch:
+                self._inflight = loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [t for t, _ in batch]
+        try:
+            vecs = await asyncio.get_running_loop().run_in_executor(self._executor, self._encode, texts)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        self.batches += 1
+        self.queries += len(batch)
+        for i, (_, fut) in enumerate(batch):
+            if not fut.done():
+                fut.set_result(vecs[i:i + 1])
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._inflight is not None:
+            self._inflight.cancel()
+            self._inflight = None
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import bind_request_id, log_event, mask_sender, span
+
+# ---------- CONFIG ----------
+ASYNC_REPLIES = os.getenv("PSYBOT_ASYNC_REPLIES", "0") == "1"   # opt-in
+REPLY_WORKERS = int(os.getenv("PSYBOT_REPLY_WORKERS", "4"))
+REPLY_QUEUE_SIZE = int(os.getenv("PSYBOT_REPLY_QUEUE_SIZE", "100"))
+OUTBOUND = os.getenv("PSYBOT_OUTBOUND", "twilio")              # twilio | stub
+
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+TWILIO_FROM = os.getenv("TWILIO_WHATSAPP_FROM")   # e.g. "whatsapp:+14155238886"
+
+SEEN_SIDS = 5000   # recent MessageSids remembered to drop Twilio retries
+
+
+@dataclass
+class InboundMessage:
+    sender: str             # "whatsapp:+34..."
+    body: str
+    to: Optional[str] = None   # our number, used as reply sender
+    sid: Optional[str] = None  # Twilio MessageSid
+
+
+# ---------- OUTBOUND SENDERS ----------
+
+class OutboundSender:
+    """Delivers a reply outside the webhook request."""
+
+    async def send(self, to: str, body: str, from_: Optional[str] = None):
+        raise NotImplementedError
+
+
+class TwilioSender(OutboundSender):
+    """Sends through the Twilio REST API (client is created lazily)."""
+
+    def __init__(self, account_sid: Optional[str] = TWILIO_ACCOUNT_SID,
+                 auth_token: Optional[str] = TWILIO_AUTH_TOKEN,
+                 default_from: Optional[str] = TWILIO_FROM):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.default_from = default_from
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            if not self.account_sid or not self.auth_token:
+                raise RuntimeError("TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN are not set")
+            from twilio.rest import Client
+            self._client = Client(self.account_sid, self.auth_token)
+        return self._client
+
+    async def send(self, to: str, body: str, from_: Optional[str] = None):
+        from_ = from_ or self.default_from
+        if not from_:
+            raise RuntimeError("No sender number: pass 'To' from the webhook or set TWILIO_WHATSAPP_FROM")
+        client = self._get_client()
+        # The Twilio client is blocking; keep it off the event loop
+        await asyncio.to_thread(client.messages.create, to=to, from_=from_, body=body)
+
+
+class StubSender(OutboundSender):
+    """Records replies in memory instead of sending them (local runs, tests)."""
+
+    def __init__(self, echo: bool = True):
+        self.sent: List[Tuple[str, str, Optional[str]]] = []
+        self.echo = echo
+
+    async def send(self, to: str, body: str, from_: Optional[str] = None):
+        self.sent.append((to, body, from_))
+        if self.echo:
+            log_event("stub_reply", to=mask_sender(to), chars=len(body), preview=body[:200])
+
+
+def make_sender(kind: Optional[str] = None) -> OutboundSender:
+    kind = (kind or OUTBOUND).lower()
+    if kind == "twilio":
+        return TwilioSender()
+    if kind == "stub":
+        return StubSender()
+    raise ValueError(f"Unknown outbound sender: {kind!r} (expected 'twilio' or 'stub')")
+
+
+# ---------- WORKER POOL ----------
+
+class ReplyWorkerPool:
+    """
+    Bounded queue of inbound messages drained by a fixed number of
+    workers. Each worker turns a message into a reply with `handler`
+    and hands it to the outbound sender. Messages from one sender are
+    handled one at a time, in arrival order, so each reply sees the
+    exchange before it.
+    """
+
+    def __init__(self, handler: Callable[[InboundMessage], Awaitable[str]],
+                 sender: OutboundSender, workers: int = REPLY_WORKERS,
+                 queue_size: int = REPLY_QUEUE_SIZE):
+        self.handler = handler
+        self.sender = sender
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._sender_locks: Dict[str, List] = {}   # sender → [lock, workers holding/waiting]
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.delivered = 0
+        self.failed = 0
+
+    def start(self):
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Give queued messages a chance to finish, then cancel workers."""
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            log_event("reply_pool_stopping", level=logging.WARNING, queued=self.queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, msg: InboundMessage) -> bool:
+        """
+        Queue a message. Returns False only when the queue is full; Twilio
+        retries of an already-accepted MessageSid are acknowledged and dropped.
+        """
+        if msg.sid and msg.sid in self._seen:
+            self.duplicates += 1
+            return True
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        if msg.sid:
+            self._seen[msg.sid] = None
+            while len(self._seen) > SEEN_SIDS:
+                self._seen.popitem(last=False)
+        self.accepted += 1
+        return True
+
+    @asynccontextmanager
+    async def _sender_turn(self, sender: str):
+        """Wait for earlier messages from `sender` (asyncio.Lock wakes waiters FIFO)."""
+        entry = self._sender_locks.setdefault(sender, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._sender_locks[sender]
+
+    async def _worker(self, n: int):
+        while True:
+            msg = await self.queue.get()
+            try:
+                async with self._sender_turn(msg.sender):
+                    with bind_request_id(msg.sid or f"reply-{n}-{self.accepted}"):
+                        try:
+                            reply = await self.handler(msg)
+                            with span("reply_send", chars=len(reply)):
+                                await self.sender.send(msg.sender, reply, msg.to)
+                            self.delivered += 1
+                        except Exception as e:
+                            self.failed += 1
+                            log_event("reply_failed", level=logging.ERROR, exc_info=True, worker=n,
+                                      sender=mask_sender(msg.sender), error=f"{type(e).__name__}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def stats(self):
+        return {
+            "workers": len(self._tasks),
+            "queue_depth": self.queue.qsize(),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "delivered": self.delivered,
+            "failed": self.failed,
+        }
@@ -0,0 +1,348 @@
+import os
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from language import detect_query_language
+from lexical import LEXICAL_DIR, LexicalIndex, rrf_fuse
+from metrics import log_event, span
+from query_encoder import QueryEncoder
+from retrieval_cache import RetrievalCache
+from vector_store import VECTOR_DIR, VECTOR_QUANT, ChromaBackend, NumpyBackend, QuantizedBackend, VectorBackend
+
+# ---------- CONFIG ----------
+MODEL_NAME = "intfloat/multilingual-e5-large"
+CHROMA_PATH = "chroma_db"
+COLLECTION_NAME = "psybot_multilingual"
+
+# chroma: HNSW in chroma_db/ | numpy: exact scan of the vector_index/ export
+# (PSYBOT_VECTOR_QUANT=int8|binary adds a quantized first pass to numpy)
+VECTOR_BACKEND = os.getenv("PSYBOT_VECTOR_BACKEND", "chroma")
+
+ENCODER_MAX_BATCH = 32     # max concurrent queries per forward pass
+
+# Hybrid retrieval: BM25 over lexical_index/ fused with the dense hits by
+# reciprocal rank. Silently dense-only until the lexical index is built.
+HYBRID = os.getenv("PSYBOT_HYBRID", "1") != "0"
+HYBRID_DEPTH = 4           # each retriever returns k * HYBRID_DEPTH candidates
+RRF_K = 60
+# Route each query to the partition of its detected language. "cross" tops
+# up a short partition result from the whole collection; "none" doesn't.
+# Undetected or unindexed languages always search everything.
+LANG_PARTITION = os.getenv("PSYBOT_LANG_PARTITION", "1") != "0"
+LANG_FALLBACK = os.getenv("PSYBOT_LANG_FALLBACK", "cross")
+
+INDEX_CHECK_SECONDS = 5.0  # how often to look for rebuilt on-disk indexes
+
+WARMUP_QUERY = "warmup"
+
+
+class RetrievalRuntime:
+    """
+    Process-wide retriever: embedding model, vector backend (Chroma or
+    the NumPy export), query encoder, optional BM25 index and result cache.
+
+    Nothing heavy is imported or loaded until `load()` runs, either on
+    the first retrieval or from a startup hook. `warmup()` additionally
+    pushes one query through the encoder and the index so the first real
+    request doesn't pay for lazy initialisation.
+
+    An already-built `embedder` (anything with SentenceTransformer's
+    `encode`) skips loading the model, e.g. a stand-in for benchmarks.
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, chroma_path: str = CHROMA_PATH,
+                 collection_name: str = COLLECTION_NAME, backend: str = VECTOR_BACKEND,
+                 vector_dir: Path = VECTOR_DIR, vector_quant: str = VECTOR_QUANT, embedder=None):
+        self.model_name = model_name
+        self.chroma_path = chroma_path
+        self.collection_name = collection_name
+        self.backend_name = backend
+        self.vector_dir = Path(vector_dir)
+        self.vector_quant = vector_quant
+
+        self.device: Optional[str] = None
+        self.embedder = embedder
+        self.backend: Optional[VectorBackend] = None
+        self.encoder: Optional[QueryEncoder] = None
+        self.lexical: Optional[LexicalIndex] = None
+        self._indexes_checked = 0.0
+        self._side = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval")
+        self.cache = RetrievalCache(persist_dir=chroma_path)
+
+        self.loaded = False
+        self.ready = False
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+
+        self._lock = threading.Lock()
+        # Index reloads: one thread swaps, readers pin the backend they use
+        self._refresh_lock = threading.Lock()
+        self._backend_lock = threading.Lock()
+        self._backend_refs: Dict[int, int] = {}
+        self._retired: Dict[int, VectorBackend] = {}
+
+    # ---------- LIFECYCLE ----------
+    def load(self, mark_ready: bool = True):
+        """
+        Load model and open the vector backend (idempotent, thread-safe).
+        A lazy load marks the runtime ready; warmup() passes mark_ready=False
+        and flips it itself once the first query has gone through.
+        """
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            t0 = time.perf_counter()
+            try:
+                if self.embedder is None:
+                    import torch
+                    from sentence_transformers import SentenceTransformer
+
+                    self.device = "cuda" if torch.cuda.is_available() else "cpu"
+                    log_event("retriever_model_loading", model=self.model_name, device=self.device)
+                    self.embedder = SentenceTransformer(self.model_name, device=self.device)
+                else:
+                    self.device = str(getattr(self.embedder, "device", "cpu"))
+
+                self.backend = self._open_backend()
+
+                self.encoder = QueryEncoder(
+                    self.embedder,
+                    max_batch_size=ENCODER_MAX_BATCH,
+                )
+
+                if HYBRID:
+                    self.lexical = LexicalIndex.open(LEXICAL_DIR)
+                    if self.lexical is None:
+                        log_event("lexical_index_missing", level=logging.WARNING,
+                                  path=str(LEXICAL_DIR), fallback="dense-only")
+                self._indexes_checked = time.monotonic()
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                raise
+            self.load_seconds = time.perf_counter() - t0
+            self.error = None
+            self.loaded = True
+            if mark_ready:
+                self.ready = True
+
+    def _open_backend(self) -> VectorBackend:
+        if self.backend_name == "chroma":
+            import chromadb
+            log_event("vector_backend_opening", backend="chroma", path=self.chroma_path)
+            client = chromadb.PersistentClient(path=self.chroma_path)
+            return ChromaBackend(client.get_collection(name=self.collection_name))
+        if self.backend_name == "numpy":
+            log_event("vector_backend_opening", backend="numpy", path=str(self.vector_dir),
+                      quant=self.vector_quant)
+            if self.vector_quant == "none":
+                backend = NumpyBackend.open(self.vector_dir)
+            else:
+                backend = QuantizedBackend.open(self.vector_dir, self.vector_quant)
+            if backend is None:
+                raise FileNotFoundError(f"No NumPy export in {self.vector_dir}; run embed.py first")
+            return backend
+        raise ValueError(f"Unknown vector backend: {self.backend_name!r} (expected 'chroma' or 'numpy')")
+
+    def warmup(self):
+        """Load, then run one encode + query end to end."""
+        self.load(mark_ready=False)
+        t0 = time.perf_counter()
+        try:
+            qvec = self.encoder.encode_batch([WARMUP_QUERY])
+            self._query(qvec, 1)
+            self._lexical_search(WARMUP_QUERY, 1)
+            if LANG_PARTITION:
+                detect_query_language(WARMUP_QUERY)   # builds the detector + loads its models
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            raise
+        self.warmup_seconds = time.perf_counter() - t0
+        self.error = None
+        self.ready = True
+        log_event("retriever_ready", load_seconds=round(self.load_seconds, 2),
+                  warmup_seconds=round(self.warmup_seconds, 3))
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "loaded": self.loaded,
+            "device": self.device,
+            "backend": self.backend_name,
+            "hybrid": self.lexical is not None,
+            "lang_partition": LANG_PARTITION,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+            "cache": self.cache.stats(),
+        }
+
+    # ---------- QUERY ----------
+    def _refresh_indexes(self):
+        """Pick up indexes rebuilt by embed.py without restarting."""
+        if time.monotonic() - self._indexes_checked <= INDEX_CHECK_SECONDS:
+            return
+        # One thread checks and reopens; the others carry on with the current indexes
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if now - self._indexes_checked <= INDEX_CHECK_SECONDS:
+                return
+            self._indexes_checked = now
+            if self.backend is not None and self.backend.changed_on_disk():
+                self._swap_backend(self._open_backend())
+            if HYBRID and (self.lexical is None or self.lexical.changed_on_disk()):
+                self.lexical = LexicalIndex.open(LEXICAL_DIR)
+        finally:
+            self._refresh_lock.release()
+
+    def _swap_backend(self, new: VectorBackend):
+        """Install `new`; the old backend is closed once its last reader lets go."""
+        with self._backend_lock:
+            old, self.backend = self.backend, new
+            if self._backend_refs.get(id(old)):
+                self._retired[id(old)] = old
+                return
+        old.close()
+
+    @contextmanager
+    def _pinned_backend(self) -> Iterator[VectorBackend]:
+        """The current vector backend, kept open until this block is done with it."""
+        with self._backend_lock:
+            backend = self.backend
+            self._backend_refs[id(backend)] = self._backend_refs.get(id(backend), 0) + 1
+        try:
+            yield backend
+        finally:
+            with self._backend_lock:
+                self._backend_refs[id(backend)] -= 1
+                if self._backend_refs[id(backend)]:
+                    return
+                del self._backend_refs[id(backend)]
+                retired = self._retired.pop(id(backend), None)
+            if retired is not None:
+                retired.close()
+
+    def _partition_for(self, query: str) -> Optional[str]:
+        """Language partition to search for this query, or None for all."""
+        if not LANG_PARTITION:
+            return None
+        lang = detect_query_language(query)
+        langs = self.backend.languages() if self.backend is not None else None
+        if lang is None or (langs is not None and lang not in langs):
+            return None
+        return lang
+
+    def _query(self, qvec: np.ndarray, k: int, lang: Optional[str] = None) -> List[Dict]:
+        self._refresh_indexes()
+        with self._pinned_backend() as backend:
+            hits = backend.query(qvec, k, lang)
+            if lang and len(hits) < k and LANG_FALLBACK == "cross":
+                # Partition too small: top up with cross-lingual hits
+                seen = {h["id"] for h in hits}
+                hits += [h for h in backend.query(qvec, k) if h["id"] not in seen][:k - len(hits)]
+        return hits
+
+    def _lexical_search(self, query: str, n: int, lang: Optional[str] = None):
+        if not HYBRID:
+            return []
+        index = self.lexical
+        if index is None:
+            return []
+        mask = index.lang_mask(lang) if lang else None
+        hits = index.search(query, n, rows=mask)
+        if mask is not None and len(hits) < n and LANG_FALLBACK == "cross":
+            seen = {i for i, _ in hits}
+            hits += [h for h in index.search(query, n) if h[0] not in seen][:n - len(hits)]
+        return hits
+
+    def _fuse(self, dense: List[Dict], lexical, k: int) -> List[Dict]:
+        """RRF-merge dense hits and (id, score) BM25 hits into k hit dicts."""
+        if not lexical:
+            return dense[:k]
+        fused = rrf_fuse([[h["id"] for h in dense], [i for i, _ in lexical]], k=RRF_K)[:k]
+        by_id = {h["id"]: h for h in dense}
+        missing = [i for i in fused if i not in by_id]
+        if missing:
+            # Lexical-only hits: fetch their text from the vector backend
+            with self._pinned_backend() as backend:
+                for hit in backend.get(missing):
+                    by_id[hit["id"]] = hit
+        return [by_id[i] for i in fused if i in by_id]
+
+    def retrieve(self, query: str, k: int = 5) -> List[Dict]:
+        """Blocking top-k retrieval, for scripts and the CLI."""
+        stamp = self.cache.stamp()
+        cached = self.cache.get(query, k)
+        if cached is not None:
+            return cached[1]
+        self.load()
+        n = k * HYBRID_DEPTH if self.lexical is not None else k
+        lang = self._partition_for(query)
+        lexical = self._side.submit(self._lexical_search, query, n, lang)
+        qvec = self.encoder.encode_batch([query.strip()])
+        hits = self._fuse(self._query(qvec, n, lang), lexical.result(), k)
+        self.cache.put(query, k, qvec[0], hits, stamp)
+        return hits
+
+    async def _dense(self, query: str, n: int, lang: Optional[str]):
+        # Batched with other in-flight queries, encoded off the event loop
+        with span("embed"):
+            qvec = await self.encoder.encode(query.strip())
+        with span("vector_query", backend=self.backend_name, n=n, lang=lang) as s:
+            hits = await asyncio.to_thread(self._query, qvec, n, lang)
+            s["hits"] = len(hits)
+        return qvec, hits
+
+    def _timed_lexical_search(self, query: str, n: int, lang: Optional[str] = None):
+        with span("lexical", n=n) as s:
+            hits = self._lexical_search(query, n, lang)
+            s["hits"] = len(hits)
+        return hits
+
+    async def aretrieve(self, query: str, k: int = 5) -> List[Dict]:
+        """Top-k retrieval for the async request path."""
+        stamp = self.cache.stamp()
+        cached = self.cache.get(query, k)
+        if cached is not None:
+            return cached[1]
+        if not self.loaded:
+            await asyncio.to_thread(self.load)
+        n = k * HYBRID_DEPTH if self.lexical is not None else k
+        # Detected once per distinct message (cached), then shared by both retrievers
+        with span("lang_detect") as s:
+            lang = await asyncio.to_thread(self._partition_for, query)
+            s["lang"] = lang
+        # Dense and lexical retrieval run concurrently
+        if self.lexical is not None:
+            lexical_task = asyncio.to_thread(self._timed_lexical_search, query, n, lang)
+        else:
+            lexical_task = asyncio.sleep(0, [])
+        (qvec, dense), lexical = await asyncio.gather(self._dense(query, n, lang), lexical_task)
+        hits = await asyncio.to_thread(self._fuse, dense, lexical, k)
+        self.cache.put(query, k, qvec[0], hits, stamp)
+        return hits
+
+
+_runtime: Optional[RetrievalRuntime] = None
+_runtime_lock = threading.Lock()
+
+def get_runtime() -> RetrievalRuntime:
+    """Shared runtime for this process (created lazily, loads nothing)."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = RetrievalRuntime()
+    return _runtime
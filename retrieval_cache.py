@@ -0,0 +1,162 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# ---------- CONFIG ----------
+MAX_ENTRIES = 2048          # (query, k) pairs kept in memory
+TTL_SECONDS = 15 * 60       # entries older than this are recomputed
+STAMP_CHECK_SECONDS = 5.0   # how often to look at the index stamp file
+STAMP_FILE = ".index_version"
+
+
+# ---------- INDEX STAMP ----------
+# embed.py touches this file whenever it changes the collection; readers
+# compare its mtime to know when cached hits have gone stale.
+
+def stamp_path(persist_dir: str) -> Path:
+    return Path(persist_dir) / STAMP_FILE
+
+
+def mark_index_changed(persist_dir: str):
+    """Record that the collection in `persist_dir` was modified."""
+    p = stamp_path(persist_dir)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(f"{time.time_ns()}\n", encoding="utf-8")
+
+
+def read_index_stamp(persist_dir: str) -> int:
+    try:
+        return stamp_path(persist_dir).stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+# ---------- KEYS ----------
+
+_ws = re.compile(r"\s+")
+
+def normalize_query(text: str) -> str:
+    """Case/whitespace-insensitive form used as the cache key."""
+    text = unicodedata.normalize("NFKC", text)
+    return _ws.sub(" ", text).strip().lower()
+
+
+# ---------- CACHE ----------
+
+class RetrievalCache:
+    """
+    Bounded LRU + TTL cache for query vectors and their Chroma hits.
+
+    Keys are (normalized query, k). Each entry holds the unit-norm float32
+    query vector and the hit list returned for it, tagged with the index
+    stamp they were computed under. The whole cache is dropped when the
+    index stamp in `persist_dir` changes, and hits computed under an older
+    stamp are not stored.
+    """
+
+    def __init__(self, persist_dir: Optional[str] = None, max_entries: int = MAX_ENTRIES,
+                 ttl_seconds: float = TTL_SECONDS, stamp_check_seconds: float = STAMP_CHECK_SECONDS):
+        self.persist_dir = persist_dir
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.stamp_check = stamp_check_seconds
+
+        self._data: "OrderedDict[Tuple[str, int], Tuple[float, int, np.ndarray, List[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = read_index_stamp(persist_dir) if persist_dir else 0
+        self._stamp_checked = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_stamp(self, force: bool = False):
+        if not self.persist_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._stamp_checked < self.stamp_check:
+            return
+        self._stamp_checked = now
+        stamp = read_index_stamp(self.persist_dir)
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._data.clear()
+            self.invalidations += 1
+
+    def stamp(self) -> int:
+        """Current index stamp; take it before computing hits and pass it to put()."""
+        with self._lock:
+            self._check_stamp()
+            return self._stamp
+
+    def get(self, query: str, k: int) -> Optional[Tuple[np.ndarray, List[Dict]]]:
+        key = (normalize_query(query), k)
+        with self._lock:
+            self._check_stamp()
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            ts, stamp, vec, hits = entry
+            if stamp != self._stamp or time.monotonic() - ts > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec, hits
+
+    def put(self, query: str, k: int, vec: np.ndarray, hits: List[Dict], stamp: Optional[int] = None):
+        """
+        Store hits computed under index `stamp` (from stamp()); skipped if the
+        index has changed since, so stale hits can't outlive an invalidation.
+        """
+        key = (normalize_query(query), k)
+        vec = np.asarray(vec, dtype=np.float32)
+        with self._lock:
+            self._check_stamp(force=True)
+            if stamp is None:
+                stamp = self._stamp
+            elif stamp != self._stamp:
+                return
+            self._data[key] = (time.monotonic(), stamp, vec, hits)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def hits_from_results(results: Dict) -> List[Dict]:
+    """Flatten a single-query Chroma result into a list of hit dicts."""
+    ids = results["ids"][0]
+    docs = results["documents"][0]
+    metas = results["metadatas"][0]
+    dists = (results.get("distances") or [[None] * len(ids)])[0]
+    return [
+        {"id": i, "document": d, "metadata": m, "distance": dist}
+        for i, d, m, dist in zip(ids, docs, metas, dists)
+    ]
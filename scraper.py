@@ -1,21 +1,41 @@
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+import os
 import csv
 import time
+import argparse
+from pathlib import Path
+from urllib.parse import urljoin
 
-BASE = "https://www.gutenberg.org"
-START_URL = f"{BASE}/ebooks/bookshelf/688"
+import requests
+from bs4 import BeautifulSoup
+
+from http_client import fetch_to_cache, make_session
+from manifest import text_digest
+
+BASE = os.getenv("PSYBOT_GUTENBERG_BASE", "") or "https://www.gutenberg.org"
+SHELF_PATH = "/ebooks/bookshelf/688"
+START_URL = f"{BASE}{SHELF_PATH}"
 LAST_BOOK_ID = 586
+CSV_FILE = "gutenberg_books.csv"
+
+# Incremental mode walks the shelf newest-first and stops at the first
+# book the CSV already has; pages are cached on disk and revalidated with
+# conditional requests, so an unchanged page costs a 304.
+PAGE_CACHE_DIR = "data/cache/bookshelf"
+NEWEST_FIRST = "?sort_order=release_date"
+POLITE_DELAY = 0.5            # seconds after a page actually downloaded
 
-UA = {"User-Agent": "Mozilla/5.0"}
+# CSV rows always point at gutenberg.org; the downloader maps them to a mirror
+TEXT_URL = "https://www.gutenberg.org/ebooks/{book_id}.txt.utf-8"
 
-def get_soup(url: str) -> BeautifulSoup:
-    r = requests.get(url, headers=UA, timeout=30)
-    r.raise_for_status()
-    return BeautifulSoup(r.text, "html.parser")
 
-def parse_bookshelf_page(soup: BeautifulSoup):
+def get_soup(url: str, session: requests.Session, cache_dir: str = PAGE_CACHE_DIR):
+    """(soup, fetch status) of a bookshelf page, through the on-disk page cache."""
+    path = Path(cache_dir) / f"{text_digest(url)}.html"
+    r = fetch_to_cache(session, url, path)
+    html = path.read_text(encoding="utf-8", errors="replace")
+    return BeautifulSoup(html, "html.parser"), r.status
+
+def parse_bookshelf_page(soup: BeautifulSoup, known_ids=None):
     rows = []
     reached_last = False
 
@@ -27,6 +47,11 @@ def parse_bookshelf_page(soup: BeautifulSoup):
         href = a["href"]                         # /ebooks/35924
         book_id = int(href.split("/")[2])
 
+        # Incremental: everything from here on is already in the CSV
+        if known_ids and book_id in known_ids:
+            reached_last = True
+            break
+
         # Title
         title_tag = li.select_one("span.title")
         title = title_tag.get_text(strip=True) if title_tag else ""
@@ -36,51 +61,94 @@ def parse_bookshelf_page(soup: BeautifulSoup):
         author = subtitle_tag.get_text(strip=True) if subtitle_tag else ""
 
         # Correct plain text link
-        text_url = f"https://www.gutenberg.org/ebooks/{book_id}.txt.utf-8"
+        text_url = TEXT_URL.format(book_id=book_id)
 
         rows.append((book_id, title, author, text_url))
 
-        if book_id == LAST_BOOK_ID:
+        if not known_ids and book_id == LAST_BOOK_ID:
             reached_last = True
 
     return rows, reached_last
 
-def find_next_page(soup: BeautifulSoup):
+def find_next_page(soup: BeautifulSoup, base: str = BASE):
     nxt = soup.find("a", string="Next")
-    return urljoin(BASE, nxt["href"]) if nxt and nxt.get("href") else None
-
-def scrape_all():
-    url = START_URL
+    return urljoin(base, nxt["href"]) if nxt and nxt.get("href") else None
+
+def scrape_all(start_url: str = START_URL, known_ids=None, session: requests.Session = None,
+               cache_dir: str = PAGE_CACHE_DIR, base: str = BASE):
+    """
+    Walk the shelf from `start_url`. With `known_ids` (incremental mode)
+    the walk stops at the first known book; otherwise at LAST_BOOK_ID or
+    the last page.
+    """
+    session = session or make_session(pool_size=1)
+    url = start_url
     out = []
     seen = set()
+    pages = 0
 
     while url:
-        print(f"Scraping: {url}")
-        soup = get_soup(url)
+        soup, status = get_soup(url, session, cache_dir)
+        pages += 1
+        print(f"Scraping: {url} ({status})")
 
-        rows, reached_last = parse_bookshelf_page(soup)
+        rows, reached_last = parse_bookshelf_page(soup, known_ids)
         for book_id, title, author, text_url in rows:
             if book_id not in seen:
                 out.append((book_id, title, author, text_url))
                 seen.add(book_id)
 
         if reached_last:
-            print(f"Reached book {LAST_BOOK_ID}. Done.")
+            print(f"Reached a known book after {pages} page(s). Done.")
             break
 
-        url = find_next_page(soup)
-        time.sleep(0.5) # Be polite
+        url = find_next_page(soup, base)
+        if url and status in ("fetched", "resumed"):
+            time.sleep(POLITE_DELAY) # Be polite
 
     out.sort(key=lambda r: r[0])
     return out
 
-def save_to_csv(rows, filename="gutenberg_books.csv"):
+def read_known_ids(filename: str = CSV_FILE):
+    if not os.path.exists(filename):
+        return set()
+    with open(filename, "r", encoding="utf-8") as f:
+        return {int(row["book_id"]) for row in csv.DictReader(f)}
+
+def save_to_csv(rows, filename=CSV_FILE):
     with open(filename, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
         w.writerow(["book_id", "title", "author", "plain_text_url"])
         w.writerows(rows)
     print(f"\nSaved CSV → {filename}")
 
+def append_to_csv(rows, filename=CSV_FILE):
+    with open(filename, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+    print(f"\nAppended {len(rows)} new book(s) → {filename}")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Scrape the Gutenberg psychology bookshelf into a CSV.")
+    ap.add_argument("--full", action="store_true",
+                    help="re-crawl the whole shelf and rewrite the CSV")
+    ap.add_argument("--csv", default=CSV_FILE)
+    ap.add_argument("--base-url", default=BASE, help="Gutenberg host or mirror (env PSYBOT_GUTENBERG_BASE)")
+    ap.add_argument("--cache-dir", default=PAGE_CACHE_DIR)
+    return ap.parse_args()
+
 if __name__ == "__main__":
-    data = scrape_all()
-    save_to_csv(data)
+    args = parse_args()
+    session = make_session(pool_size=1)
+    base = args.base_url.rstrip("/")
+    known = set() if args.full else read_known_ids(args.csv)
+
+    if known:
+        new_rows = scrape_all(f"{base}{SHELF_PATH}{NEWEST_FIRST}", known, session, args.cache_dir, base)
+        if new_rows:
+            append_to_csv(new_rows, args.csv)
+        else:
+            print("\nNo new books.")
+    else:
+        data = scrape_all(f"{base}{SHELF_PATH}", None, session, args.cache_dir, base)
+        save_to_csv(data, args.csv)
@@ -0,0 +1,279 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+# ---------- CONFIG ----------
+MAX_TURNS = 12                 # turns kept per sender (user + assistant)
+MAX_SESSION_TOKENS = 1500      # rough token budget for the kept history
+MAX_TURN_CHARS = 2000          # longer turns are clipped before storing
+MAX_SESSIONS = 10_000          # senders kept before LRU eviction
+SESSION_TTL_SECONDS = 6 * 3600 # idle sessions older than this are dropped
+
+SESSION_BACKEND = os.getenv("PSYBOT_SESSION_BACKEND", "memory")   # memory | sqlite
+SESSION_DB_PATH = os.getenv("PSYBOT_SESSION_DB", "sessions.sqlite3")
+SESSION_DB_TIMEOUT = 5.0       # seconds a worker waits for another's write lock
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough ~4 chars/token estimate: only sizes the history budget (the chunker counts real tokens)
+    return max(1, len(text) // 4)
+
+
+@dataclass(slots=True)
+class Turn:
+    role: str      # "user" | "assistant"
+    text: str
+    tokens: int
+    ts: float
+
+
+def make_turn(role: str, text: str) -> Turn:
+    text = text.strip()[:MAX_TURN_CHARS]
+    return Turn(role=role, text=text, tokens=estimate_tokens(text), ts=time.time())
+
+
+class SessionStore:
+    """Per-sender conversation history with bounded size and idle eviction."""
+
+    def __init__(self, max_turns: int = MAX_TURNS, max_tokens: int = MAX_SESSION_TOKENS,
+                 max_sessions: int = MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_sessions = max_sessions
+        self.ttl = ttl_seconds
+
+    def history(self, sender: str) -> List[Turn]:
+        raise NotImplementedError
+
+    def append(self, sender: str, role: str, text: str):
+        raise NotImplementedError
+
+    def clear(self, sender: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+# ---------- IN-MEMORY ----------
+
+class _Session:
+    __slots__ = ("turns", "tokens", "last_seen")
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.last_seen = time.monotonic()
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sessions live in an OrderedDict ordered by last access, so both LRU
+    eviction and TTL expiry only ever look at the front.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def _expire(self, now: float):
+        while self._sessions:
+            sender, sess = next(iter(self._sessions.items()))
+            if now - sess.last_seen <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[sender]
+            self.evicted += 1
+
+    def history(self, sender: str) -> List[Turn]:
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            sess = self._sessions.get(sender)
+            if sess is None:
+                return []
+            sess.last_seen = now
+            self._sessions.move_to_end(sender)
+            return list(sess.turns)
+
+    def append(self, sender: str, role: str, text: str):
+        turn = make_turn(role, text)
+        with self._lock:
+            now = time.monotonic()
+            sess = self._sessions.get(sender)
+            if sess is None:
+                sess = self._sessions[sender] = _Session(self.max_turns)
+
+            if len(sess.turns) == sess.turns.maxlen:
+                sess.tokens -= sess.turns[0].tokens   # about to fall off the ring
+            sess.turns.append(turn)
+            sess.tokens += turn.tokens
+            while len(sess.turns) > 1 and sess.tokens > self.max_tokens:
+                sess.tokens -= sess.turns.popleft().tokens
+
+            sess.last_seen = now
+            self._sessions.move_to_end(sender)
+            self._expire(now)
+
+    def clear(self, sender: str):
+        with self._lock:
+            self._sessions.pop(sender, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "turns": sum(len(s.turns) for s in self._sessions.values()),
+                "evicted": self.evicted,
+            }
+
+
+# ---------- SQLITE ----------
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Same limits, persisted in SQLite so history survives restarts and
+    can be shared by several workers on one host.
+    """
+
+    SWEEP_EVERY = 200   # appends between global TTL / LRU sweeps
+
+    def __init__(self, path: str = SESSION_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=SESSION_DB_TIMEOUT,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA busy_timeout={int(SESSION_DB_TIMEOUT * 1000)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sender    TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions(last_seen);
+            CREATE TABLE IF NOT EXISTS turns (
+                sender TEXT NOT NULL,
+                seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+                role   TEXT NOT NULL,
+                text   TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                ts     REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS turns_sender ON turns(sender, seq);
+        """)
+        self._lock = threading.Lock()
+        self._appends = 0
+        self.evicted = 0
+
+    @contextmanager
+    def _transaction(self):
+        """
+        BEGIN IMMEDIATE … COMMIT, rolled back on any error so the shared
+        connection never stays inside a failed transaction.
+        """
+        c = self._conn
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            yield c
+        except BaseException:
+            if c.in_transaction:
+                c.execute("ROLLBACK")
+            raise
+        c.execute("COMMIT")
+
+    def history(self, sender: str) -> List[Turn]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_seen FROM sessions WHERE sender = ?", (sender,)
+            ).fetchone()
+            if row is None:
+                return []
+            if now - row[0] > self.ttl:
+                with self._transaction():
+                    self._delete(sender)
+                self.evicted += 1
+                return []
+            self._conn.execute("UPDATE sessions SET last_seen = ? WHERE sender = ?", (now, sender))
+            rows = self._conn.execute(
+                "SELECT role, text, tokens, ts FROM turns WHERE sender = ? ORDER BY seq",
+                (sender,),
+            ).fetchall()
+        return [Turn(role=r, text=t, tokens=n, ts=ts) for r, t, n, ts in rows]
+
+    def append(self, sender: str, role: str, text: str):
+        turn = make_turn(role, text)
+        with self._lock, self._transaction() as c:
+            c.execute(
+                "INSERT INTO sessions(sender, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(sender) DO UPDATE SET last_seen = excluded.last_seen",
+                (sender, turn.ts),
+            )
+            c.execute(
+                "INSERT INTO turns(sender, role, text, tokens, ts) VALUES (?, ?, ?, ?, ?)",
+                (sender, turn.role, turn.text, turn.tokens, turn.ts),
+            )
+            # Keep the newest turns that fit both the turn cap and token budget
+            rows = c.execute(
+                "SELECT seq, tokens FROM turns WHERE sender = ? ORDER BY seq DESC",
+                (sender,),
+            ).fetchall()
+            keep, used = 0, 0
+            for _, tokens in rows:
+                if keep >= self.max_turns or (keep and used + tokens > self.max_tokens):
+                    break
+                keep += 1
+                used += tokens
+            if keep < len(rows):
+                c.execute("DELETE FROM turns WHERE sender = ? AND seq <= ?", (sender, rows[keep][0]))
+
+        with self._lock:
+            self._appends += 1
+            if self._appends % self.SWEEP_EVERY == 0:
+                self._sweep(time.time())
+
+    def _delete(self, sender: str):
+        self._conn.execute("DELETE FROM turns WHERE sender = ?", (sender,))
+        self._conn.execute("DELETE FROM sessions WHERE sender = ?", (sender,))
+
+    def _sweep(self, now: float):
+        with self._transaction() as c:
+            stale = [r[0] for r in c.execute(
+                "SELECT sender FROM sessions WHERE last_seen < ?", (now - self.ttl,)
+            )]
+            (count,) = c.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            overflow = count - len(stale) - self.max_sessions
+            if overflow > 0:
+                stale += [r[0] for r in c.execute(
+                    "SELECT sender FROM sessions WHERE last_seen >= ? ORDER BY last_seen LIMIT ?",
+                    (now - self.ttl, overflow),
+                )]
+            for sender in stale:
+                self._delete(sender)
+        self.evicted += len(stale)
+
+    def clear(self, sender: str):
+        with self._lock, self._transaction():
+            self._delete(sender)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (sessions,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            (turns,) = self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()
+        return {"sessions": sessions, "turns": turns, "evicted": self.evicted}
+
+
+def make_session_store(backend: Optional[str] = None) -> SessionStore:
+    backend = (backend or SESSION_BACKEND).lower()
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(SESSION_DB_PATH)
+    raise ValueError(f"Unknown session backend: {backend!r} (expected 'memory' or 'sqlite')")
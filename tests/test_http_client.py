@@ -0,0 +1,161 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import downloader_and_cleaner as dc
+from http_client import CHUNK_SIZE, fetch_to_cache, make_session, read_cache_meta
+
+# A local stand-in for gutenberg.org: one text resource with validators,
+# conditional GET, single-range requests, and switches to truncate the
+# first body or answer the first few requests with 503.
+
+# Several CHUNK_SIZE blocks, so a truncated transfer leaves whole blocks in .part
+BODY = ("The interpretation of dreams is the royal road to the unconscious.\n" * 4000).encode("utf-8")
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        srv = self.server
+        srv.requests.append(dict(self.headers))
+
+        if srv.fail_first > 0:
+            srv.fail_first -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.headers.get("If-None-Match") == ETAG or self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+
+        start = 0
+        rng = self.headers.get("Range")
+        if rng and self.headers.get("If-Range") in (ETAG, LAST_MODIFIED):
+            start = int(rng.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(BODY) - 1}/{len(BODY)}")
+        else:
+            self.send_response(200)
+        body = BODY[start:]
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+
+        if srv.truncate_first:
+            # promise the whole body, send a third of it, hang up
+            srv.truncate_first = False
+            self.wfile.write(body[:len(body) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    srv.requests = []
+    srv.fail_first = 0
+    srv.truncate_first = False
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    srv.url = f"http://127.0.0.1:{srv.server_address[1]}/ebooks/1.txt.utf-8"
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def session():
+    return make_session(pool_size=2, retries=3, backoff=0)
+
+
+def test_download_200(server, session, tmp_path):
+    path = tmp_path / "1.txt"
+    r = fetch_to_cache(session, server.url, path, backoff=0)
+    assert r.status == "fetched"
+    assert r.bytes == len(BODY)
+    assert path.read_bytes() == BODY
+    meta = read_cache_meta(path)
+    assert meta["etag"] == ETAG and meta["last_modified"] == LAST_MODIFIED
+    assert not path.with_name("1.txt.part").exists()
+
+
+def test_revalidation_304(server, session, tmp_path):
+    path = tmp_path / "1.txt"
+    fetch_to_cache(session, server.url, path, backoff=0)
+    mtime = path.stat().st_mtime_ns
+
+    r = fetch_to_cache(session, server.url, path, backoff=0)
+    assert r.status == "not_modified"
+    assert r.bytes == 0
+    assert server.requests[-1]["If-None-Match"] == ETAG
+    assert server.requests[-1]["If-Modified-Since"] == LAST_MODIFIED
+    assert path.stat().st_mtime_ns == mtime
+
+    # no revalidation: served from disk without a request
+    n = len(server.requests)
+    assert fetch_to_cache(session, server.url, path, revalidate=False).status == "cached"
+    assert len(server.requests) == n
+
+
+def test_resume_after_truncated_body(server, session, tmp_path):
+    server.truncate_first = True
+    path = tmp_path / "1.txt"
+    r = fetch_to_cache(session, server.url, path, backoff=0)
+    assert r.status == "resumed"
+    assert path.read_bytes() == BODY
+
+    first, second = server.requests[0], server.requests[1]
+    assert "Range" not in first
+    # resumes after the last complete block that reached .part
+    offset = (len(BODY) // 3) // CHUNK_SIZE * CHUNK_SIZE
+    assert offset > 0
+    assert second["Range"] == f"bytes={offset}-"
+    assert second["If-Range"] == ETAG
+    # kept blocks + resumed tail: one body's worth of bytes in total, nothing re-sent
+    assert r.bytes == len(BODY)
+
+
+def test_retry_on_503(server, session, tmp_path):
+    server.fail_first = 2
+    path = tmp_path / "1.txt"
+    r = fetch_to_cache(session, server.url, path, backoff=0)
+    assert r.status == "fetched"
+    assert len(server.requests) == 3
+    assert path.read_bytes() == BODY
+
+
+def test_retries_exhausted(server, tmp_path):
+    server.fail_first = 10
+    with pytest.raises(requests.HTTPError):
+        fetch_to_cache(make_session(pool_size=1, retries=2, backoff=0), server.url,
+                       tmp_path / "1.txt", retries=0, backoff=0)
+    assert len(server.requests) == 3       # first try + 2 retries
+    assert not (tmp_path / "1.txt").exists()
+
+
+def test_download_all_through_mirror(server, tmp_path):
+    base = server.url.split("/ebooks/")[0]
+    rows = [{"book_id": "1", "plain_text_url": "https://www.gutenberg.org/ebooks/1.txt.utf-8"}]
+
+    counts = dc.download_all(rows, str(tmp_path), base, workers=2)
+    assert counts["fetched"] == 1 and counts["failed"] == 0
+    assert dc.raw_path("1", str(tmp_path)).read_bytes() == BODY
+
+    counts = dc.download_all(rows, str(tmp_path), base, workers=2)
+    assert counts["not_modified"] == 1 and counts["bytes"] == 0
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from query_encoder import QueryEncoder
+
+# A stand-in model that takes a fixed time per forward pass and records
+# each batch it sees, plus how many passes ever overlapped.
+
+
+class SlowModel:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.batches = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def encode(self, texts, **kwargs):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.seconds)
+        with self._lock:
+            self.running -= 1
+            self.batches.append(len(texts))
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_idle_encoder_dispatches_at_once():
+    model = SlowModel(0.0)
+
+    async def main():
+        enc = QueryEncoder(model)
+        t0 = time.perf_counter()
+        vec = await enc.encode("dreams")
+        elapsed = time.perf_counter() - t0
+        await enc.close()
+        return vec, elapsed
+
+    vec, elapsed = run(main())
+    assert vec.shape == (1, 4)
+    assert model.batches == [1]
+    assert elapsed < 0.05
+
+
+def test_batches_grow_while_a_batch_is_encoding():
+    # 100 ms per pass, a query every 2 ms (500 q/s) for 0.4 s
+    model = SlowModel(0.1)
+
+    async def main():
+        enc = QueryEncoder(model, max_batch_size=32)
+
+        async def query(i):
+            await asyncio.sleep(0.002 * i)
+            return await enc.encode(f"q{i}")
+
+        t0 = time.perf_counter()
+        vecs = await asyncio.gather(*(query(i) for i in range(200)))
+        elapsed = time.perf_counter() - t0
+        await enc.close()
+        return vecs, elapsed, enc
+
+    vecs, elapsed, enc = run(main())
+    assert len(vecs) == 200 and all(v.shape == (1, 4) for v in vecs)
+    assert model.max_running == 1               # one forward pass at a time
+    assert model.batches[0] == 1                # the first query didn't wait
+    assert sum(model.batches) == 200
+    assert max(model.batches) == 32             # the queue filled a whole batch
+    assert len(model.batches) <= 10
+    assert elapsed < 1.5
+    assert enc.batches == len(model.batches) and enc.queries == 200
+
+
+def test_encode_batch_shares_the_encoder_thread():
+    model = SlowModel(0.05)
+    enc = QueryEncoder(model)
+    threads = [threading.Thread(target=enc.encode_batch, args=(["a", "b"],)) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert model.batches == [2, 2, 2]
+    assert model.max_running == 1
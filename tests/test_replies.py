@@ -0,0 +1,60 @@
+import asyncio
+
+from replies import InboundMessage, ReplyWorkerPool, StubSender
+
+# A handler that, like generate_reply, reads the sender's history before
+# a slow model call and stores the exchange after it.
+
+
+class EchoBot:
+    def __init__(self, delays):
+        self.delays = delays
+        self.history = {}
+        self.seen_history = {}
+        self.log = []
+
+    async def __call__(self, msg: InboundMessage) -> str:
+        self.seen_history[msg.body] = list(self.history.get(msg.sender, []))
+        self.log.append(("start", msg.body))
+        await asyncio.sleep(self.delays.get(msg.body, 0.0))
+        self.log.append(("end", msg.body))
+        self.history.setdefault(msg.sender, []).append(msg.body)
+        return f"re: {msg.body}"
+
+
+def run_pool(bot, messages, workers=4):
+    sender = StubSender(echo=False)
+
+    async def main():
+        pool = ReplyWorkerPool(bot, sender, workers=workers)
+        pool.start()
+        for msg in messages:
+            assert pool.submit(msg)
+        await pool.stop()
+        return pool
+
+    return asyncio.run(main()), sender
+
+
+def test_messages_from_one_sender_are_handled_in_order():
+    # the first message is slow: a free worker must not overtake it
+    bot = EchoBot({"first": 0.1})
+    pool, sender = run_pool(bot, [
+        InboundMessage("whatsapp:+1555000111", "first", sid="SM1"),
+        InboundMessage("whatsapp:+1555000111", "second", sid="SM2"),
+    ])
+
+    assert [body for _, body, _ in sender.sent] == ["re: first", "re: second"]
+    assert bot.seen_history["second"] == ["first"]
+    assert bot.log == [("start", "first"), ("end", "first"), ("start", "second"), ("end", "second")]
+    assert pool.delivered == 2 and not pool._sender_locks
+
+
+def test_other_senders_are_not_held_up():
+    bot = EchoBot({"slow": 0.1})
+    _, sender = run_pool(bot, [
+        InboundMessage("whatsapp:+1555000111", "slow", sid="SM1"),
+        InboundMessage("whatsapp:+1555000222", "quick", sid="SM2"),
+    ])
+
+    assert [body for _, body, _ in sender.sent] == ["re: quick", "re: slow"]
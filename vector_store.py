@@ -0,0 +1,379 @@
+import os
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from manifest import atomic_dir
+
+# -------------------- CONFIG --------------------
+VECTOR_DIR = Path("vector_index")   # NumPy export of the Chroma collection
+EXPORT_PAGE = 5000                   # rows fetched from Chroma per get()
+SCAN_BLOCK = 65536                   # rows scored per matmul in the exact scan
+
+# First-pass quantization for the NumPy backend: none | int8 | binary.
+# Candidates (k × RESCORE_FACTOR) are rescored against the float32 matrix,
+# which stays memory-mapped on disk; only the quantized copy is held in RAM.
+VECTOR_QUANT = os.getenv("PSYBOT_VECTOR_QUANT", "none")
+RESCORE_FACTOR = {"int8": 4, "binary": 10}
+QUANT_BLOCK = 8192                   # rows widened to float32 at a time (cache-sized)
+
+# On-disk layout of VECTOR_DIR (a symlink to the current vector_index.v<ns> build):
+#   embeddings.npy  float32[N, D]  unit-norm passage vectors (row = offset)
+#   emb_int8.npy    int8[N, D]     per-dimension scaled copy (scale in int8_scale.npy)
+#   emb_binary.npy  uint8[N, D/8]  sign bits, np.packbits along D
+#   ids.json                       vector id per row
+#   docs.jsonl                     {"document", "metadata"} per row
+#   doc_offsets.npy int64[N+1]     byte offset of each row in docs.jsonl
+#   row_lang.npy    uint8[N]       index into meta["langs"] (language partitions)
+#   meta.json                      N, D, langs, model/collection, export time
+
+
+class VectorBackend:
+    """Nearest-neighbour search over unit-norm passage vectors."""
+
+    name = "base"
+
+    def query(self, qvec: np.ndarray, k: int, lang: Optional[str] = None) -> List[Dict]:
+        """
+        Top-k hits for one query vector (shape [1, D]), best first,
+        searching only the `lang` partition when one is given.
+        """
+        raise NotImplementedError
+
+    def get(self, ids: List[str]) -> List[Dict]:
+        """Hit dicts (without distance) for the given ids, unknown ids skipped."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def languages(self) -> Optional[set]:
+        """Languages with a partition, or None if the backend can't tell cheaply."""
+        return None
+
+    def changed_on_disk(self) -> bool:
+        return False
+
+    def close(self):
+        """Release file handles; the backend is not used afterwards."""
+
+
+# -------------------- CHROMA --------------------
+
+class ChromaBackend(VectorBackend):
+    """Approximate search through Chroma's HNSW index."""
+
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, qvec: np.ndarray, k: int, lang: Optional[str] = None) -> List[Dict]:
+        from retrieval_cache import hits_from_results
+        # Partitions are the chunks' "lang" metadata; Chroma filters during search
+        results = self.collection.query(
+            query_embeddings=qvec,
+            n_results=k,
+            where={"lang": lang} if lang else None,
+            include=["documents", "metadatas", "distances"]
+        )
+        return hits_from_results(results)
+
+    def get(self, ids: List[str]) -> List[Dict]:
+        got = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return [
+            {"id": i, "document": d, "metadata": m, "distance": None}
+            for i, d, m in zip(got["ids"], got["documents"], got["metadatas"])
+        ]
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+# -------------------- NUMPY (EXACT) --------------------
+
+class NumpyBackend(VectorBackend):
+    """
+    Exact top-k by dot product over a memory-mapped float32 matrix.
+
+    Vectors are unit-norm, so dot product == cosine similarity and the
+    reported distance (1 - similarity) matches Chroma's cosine space.
+    """
+
+    name = "numpy"
+
+    def __init__(self, index_dir: Path = VECTOR_DIR):
+        # Read one version throughout: index_dir is a symlink a rebuild repoints
+        self.index_dir = Path(index_dir)
+        self.data_dir = index_dir = self.index_dir.resolve()
+        self.meta = json.loads((index_dir / "meta.json").read_text(encoding="utf-8"))
+        self.stamp = (index_dir / "meta.json").stat().st_mtime_ns
+        self.emb = np.load(index_dir / "embeddings.npy", mmap_mode="r")
+        self.ids: List[str] = json.loads((index_dir / "ids.json").read_text(encoding="utf-8"))
+        self.row_of = {i: r for r, i in enumerate(self.ids)}
+        self.offsets = np.load(index_dir / "doc_offsets.npy", mmap_mode="r")
+        self._docs = open(index_dir / "docs.jsonl", "rb")
+
+        # Row numbers of each language partition
+        self.partitions: Dict[str, np.ndarray] = {}
+        if (index_dir / "row_lang.npy").exists():
+            codes = np.load(index_dir / "row_lang.npy")
+            for c, lang in enumerate(self.meta.get("langs", [])):
+                self.partitions[lang] = np.flatnonzero(codes == c)
+
+    @classmethod
+    def open(cls, index_dir: Path = VECTOR_DIR) -> Optional["NumpyBackend"]:
+        if not (Path(index_dir) / "meta.json").exists():
+            return None
+        return cls(index_dir)
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return (self.index_dir / "meta.json").stat().st_mtime_ns != self.stamp
+        except FileNotFoundError:
+            return False
+
+    def close(self):
+        # docs.jsonl of a swapped-out export is unlinked; the open handle keeps it on disk
+        self._docs.close()
+
+    def _row(self, r: int) -> Dict:
+        lo, hi = int(self.offsets[r]), int(self.offsets[r + 1])
+        # os.pread: no shared file position, safe from several threads
+        rec = json.loads(os.pread(self._docs.fileno(), hi - lo, lo))
+        return {"id": self.ids[r], "document": rec["document"], "metadata": rec["metadata"]}
+
+    def topk(self, qvec: np.ndarray, k: int, rows: Optional[np.ndarray] = None):
+        """(row indices, similarities) of the k best rows, best first."""
+        q = np.asarray(qvec, dtype=np.float32).reshape(-1)
+        n = len(self.emb) if rows is None else len(rows)
+        k = min(k, n)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        best_rows, best_sims = [], []
+        for start in range(0, n, SCAN_BLOCK):
+            idx = None if rows is None else rows[start:start + SCAN_BLOCK]
+            block = self.emb[start:start + SCAN_BLOCK] if idx is None else self.emb[idx]
+            sims = block @ q
+            kk = min(k, len(sims))
+            top = np.argpartition(-sims, kk - 1)[:kk]
+            best_rows.append((top + start) if idx is None else idx[top])
+            best_sims.append(sims[top])
+
+        r = np.concatenate(best_rows)
+        s = np.concatenate(best_sims)
+        top = np.argpartition(-s, k - 1)[:k]
+        top = top[np.argsort(-s[top])]
+        return r[top], s[top]
+
+    def languages(self) -> Optional[set]:
+        return set(self.partitions)
+
+    def query(self, qvec: np.ndarray, k: int, lang: Optional[str] = None) -> List[Dict]:
+        rows = None
+        if lang:
+            rows = self.partitions.get(lang)
+            if rows is None:
+                return []
+        rows, sims = self.topk(qvec, k, rows)
+        hits = []
+        for r, sim in zip(rows, sims):
+            hit = self._row(int(r))
+            hit["distance"] = float(1.0 - sim)
+            hits.append(hit)
+        return hits
+
+    def get(self, ids: List[str]) -> List[Dict]:
+        hits = []
+        for i in ids:
+            r = self.row_of.get(i)
+            if r is not None:
+                hit = self._row(r)
+                hit["distance"] = None
+                hits.append(hit)
+        return hits
+
+    def count(self) -> int:
+        return len(self.ids)
+
+
+# -------------------- QUANTIZED --------------------
+
+def write_quantized(index_dir: Path, block: int = SCAN_BLOCK):
+    """
+    Derive the int8 and binary copies from embeddings.npy in `index_dir`.
+    Each file is written under a temp name and os.replace'd into place,
+    emb_int8.npy last (QuantizedBackend.open checks for it), so readers
+    never mmap a half-written array and concurrent writers don't collide.
+    """
+    index_dir = Path(index_dir)
+    emb = np.load(index_dir / "embeddings.npy", mmap_mode="r")
+    n, dim = emb.shape
+    tmp = {name: _temp_path(index_dir, name) for name in ("int8_scale.npy", "emb_binary.npy", "emb_int8.npy")}
+    try:
+        # Symmetric per-dimension scale, so each column uses the full int8 range
+        amax = np.zeros(dim, dtype=np.float32)
+        for i in range(0, n, block):
+            amax = np.maximum(amax, np.abs(emb[i:i + block]).max(axis=0))
+        scale = np.where(amax > 0, amax / 127.0, 1.0).astype(np.float32)
+        np.save(tmp["int8_scale.npy"], scale)
+
+        q8 = np.lib.format.open_memmap(tmp["emb_int8.npy"], mode="w+", dtype=np.int8, shape=(n, dim))
+        qb = np.lib.format.open_memmap(tmp["emb_binary.npy"], mode="w+", dtype=np.uint8,
+                                       shape=(n, (dim + 7) // 8))
+        for i in range(0, n, block):
+            x = np.asarray(emb[i:i + block])
+            q8[i:i + block] = np.clip(np.rint(x / scale), -127, 127).astype(np.int8)
+            qb[i:i + block] = np.packbits(x > 0, axis=1)
+        q8.flush()
+        qb.flush()
+        del q8, qb
+        for name, path in tmp.items():
+            os.replace(path, index_dir / name)
+    finally:
+        for path in tmp.values():
+            if path.exists():
+                path.unlink()
+
+def _temp_path(index_dir: Path, name: str) -> Path:
+    fd, path = tempfile.mkstemp(prefix=f".{name}.", suffix=".npy", dir=index_dir)
+    os.close(fd)
+    return Path(path)
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POP = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    def _popcount(x):
+        return _POP[x]
+
+class QuantizedBackend(NumpyBackend):
+    """
+    NumpyBackend whose first pass scans an int8 or 1-bit copy held in
+    RAM; the top k × rescore candidates are then re-ranked exactly
+    against the memory-mapped float32 rows.
+    """
+
+    def __init__(self, index_dir: Path = VECTOR_DIR, mode: str = "int8",
+                 rescore: Optional[int] = None):
+        super().__init__(index_dir)
+        if mode not in RESCORE_FACTOR:
+            raise ValueError(f"Unknown quantization: {mode!r} (expected 'int8' or 'binary')")
+        self.mode = mode
+        self.name = f"numpy-{mode}"
+        self.rescore = rescore or RESCORE_FACTOR[mode]
+        if mode == "int8":
+            self.q = np.load(self.data_dir / "emb_int8.npy")
+            self.scale = np.load(self.data_dir / "int8_scale.npy")
+        else:
+            self.q = np.load(self.data_dir / "emb_binary.npy")
+
+    @classmethod
+    def open(cls, index_dir: Path = VECTOR_DIR, mode: str = "int8") -> Optional["QuantizedBackend"]:
+        index_dir = Path(index_dir)
+        if not (index_dir / "meta.json").exists():
+            return None
+        if not (index_dir / "emb_int8.npy").exists():
+            # export predates quantization: derive the copies once, atomically
+            write_quantized(index_dir.resolve())
+        return cls(index_dir, mode)
+
+    def resident_bytes(self) -> int:
+        extra = self.scale.nbytes if self.mode == "int8" else 0
+        return int(self.q.nbytes + extra)
+
+    def _first_pass(self, q: np.ndarray, n: int, rows: Optional[np.ndarray] = None):
+        if self.mode == "int8":
+            # Fold the per-dimension scale into the query instead of the matrix
+            qs = q * self.scale
+            score = lambda block: block.astype(np.float32) @ qs
+        else:
+            qbits = np.packbits(q > 0)
+            # Fewer differing sign bits == more similar
+            score = lambda block: -_popcount(block ^ qbits).sum(axis=1, dtype=np.int32)
+
+        best_rows, best_scores = [], []
+        total = len(self.q) if rows is None else len(rows)
+        for start in range(0, total, QUANT_BLOCK):
+            if rows is None:
+                s = score(self.q[start:start + QUANT_BLOCK])
+            else:
+                idx = rows[start:start + QUANT_BLOCK]
+                s = score(self.q[idx])
+            nn = min(n, len(s))
+            top = np.argpartition(-s, nn - 1)[:nn]
+            best_rows.append(top + start if rows is None else idx[top])
+            best_scores.append(s[top])
+        r = np.concatenate(best_rows)
+        s = np.concatenate(best_scores)
+        if len(r) > n:
+            r = r[np.argpartition(-s, n - 1)[:n]]
+        return r
+
+    def topk(self, qvec: np.ndarray, k: int, rows: Optional[np.ndarray] = None):
+        q = np.asarray(qvec, dtype=np.float32).reshape(-1)
+        total = len(self.q) if rows is None else len(rows)
+        k = min(k, total)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        cand = np.sort(self._first_pass(q, min(total, k * self.rescore), rows))
+        # Exact rescoring touches only the candidate rows of the float32 file
+        sims = np.asarray(self.emb[cand]) @ q
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return cand[top], sims[top]
+
+
+# -------------------- EXPORT --------------------
+
+def export_numpy(collection, out_dir: Path = VECTOR_DIR, page: int = EXPORT_PAGE, **meta_fields) -> Dict:
+    """Dump a Chroma collection into the NumpyBackend layout (atomic swap)."""
+    t0 = time.perf_counter()
+    out_dir = Path(out_dir)
+    with atomic_dir(out_dir) as tmp_dir:
+        total = collection.count()
+        emb = None
+        ids: List[str] = []
+        offsets = [0]
+        langs: Dict[str, int] = {}
+        row_lang: List[int] = []
+        with open(tmp_dir / "docs.jsonl", "wb") as docs:
+            for start in range(0, total, page):
+                got = collection.get(
+                    limit=page, offset=start,
+                    include=["embeddings", "documents", "metadatas"],
+                )
+                vecs = np.asarray(got["embeddings"], dtype=np.float32)
+                if emb is None:
+                    dim = vecs.shape[1] if len(vecs) else 0
+                    emb = np.lib.format.open_memmap(
+                        tmp_dir / "embeddings.npy", mode="w+", dtype=np.float32, shape=(total, dim)
+                    )
+                emb[len(ids):len(ids) + len(vecs)] = vecs
+                for i, d, m in zip(got["ids"], got["documents"], got["metadatas"]):
+                    line = (json.dumps({"document": d, "metadata": m}, ensure_ascii=False) + "\n").encode("utf-8")
+                    docs.write(line)
+                    offsets.append(offsets[-1] + len(line))
+                    ids.append(i)
+                    lang = str((m or {}).get("lang") or "unknown")
+                    row_lang.append(langs.setdefault(lang, len(langs)))
+
+        if emb is None:
+            emb = np.lib.format.open_memmap(tmp_dir / "embeddings.npy", mode="w+", dtype=np.float32, shape=(0, 0))
+        emb.flush()
+        dim = int(emb.shape[1])
+        del emb
+        write_quantized(tmp_dir)
+        np.save(tmp_dir / "doc_offsets.npy", np.asarray(offsets, dtype=np.int64))
+        np.save(tmp_dir / "row_lang.npy", np.asarray(row_lang, dtype=np.uint8))
+        (tmp_dir / "ids.json").write_text(json.dumps(ids), encoding="utf-8")
+        meta = {"n": len(ids), "dim": dim, "langs": list(langs), "exported_at": time.time(), **meta_fields}
+        (tmp_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    meta["seconds"] = time.perf_counter() - t0
+    return meta